@@ -1,8 +1,28 @@
 from flask import Flask
 from config import Config
-from app.extensions import db, migrate, login_manager, csrf
+from app.extensions import db, migrate, login_manager, csrf, response_cache
 import logging
 
+
+def _configure_sqlite(engine):
+    """
+    Режим WAL и ожидание блокировки для SQLite
+
+    Несколько воркеров gunicorn и планировщик пишут в один файл БД:
+    в WAL чтение не блокируется записью, а писатель ждет освобождения
+    блокировки вместо немедленной ошибки "database is locked".
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=15000')
+        cursor.close()
+
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -17,8 +37,20 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
+    response_cache.init_app(app)
+    
+    # Счетчики записей для админ-панели обновляются событиями ORM
+    from app.services.entity_counters import register_counter_events
+    register_counter_events()
+    
+    # Число и время SQL запросов каждого запроса (заголовок Server-Timing, выборка в БД)
+    from app.services.sql_profiler import sql_profiler
+    sql_profiler.init_app(app)
     
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            _configure_sqlite(db.engine)
+        
         # Добавляем глобальную функцию для шаблонов
         @app.template_global()
         def generate_csrf_token():
@@ -1,12 +1,14 @@
-from flask_admin import Admin, AdminIndexView, expose
+from datetime import datetime, timedelta
+from flask_admin import Admin, AdminIndexView, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_login import current_user
 from flask import redirect, url_for, flash, request, abort
-from app.extensions import db
+from app.extensions import db, response_cache
 from app.models.user import User
-from app.models.setup import Setup, CampaignSetup, ThresholdEntry
-from app.models.token import FacebookToken, FacebookTokenAccount
 from app.models.conversion import Conversion
+from app.services.entity_counters import get_counters, reconcile_counters
+from app.services.leader_lock import get_lease
+from app.services.sql_profiler import get_profile_summary, get_slowest_samples, sql_profiler
 import pyotp
 import logging
 
@@ -27,18 +29,61 @@ class AdminHomeView(AdminRequiredMixin, AdminIndexView):
             'users_count': 0,
             'conversions_count': 0,
             'setups_count': 0,
-            'tokens_count': 0
+            'tokens_count': 0,
+            'reconciled_at': None
         }
         
         try:
-            stats['users_count'] = User.query.count()
-            stats['conversions_count'] = Conversion.query.count()
-            stats['setups_count'] = Setup.query.count()
-            stats['tokens_count'] = FacebookToken.query.count()
+            # Поддерживаемые счетчики вместо COUNT(*) по таблицам
+            counters = get_counters()
+            for name, counter in counters.items():
+                stats[f'{name}_count'] = counter['value']
+            reconciled = [counter['reconciled_at'] for counter in counters.values() if counter['reconciled_at']]
+            stats['reconciled_at'] = min(reconciled) if reconciled else None
         except Exception as e:
             logging.error(f"Ошибка при загрузке статистики для админ-панели: {str(e)}")
+        
+        try:
+            scheduler_lease = get_lease('scheduler')
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке аренды планировщика: {str(e)}")
+            scheduler_lease = None
             
-        return self.render('admin/index.html', stats=stats)
+        return self.render('admin/index.html', stats=stats, cache_stats=response_cache.get_stats(),
+                           scheduler_lease=scheduler_lease)
+    
+    @expose('/counters/recount', methods=['POST'])
+    def recount(self):
+        reconcile_counters()
+        flash('Счетчики пересчитаны', 'success')
+        return redirect(url_for('.index'))
+    
+    @expose('/cache/clear', methods=['POST'])
+    def clear_cache(self):
+        response_cache.clear()
+        flash('Кэш страниц очищен', 'success')
+        return redirect(url_for('.index'))
+
+# Сводка замеров SQL запросов (services/sql_profiler)
+class SQLProfileView(AdminRequiredMixin, BaseView):
+    PERIODS = (1, 24, 24 * 7)
+    
+    @expose('/')
+    def index(self):
+        hours = request.args.get('hours', 24, type=int)
+        if hours not in self.PERIODS:
+            hours = 24
+        since = datetime.utcnow() - timedelta(hours=hours)
+        
+        try:
+            summary = get_profile_summary(since)
+            slowest = get_slowest_samples(since)
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке замеров SQL: {str(e)}")
+            summary, slowest = [], []
+        
+        return self.render('admin/sql_profile.html', summary=summary, slowest=slowest,
+                           hours=hours, periods=self.PERIODS, profiler=sql_profiler)
 
 # Управление пользователями
 class UserAdmin(AdminRequiredMixin, ModelView):
@@ -81,11 +126,14 @@ class UserAdmin(AdminRequiredMixin, ModelView):
 # Управление конверсиями (только просмотр)
 class ConversionAdmin(AdminRequiredMixin, ModelView):
     column_list = ('id', 'ref', 'ref_prefix', 'form_id', 'timestamp', 'ip_address')
-    column_searchable_list = ('ref', 'ref_prefix', 'form_id', 'ip_address')
+    column_searchable_list = ('ref', 'ref_prefix', 'form_id')
     column_filters = ('ref_prefix', 'form_id', 'date')
     can_create = False
     can_edit = False
     can_delete = True
+    
+    def after_model_delete(self, model):
+        response_cache.invalidate('conversions')
 
 # Настройка админ-панели
 def init_admin(app):
@@ -112,6 +160,11 @@ def init_admin(app):
         except Exception as e:
             app.logger.error(f"Ошибка при регистрации представления Conversion: {str(e)}")
         
+        try:
+            admin.add_view(SQLProfileView(name='SQL запросы', endpoint='sql_profile', url='sql-profile'))
+        except Exception as e:
+            app.logger.error(f"Ошибка при регистрации представления SQL запросов: {str(e)}")
+        
         return admin
     except Exception as e:
         app.logger.error(f"Ошибка при инициализации админки: {str(e)}")
@@ -5,6 +5,6 @@ bp = Blueprint('auth', __name__)
 # Редирект со старой страницы настроек на управление токенами
 @bp.route('/fb_settings')
 def old_fb_settings_redirect():
-    return redirect(url_for('auth.manage_tokens'))
+    return redirect(url_for('auth.tokens'))
 
 from app.auth import routes
\ No newline at end of file
@@ -6,11 +6,14 @@ import qrcode
 import io
 import base64
 from app import db  # Используем db из app
+from app.extensions import response_cache
 from app.auth import bp  # Импортируем bp из auth
 from app.auth.forms import LoginForm, RegistrationForm, FacebookAPIForm, FacebookTokenForm, CheckTokenForm, RefreshTokenCampaignsForm, TwoFactorForm
 from app.models.user import User
 from app.models.token import FacebookToken, FacebookTokenAccount
 from app.services.token_checker import TokenChecker
+from app.services.job_queue import submit as submit_job
+from app.services.eager_loading import tokens_with_accounts
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -91,7 +94,7 @@ def register():
         db.session.add(user)
         db.session.commit()
         flash(f'Пользователь {user.username} успешно создан!')
-        return redirect(url_for('admin.users'))
+        return redirect(url_for('user.index_view'))
     
     return render_template('auth/register.html', title='Создание пользователя', form=form)
 
@@ -185,9 +188,11 @@ def facebook_api():
 @bp.route('/tokens', methods=['GET'])
 @login_required
 def tokens():
-    tokens = FacebookToken.query.filter_by(user_id=current_user.id).all()
+    tokens = tokens_with_accounts(FacebookToken.query.filter_by(user_id=current_user.id)).all()
     active_token_id = current_user.active_token_id
-    return render_template('auth/tokens.html', tokens=tokens, active_token_id=active_token_id)
+    # Шаблон использует CSRF токен форм действий и форму добавления токена
+    return render_template('auth/tokens.html', tokens=tokens, active_token_id=active_token_id,
+                           form=CheckTokenForm(), token_form=FacebookTokenForm())
 
 @bp.route('/tokens/add', methods=['GET', 'POST'])
 @login_required
@@ -209,6 +214,7 @@ def add_token():
         # Проверяем токен и получаем аккаунты
         checker = TokenChecker(token)
         checker.check_and_update_token()
+        response_cache.invalidate('tokens', current_user.id)
         
         flash('Токен успешно добавлен')
         return redirect(url_for('auth.tokens'))
@@ -233,6 +239,7 @@ def edit_token(token_id):
         # Проверяем токен и получаем аккаунты
         checker = TokenChecker(token)
         checker.check_and_update_token()
+        response_cache.invalidate('tokens', current_user.id)
         
         flash('Токен успешно обновлен')
         return redirect(url_for('auth.tokens'))
@@ -259,6 +266,7 @@ def delete_token(token_id):
     
     db.session.delete(token)
     db.session.commit()
+    response_cache.invalidate('tokens', current_user.id)
     
     flash('Токен успешно удален')
     return redirect(url_for('auth.tokens'))
@@ -279,12 +287,14 @@ def check_token(token_id):
     form = CheckTokenForm()
     
     if form.validate_on_submit():
-        checker = TokenChecker(token)
-        result = checker.check_and_update_token()
-        if result:
+        # Проверка аккаунтов токена выполняется фоновым заданием
+        job = submit_job('check_token', current_user.id, token_id=token.id)
+        if job.status == 'failed':
+            flash(f'Ошибка при проверке токена: {job.error}', 'error')
+        elif job.status == 'done':
             flash('Токен проверен и обновлен')
         else:
-            flash('Ошибка при проверке токена', 'error')
+            flash('Проверка токена запущена. Статус обновится через некоторое время')
         return redirect(url_for('auth.tokens'))
     
     return render_template('auth/check_token.html', token=token, form=form)
@@ -296,32 +306,15 @@ def refresh_token_campaigns(token_id):
     form = RefreshTokenCampaignsForm()
     
     if form.validate_on_submit():
-        from app.services.facebook_api import FacebookAPI
-        
-        try:
-            fb_api = FacebookAPI(
-                access_token=token.access_token,
-                app_id=token.app_id,
-                app_secret=token.app_secret,
-                account_id=None  # Обновим все аккаунты
-            )
-            
-            # Обновляем кампании для каждого аккаунта
-            for account in token.accounts:
-                fb_api.account_id = account.account_id
-                campaigns = fb_api.get_campaigns()
-                
-                if campaigns:
-                    # Обработка полученных кампаний
-                    # Здесь должна быть логика обработки кампаний
-                    flash(f'Успешно получено {len(campaigns)} кампаний для аккаунта {account.account_id}')
-                else:
-                    flash(f'Не удалось получить кампании для аккаунта {account.account_id}', 'error')
-                
-            return redirect(url_for('auth.tokens'))
-            
-        except Exception as e:
-            flash(f'Ошибка при обновлении кампаний: {str(e)}', 'error')
-            return redirect(url_for('auth.tokens'))
+        # Кампании аккаунтов токена сохраняются в каталог фоновым заданием
+        job = submit_job('refresh_token_campaigns', current_user.id, token_id=token.id)
+        if job.status == 'failed':
+            flash(f'Ошибка при обновлении кампаний: {job.error}', 'error')
+        elif job.status == 'done':
+            result = job.to_dict()['result']
+            flash(f"Активных кампаний: {result['campaigns']} в {result['succeeded']} из {result['accounts']} аккаунтов")
+        else:
+            flash('Обновление кампаний токена запущено. Результат появится через некоторое время')
+        return redirect(url_for('auth.tokens'))
     
     return render_template('auth/refresh_campaigns.html', token=token, form=form)
\ No newline at end of file
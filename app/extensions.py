@@ -2,10 +2,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
+from app.services.response_cache import ResponseCache
 
 # Инициализация расширений
 db = SQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
-csrf = CSRFProtect()
\ No newline at end of file
+csrf = CSRFProtect()
+response_cache = ResponseCache()
\ No newline at end of file
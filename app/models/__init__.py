@@ -1,4 +1,9 @@
 from app.models.user import User, load_user
 from app.models.setup import Setup, ThresholdEntry, CampaignSetup
 from app.models.token import FacebookToken, FacebookTokenAccount
-from app.models.conversion import Conversion
+from app.models.conversion import Conversion, UserAgent, ConversionFacet, ConversionDailyStat, ConversionHourlyStat, ConversionArchive
+from app.models.counter import EntityCounter
+from app.models.lease import LeaderLease
+from app.models.campaign import CatalogCampaign, CampaignSyncState
+from app.models.job import BackgroundJob
+from app.models.profile import SQLProfileSample
@@ -0,0 +1,67 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class CatalogCampaign(db.Model):
+    """Кампания из Facebook, полученная при обновлении списка (каталог для назначения сетапов)"""
+    __tablename__ = 'campaign_catalog'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'campaign_id', name='uq_campaign_catalog_user_campaign'),
+        # Выбор кампаний для назначения: активные кампании пользователя по имени
+        db.Index('ix_campaign_catalog_user_status_name', 'user_id', 'status', 'name'),
+        # Удаление устаревших кампаний обновленного аккаунта
+        db.Index('ix_campaign_catalog_user_account', 'user_id', 'account_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    campaign_id = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(255))
+    status = db.Column(db.String(30))
+    objective = db.Column(db.String(50))
+    account_id = db.Column(db.String(50))
+    account_name = db.Column(db.String(100))
+    token_id = db.Column(db.Integer, db.ForeignKey('facebook_tokens.id', ondelete='SET NULL'))  # Токен, которым получена кампания
+    updated_time = db.Column(db.DateTime)  # Время последнего изменения в Facebook (UTC)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def display_name(self):
+        """Название для списка выбора: имя, аккаунт и ID"""
+        if self.account_name:
+            return f"{self.name} - {self.account_name} ({self.campaign_id})"
+        return f"{self.name} ({self.campaign_id})"
+    
+    def to_dict(self):
+        return {
+            'id': self.campaign_id,
+            'name': self.name,
+            'status': self.status,
+            'objective': self.objective,
+            'account_id': self.account_id,
+            'account_name': self.account_name,
+            'token_id': self.token_id,
+            'updated_time': self.updated_time.isoformat() if self.updated_time else None,
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None
+        }
+    
+    def __repr__(self):
+        return f'<CatalogCampaign {self.campaign_id} {self.name}>'
+
+
+class CampaignSyncState(db.Model):
+    """Состояние синхронизации каталога по рекламному аккаунту пользователя"""
+    __tablename__ = 'campaign_sync_state'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'account_id', name='uq_campaign_sync_state_user_account'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    account_id = db.Column(db.String(50), nullable=False)
+    watermark = db.Column(db.DateTime)  # Наибольшее updated_time полученных кампаний (UTC)
+    synced_at = db.Column(db.DateTime)  # Последняя успешная синхронизация
+    full_synced_at = db.Column(db.DateTime)  # Последняя полная загрузка (с удалением пропавших кампаний)
+    
+    def __repr__(self):
+        return f'<CampaignSyncState {self.account_id} {self.watermark}>'
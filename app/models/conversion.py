@@ -1,6 +1,147 @@
 from datetime import datetime
+import hashlib
+import ipaddress
+import logging
+import threading
 from app.extensions import db
 
+logger = logging.getLogger(__name__)
+
+
+class UserAgent(db.Model):
+    """Справочник строк User-Agent (словарное кодирование для конверсий)"""
+    __tablename__ = 'user_agents'
+    
+    # Максимальный размер кэша строк в памяти процесса
+    CACHE_SIZE = 10000
+    
+    _ids_by_value = {}
+    _values_by_id = {}
+    _cache_lock = threading.Lock()
+    
+    id = db.Column(db.Integer, primary_key=True)
+    value_hash = db.Column(db.String(40), nullable=False, unique=True)  # SHA-1 строки
+    value = db.Column(db.Text, nullable=False)
+    
+    @staticmethod
+    def hash_value(value):
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def _remember(cls, ua_id, value):
+        with cls._cache_lock:
+            if len(cls._ids_by_value) >= cls.CACHE_SIZE:
+                cls._ids_by_value.clear()
+                cls._values_by_id.clear()
+            cls._ids_by_value[value] = ua_id
+            cls._values_by_id[ua_id] = value
+    
+    @classmethod
+    def intern(cls, value, session=None):
+        """
+        Получение ID строки User-Agent, с добавлением в справочник при необходимости
+        
+        Без session новые строки сохраняются отдельной короткой транзакцией, поэтому
+        закэшированный ID остается действительным даже при откате конверсии.
+        Если у вызывающего кода уже открыта транзакция с записью, отдельное соединение
+        ждало бы ее блокировку (в SQLite - до "database is locked"): тогда передается
+        session, и строка добавляется в ее транзакции. Такой ID кэшируется, только
+        если строка уже была в справочнике: добавленная исчезнет при откате.
+        
+        Args:
+            value (str): Строка User-Agent
+            session (Session, optional): Сессия с открытой транзакцией
+            
+        Returns:
+            int: ID записи справочника или None для пустой строки
+        """
+        if not value:
+            return None
+        
+        ua_id = cls._ids_by_value.get(value)
+        if ua_id is not None:
+            return ua_id
+        
+        if session is not None:
+            ua_id, inserted = cls._insert_or_select(session, value)
+        else:
+            with db.engine.begin() as connection:
+                ua_id, inserted = cls._insert_or_select(connection, value)
+        
+        if session is None or not inserted:
+            cls._remember(ua_id, value)
+        return ua_id
+    
+    @classmethod
+    def _insert_or_select(cls, executor, value):
+        """
+        Добавление строки в справочник, если ее нет
+        
+        Args:
+            executor: Соединение или сессия
+            value (str): Строка User-Agent
+            
+        Returns:
+            tuple: (ID записи, True если строка добавлена этим вызовом)
+        """
+        value_hash = cls.hash_value(value)
+        table = cls.__table__
+        dialect = db.engine.dialect.name
+        select_id = db.select(table.c.id).where(table.c.value_hash == value_hash)
+        
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            inserted = executor.execute(
+                insert(table).values(value_hash=value_hash, value=value)
+                .on_conflict_do_nothing(index_elements=['value_hash'])
+            ).rowcount == 1
+            return executor.execute(select_id).scalar(), inserted
+        
+        ua_id = executor.execute(select_id).scalar()
+        if ua_id is not None:
+            return ua_id, False
+        return executor.execute(
+            table.insert().values(value_hash=value_hash, value=value)
+        ).inserted_primary_key[0], True
+    
+    @classmethod
+    def lookup(cls, ua_id):
+        """Получение строки User-Agent по ID с использованием кэша"""
+        if ua_id is None:
+            return None
+        
+        value = cls._values_by_id.get(ua_id)
+        if value is None:
+            value = db.session.query(cls.value).filter(cls.id == ua_id).scalar()
+            if value is not None:
+                cls._remember(ua_id, value)
+        return value
+    
+    def __repr__(self):
+        return f'<UserAgent {self.id}>'
+
+
+def pack_ip(value):
+    """Упаковка IP адреса в 4 (IPv4) или 16 (IPv6) байт"""
+    if not value:
+        return None
+    try:
+        return ipaddress.ip_address(value.strip()).packed
+    except ValueError:
+        logger.warning(f"Некорректный IP адрес конверсии: {value}")
+        return None
+
+
+def unpack_ip(packed):
+    """Преобразование упакованного IP адреса в строку"""
+    if not packed:
+        return None
+    return str(ipaddress.ip_address(bytes(packed)))
+
+
 class Conversion(db.Model):
     """Модель для хранения данных о конверсиях"""
     __tablename__ = 'conversions'
@@ -13,9 +154,14 @@ class Conversion(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     date = db.Column(db.Date, index=True)  # Дата конверсии для группировки по дням
     
-    # Дополнительные данные о конверсии, можно добавить по необходимости
-    ip_address = db.Column(db.String(50))
-    user_agent = db.Column(db.Text)
+    # Дополнительные данные о конверсии: IP в упакованном виде, User-Agent - ссылкой на справочник
+    ip_packed = db.Column(db.LargeBinary(16))
+    user_agent_id = db.Column(db.Integer, db.ForeignKey('user_agents.id', name='fk_conversions_user_agent_id'))
+    
+    # Составной индекс для подсчета конверсий по объявлениям за период
+    __table_args__ = (
+        db.Index('ix_conversions_form_id_date', 'form_id', 'date'),
+    )
     
     def __init__(self, ref, form_id, quid=None, timestamp=None, ip_address=None, user_agent=None):
         self.ref = ref
@@ -33,6 +179,27 @@ class Conversion(db.Model):
         self.ip_address = ip_address
         self.user_agent = user_agent
     
+    @property
+    def ip_address(self):
+        return unpack_ip(self.ip_packed)
+    
+    @ip_address.setter
+    def ip_address(self, value):
+        self.ip_packed = pack_ip(value)
+    
+    @property
+    def user_agent(self):
+        return UserAgent.lookup(self.user_agent_id)
+    
+    @user_agent.setter
+    def user_agent(self, value):
+        # При открытой транзакции сессии строка справочника добавляется в ней же:
+        # отдельная транзакция ждала бы блокировку записи, которую держит сессия
+        session = db.session()
+        if not session.in_transaction():
+            session = None
+        self.user_agent_id = UserAgent.intern(value, session=session)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -46,6 +213,27 @@ class Conversion(db.Model):
             'user_agent': self.user_agent
         }
     
+    @staticmethod
+    def apply_filters(query, ref=None, ref_prefix=None, form_id=None, quid=None,
+                      start_date=None, end_date=None):
+        """Применение фильтров списка конверсий к запросу"""
+        from app.services.conversion_search import search_condition
+        
+        if ref:
+            query = query.filter(search_condition('ref', ref))
+        if ref_prefix:
+            query = query.filter(Conversion.ref_prefix == ref_prefix)
+        if form_id:
+            query = query.filter(Conversion.form_id == form_id)
+        if quid:
+            query = query.filter(search_condition('quid', quid))
+        if start_date:
+            query = query.filter(Conversion.date >= start_date)
+        if end_date:
+            query = query.filter(Conversion.date <= end_date)
+        
+        return query
+    
     @staticmethod
     def get_conversions_by_ref_prefix(ref_prefix, start_date=None, end_date=None):
         """Получение конверсий по префиксу ref"""
@@ -86,4 +274,84 @@ class Conversion(db.Model):
             return []
     
     def __repr__(self):
-        return f'<Conversion {self.id} ref={self.ref_prefix}>' 
\ No newline at end of file
+        return f'<Conversion {self.id} ref={self.ref_prefix}>'
+
+
+class ConversionFacet(db.Model):
+    """Справочник значений фильтров конверсий (ref_prefix, form_id) со счетчиками"""
+    __tablename__ = 'conversion_facets'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    facet = db.Column(db.String(20), nullable=False)  # ref_prefix или form_id
+    value = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    last_seen = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.UniqueConstraint('facet', 'value', name='uq_conversion_facets_facet_value'),
+    )
+    
+    def to_dict(self):
+        return {
+            'facet': self.facet,
+            'value': self.value,
+            'count': self.count,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+        }
+    
+    def __repr__(self):
+        return f'<ConversionFacet {self.facet}={self.value} ({self.count})>'
+
+
+class ConversionDailyStat(db.Model):
+    """Дневные агрегаты конверсий для месяцев, перенесенных в архив"""
+    __tablename__ = 'conversion_daily_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    ref_prefix = db.Column(db.String(3))
+    form_id = db.Column(db.String(50))
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('date', 'ref_prefix', 'form_id', name='uq_conversion_daily_stats_key'),
+        db.Index('ix_conversion_daily_stats_ref_prefix_date', 'ref_prefix', 'date'),
+    )
+    
+    def __repr__(self):
+        return f'<ConversionDailyStat {self.date} {self.ref_prefix}/{self.form_id}: {self.count}>'
+
+
+class ConversionHourlyStat(db.Model):
+    """Почасовые агрегаты конверсий для графиков, обновляемые при приеме"""
+    __tablename__ = 'conversion_hourly_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)  # Начало часа (UTC)
+    date = db.Column(db.Date, nullable=False)  # Дата часа для группировки по дням
+    # Пустая строка вместо NULL, чтобы уникальный ключ работал для UPSERT
+    ref_prefix = db.Column(db.String(3), nullable=False, default='')
+    form_id = db.Column(db.String(50), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('hour', 'ref_prefix', 'form_id', name='uq_conversion_hourly_stats_key'),
+        db.Index('ix_conversion_hourly_stats_ref_prefix_hour', 'ref_prefix', 'hour'),
+    )
+    
+    def __repr__(self):
+        return f'<ConversionHourlyStat {self.hour:%Y-%m-%d %H}:00 {self.ref_prefix}/{self.form_id}: {self.count}>'
+
+
+class ConversionArchive(db.Model):
+    """Месяц конверсий, свернутый в агрегаты и выгруженный в сжатый архив"""
+    __tablename__ = 'conversion_archives'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, nullable=False, unique=True)  # Первый день месяца
+    rows_count = db.Column(db.Integer, default=0)
+    file_path = db.Column(db.String(255))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ConversionArchive {self.month:%Y-%m} ({self.rows_count})>'
@@ -0,0 +1,16 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class EntityCounter(db.Model):
+    """Поддерживаемые счетчики записей для админ-панели (без COUNT(*) по таблицам)"""
+    __tablename__ = 'entity_counters'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)  # users, conversions, setups, tokens
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, default=datetime.utcnow)  # Время последнего точного пересчета
+    high_water_id = db.Column(db.BigInteger)  # Наибольший ID при пересчете (счетчики, оцениваемые по росту ID)
+    
+    def __repr__(self):
+        return f'<EntityCounter {self.name}={self.value}>'
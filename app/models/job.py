@@ -0,0 +1,47 @@
+import json
+from datetime import datetime
+from app.extensions import db
+
+
+class BackgroundJob(db.Model):
+    """Фоновое задание, поставленное из интерфейса и выполняемое потоками планировщика"""
+    __tablename__ = 'background_jobs'
+    __table_args__ = (
+        # Выбор следующего задания: самое раннее в статусе queued
+        db.Index('ix_background_jobs_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'))
+    kind = db.Column(db.String(50), nullable=False)  # refresh_campaigns, check_token, refresh_token_campaigns
+    params = db.Column(db.Text)  # JSON с параметрами обработчика
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    progress = db.Column(db.Text)  # JSON: done, total, message
+    result = db.Column(db.Text)  # JSON с итогом обработчика
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, default=0)
+    worker = db.Column(db.String(255))  # Процесс, выполняющий задание
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)  # Последний признак жизни процесса-исполнителя
+    finished_at = db.Column(db.DateTime)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': json.loads(self.progress) if self.progress else None,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.id} {self.kind} {self.status}>'
@@ -0,0 +1,17 @@
+from datetime import datetime
+from app.extensions import db
+
+
+class LeaderLease(db.Model):
+    """Аренда роли ведущего процесса (например, единственного планировщика)"""
+    __tablename__ = 'leader_leases'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)  # Имя роли: scheduler
+    holder = db.Column(db.String(255), nullable=False)  # Хост, PID и случайный суффикс владельца
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)  # Когда текущий владелец получил роль
+    renewed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # После этого роль может забрать другой процесс
+    
+    def __repr__(self):
+        return f'<LeaderLease {self.name} {self.holder}>'
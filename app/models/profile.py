@@ -0,0 +1,30 @@
+import json
+from datetime import datetime
+from app.extensions import db
+
+
+class SQLProfileSample(db.Model):
+    """Выборочный замер SQL запросов одного запроса HTTP или фонового задания"""
+    __tablename__ = 'sql_profile_samples'
+    __table_args__ = (
+        # Сводка в админ-панели и удаление старых замеров - по времени
+        db.Index('ix_sql_profile_samples_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # request, job
+    name = db.Column(db.String(100), nullable=False)  # Endpoint Flask или имя задания
+    statements = db.Column(db.Integer, nullable=False, default=0)
+    db_ms = db.Column(db.Float, nullable=False, default=0)  # Суммарное время выполнения запросов
+    duration_ms = db.Column(db.Float)  # Общее время запроса или задания
+    status = db.Column(db.Integer)  # HTTP статус ответа
+    slowest = db.Column(db.Text)  # JSON: самые медленные запросы [{'sql', 'ms'}]
+    process = db.Column(db.String(255))  # Хост и PID процесса
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def slowest_statements(self):
+        return json.loads(self.slowest) if self.slowest else []
+    
+    def __repr__(self):
+        return f'<SQLProfileSample {self.kind} {self.name} {self.statements}>'
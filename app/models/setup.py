@@ -30,6 +30,8 @@ class Setup(db.Model):
                                 cascade='all, delete-orphan')
     campaigns = db.relationship('CampaignSetup', backref='setup', lazy='dynamic',
                                cascade='all, delete-orphan')
+    # Пороги по возрастанию расхода только для чтения: загружаются вместе со списком сетапов
+    threshold_list = db.relationship('ThresholdEntry', viewonly=True, order_by='ThresholdEntry.spend')
 
     def __init__(self, name, user_id, check_interval=30, check_period='today'):
         self.name = name
@@ -45,7 +47,7 @@ class Setup(db.Model):
     def get_thresholds_as_list(self):
         return [
             {"spend": t.spend, "conversions": t.conversions} 
-            for t in self.thresholds.order_by(ThresholdEntry.spend).all()
+            for t in self.threshold_list
         ]
     
     def to_json(self):
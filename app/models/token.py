@@ -32,12 +32,17 @@ class FacebookToken(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, valid, invalid
     last_checked = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
+    failed_checks = db.Column(db.Integer, default=0)  # Неудачных проверок подряд
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Связь с аккаунтами
     accounts = db.relationship('FacebookTokenAccount', backref='token', 
                               lazy='dynamic', cascade='all, delete-orphan')
+    # Те же аккаунты списком только для чтения: загружается вместе со списком токенов
+    # (selectinload, см. services/eager_loading), в отличие от запроса accounts
+    account_list = db.relationship('FacebookTokenAccount', viewonly=True,
+                                   order_by='FacebookTokenAccount.id')
     
     def __init__(self, user_id, name, access_token, app_id=None, app_secret=None, use_proxy=False, proxy_url=None):
         self.user_id = user_id
@@ -82,10 +87,11 @@ class FacebookToken(db.Model):
         self.status = status
         self.error_message = error_message
         self.last_checked = datetime.utcnow()
+        self.failed_checks = (self.failed_checks or 0) + 1 if status == 'invalid' else 0
     
     def get_account_ids(self):
         """Возвращает список ID аккаунтов, связанных с токеном"""
-        return [account.account_id for account in self.accounts]
+        return [account.account_id for account in self.account_list]
     
     def to_dict(self):
         return {
@@ -103,7 +109,7 @@ class FacebookToken(db.Model):
                     'id': account.account_id,
                     'name': account.account_name,
                     'campaign_count': account.campaign_count
-                } for account in self.accounts
+                } for account in self.account_list
             ],
             'last_checked': self.last_checked.strftime('%Y-%m-%d %H:%M:%S') if self.last_checked else None,
             'error_message': self.error_message
@@ -1,12 +1,21 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, current_app, Response, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session, current_app, Response, abort, stream_with_context
 from flask_login import current_user, login_required
-from app.extensions import db
+from app.extensions import db, response_cache, csrf
 from app.models.user import User
 from app.models.setup import Setup, ThresholdEntry, CampaignSetup
 from app.models.token import FacebookToken
 from app.forms import SetupForm, CampaignSetupForm, CampaignRefreshForm, ThresholdForm, AddCampaignForm, ConversionFilterForm
 from app.services.fb_api_client import FacebookAdClient
-from app.services.token_checker import TokenChecker
+from app.services.campaign_catalog import save_campaigns, invalidate_catalog, get_campaign_choices, get_catalog_campaign
+from app.services.conversion_pagination import paginate_keyset, estimate_total
+from app.services.conversion_facets import get_facet_values
+from app.services.conversion_ingest import save_conversion, ingest_conversion
+from app.services.conversion_export import iter_csv, iter_parquet, parquet_available
+from app.services.conversion_retention import stats_by, daily_stats_by_ref_prefix
+from app.services.conversion_timeseries import get_timeseries, DEFAULT_TOP
+from app.services.conversion_events import stream_conversions, stream_slots, BUSY_RETRY_SECONDS
+from app.services.job_queue import submit as submit_job, get_job, stream_job
+from app.services.eager_loading import tokens_with_accounts, campaign_setups_with_setup
 from app.models.conversion import Conversion
 from app.services.facebook_api import FacebookAPI
 import json
@@ -22,6 +31,17 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint('main', __name__)
 
+# Время жизни кэша данных, зависящих от конверсий (секунды)
+CONVERSIONS_CACHE_TTL = 30
+
+# Политики кэширования данных представлений
+response_cache.policy('index', ttl=300, per_user=True, depends=('setups', 'tokens'))
+response_cache.policy('campaigns', ttl=300, per_user=True, depends=('tokens',))
+# Данные конверсий устаревают по короткому TTL: постбэки приходят непрерывно,
+# и инвалидация на каждый постбэк была бы записью в хранилище кэша на каждый запрос
+response_cache.policy('conversion_stats', ttl=CONVERSIONS_CACHE_TTL, depends=('conversions',))
+response_cache.policy('conversions_by_prefix', ttl=CONVERSIONS_CACHE_TTL, depends=('conversions',))
+
 @bp.route('/')
 @login_required
 def index():
@@ -30,21 +50,23 @@ def index():
         return redirect(url_for('auth.login'))
     
     # Получаем статистику для пользователя
-    setups_count = Setup.query.filter_by(user_id=current_user.id).count()
-    campaigns_count = CampaignSetup.query.filter_by(user_id=current_user.id).count()
+    counts = response_cache.get_or_set('index', lambda: {
+        'setups_count': Setup.query.filter_by(user_id=current_user.id).count(),
+        'campaigns_count': CampaignSetup.query.filter_by(user_id=current_user.id).count(),
+        'tokens_count': FacebookToken.query.filter_by(user_id=current_user.id).count()
+    }, user_id=current_user.id)
     
     # Получаем токены пользователя
     tokens = FacebookToken.query.filter_by(user_id=current_user.id).limit(5).all()
-    tokens_count = FacebookToken.query.filter_by(user_id=current_user.id).count()
     
     # 5 последних сетапов пользователя
     recent_setups = Setup.query.filter_by(user_id=current_user.id).order_by(Setup.updated_at.desc()).limit(5).all()
     
     return render_template('index.html', 
-                           setups_count=setups_count,
-                           campaigns_count=campaigns_count,
+                           setups_count=counts['setups_count'],
+                           campaigns_count=counts['campaigns_count'],
                            tokens=tokens,
-                           tokens_count=tokens_count,
+                           tokens_count=counts['tokens_count'],
                            recent_setups=recent_setups)
 
 @bp.route('/profile')
@@ -88,6 +110,7 @@ def create_setup():
             db.session.add(threshold)
         
         db.session.commit()
+        response_cache.invalidate('setups', current_user.id)
         flash(f'Сетап "{setup.name}" успешно создан')
         return redirect(url_for('main.setups'))
     
@@ -120,6 +143,7 @@ def edit_setup(id):
             db.session.add(threshold)
         
         db.session.commit()
+        response_cache.invalidate('setups', current_user.id)
         flash(f'Сетап "{setup.name}" успешно обновлен')
         return redirect(url_for('main.setups'))
     
@@ -151,6 +175,7 @@ def delete_setup(id):
     name = setup.name
     db.session.delete(setup)
     db.session.commit()
+    response_cache.invalidate('setups', current_user.id)
     flash(f'Сетап "{name}" удален')
     return redirect(url_for('main.setups'))
 
@@ -160,6 +185,7 @@ def toggle_setup(id):
     setup = Setup.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     setup.is_active = not setup.is_active
     db.session.commit()
+    response_cache.invalidate('setups', current_user.id)
     status = 'активирован' if setup.is_active else 'деактивирован'
     flash(f'Сетап "{setup.name}" {status}')
     return redirect(url_for('main.setups'))
@@ -173,10 +199,10 @@ def campaigns():
     has_api_configured = False
     
     # Проверка токенов
-    valid_tokens = FacebookToken.query.filter_by(
+    valid_tokens = response_cache.get_or_set('campaigns', lambda: FacebookToken.query.filter_by(
         user_id=current_user.id, 
         status='valid'
-    ).count()
+    ).count(), user_id=current_user.id)
     
     if valid_tokens > 0:
         has_api_configured = True
@@ -187,11 +213,8 @@ def campaigns():
         has_api_configured = True
         logger.info(f"Пользователь {current_user.id} использует настройки по умолчанию")
     
-    # Получение сетапов пользователя
-    setups = Setup.query.filter_by(user_id=current_user.id).all()
-    
-    # Получение назначенных кампаний
-    campaign_setups = CampaignSetup.query.filter_by(user_id=current_user.id).all()
+    # Получение назначенных кампаний (сетапы - тем же запросом)
+    campaign_setups = campaign_setups_with_setup(CampaignSetup.query.filter_by(user_id=current_user.id)).all()
     
     # Создание пустой формы для CSRF-токена
     form = CampaignRefreshForm()
@@ -209,10 +232,10 @@ def refresh_campaigns():
     logger.info(f"Пользователь {current_user.id} запустил обновление кампаний")
     
     # Получаем все действующие токены пользователя
-    valid_tokens = FacebookToken.query.filter_by(
+    valid_tokens = tokens_with_accounts(FacebookToken.query.filter_by(
         user_id=current_user.id, 
         status='valid'
-    ).all()
+    )).all()
     
     # Отладка токенов
     logger.info(f"Найдено действующих токенов: {len(valid_tokens)}")
@@ -253,7 +276,7 @@ def refresh_campaigns():
                         data = response.json()
                         campaigns_data = data.get('data', [])
                         
-                        # Создаем список кампаний для сессии
+                        # Создаем список кампаний для каталога
                         campaign_list = []
                         for campaign_data in campaigns_data:
                             # Фильтруем только активные кампании
@@ -261,11 +284,17 @@ def refresh_campaigns():
                                 campaign_list.append({
                                     'id': campaign_data.get('id'),
                                     'name': campaign_data.get('name'),
+                                    'status': campaign_data.get('status'),
+                                    'objective': campaign_data.get('objective'),
                                     'account_id': account_id,
                                     'account_name': "Основной аккаунт"
                                 })
                         
-                        session['campaigns'] = campaign_list
+                        # Устаревшие кампании аккаунта удаляются, только если получены все страницы
+                        complete = not data.get('paging', {}).get('next')
+                        save_campaigns(current_user.id, campaign_list, [account_id] if complete else [])
+                        db.session.commit()
+                        invalidate_catalog(current_user.id)
                         
                         logger.info(f"Найдено {len(campaign_list)} кампаний через основные настройки API")
                         flash(f'Список кампаний обновлен. Найдено {len(campaign_list)} кампаний')
@@ -288,17 +317,21 @@ def refresh_campaigns():
                 # Получение списка кампаний
                 campaigns = fb_client.get_campaigns('ACTIVE')
                 
-                # Сохранение списка кампаний в сессии
+                # Сохранение списка кампаний в каталоге
                 campaign_list = []
                 for campaign in campaigns:
                     if hasattr(campaign, 'id') and hasattr(campaign, 'name'):
                         campaign_list.append({
                             'id': campaign['id'],
                             'name': campaign['name'],
+                            'status': campaign.get('status'),
+                            'objective': campaign.get('objective'),
                             'account_id': account_id,
                             'account_name': "Основной аккаунт"
                         })
-                session['campaigns'] = campaign_list
+                save_campaigns(current_user.id, campaign_list, [account_id])
+                db.session.commit()
+                invalidate_catalog(current_user.id)
                 
                 logger.info(f"Найдено {len(campaign_list)} кампаний через основные настройки API")
                 flash(f'Список кампаний обновлен. Найдено {len(campaign_list)} кампаний')
@@ -310,90 +343,83 @@ def refresh_campaigns():
         else:
             logger.warning("Нет ни токенов, ни основных настроек API")
             flash('Необходимо добавить токены Facebook API или настроить учетные данные', 'error')
-            return redirect(url_for('auth.manage_tokens'))
+            return redirect(url_for('auth.tokens'))
     
-    # Инициализируем счетчики
-    total_campaigns = 0
-    success_tokens = 0
-    failed_tokens = 0
+    # Список кампаний прежних версий хранился в cookie сессии
+    session.pop('campaigns', None)
     
-    # Проходимся по всем токенам и собираем кампании
-    checker = TokenChecker()
-    all_campaigns = []
+    # Аккаунты всех токенов запрашиваются в фоновом задании: запрос не ждет Graph API
+    job = submit_job('refresh_campaigns', current_user.id)
+    result_url = url_for('main.refresh_campaigns_result', job_id=job.id)
     
-    for token in valid_tokens:
-        try:
-            logger.info(f"Запрос кампаний для токена {token.id} ({token.name})")
-            logger.info(f"Связанные аккаунты: {token.get_account_ids()}")
-            
-            campaigns_result = checker.fetch_campaigns(token)
-            
-            has_success = False
-            token_campaigns = 0
-            
-            for account_id, result in campaigns_result.items():
-                if result['success']:
-                    has_success = True
-                    token_campaigns += len(result['campaigns'])
-                    logger.info(f"Для аккаунта {account_id} найдено {len(result['campaigns'])} кампаний")
-                    
-                    # Добавляем аккаунт в имя кампании
-                    account_name = next((a.account_name for a in token.accounts if a.account_id == account_id), "Unknown")
-                    for campaign in result['campaigns']:
-                        # Проверяем, что campaign - объект и имеет нужные атрибуты
-                        if hasattr(campaign, 'id') and hasattr(campaign, 'name'):
-                            campaign_data = {
-                                'id': campaign['id'],
-                                'name': campaign['name'],
-                                'account_id': account_id,
-                                'account_name': account_name
-                            }
-                            all_campaigns.append(campaign_data)
-                        elif isinstance(campaign, dict) and 'id' in campaign and 'name' in campaign:
-                            campaign_data = {
-                                'id': campaign['id'],
-                                'name': campaign['name'],
-                                'account_id': account_id,
-                                'account_name': account_name
-                            }
-                            all_campaigns.append(campaign_data)
-                        else:
-                            logger.warning(f"Кампания имеет неожиданный формат: {type(campaign)}, {campaign}")
-                else:
-                    logger.warning(f"Ошибка получения кампаний для аккаунта {account_id}: {result['error']}")
-            
-            if has_success:
-                success_tokens += 1
-                total_campaigns += token_campaigns
-                logger.info(f"Токен {token.id} успешно получил {token_campaigns} кампаний")
-            else:
-                failed_tokens += 1
-                logger.warning(f"Токен {token.id} не смог получить кампании")
-                
-        except Exception as e:
-            failed_tokens += 1
-            logger.error(f"Ошибка обработки токена {token.id}: {str(e)}")
-            continue
-    
-    # Обновляем список кампаний в сессии
-    if all_campaigns:
-        # Преобразуем список кампаний для сессии
-        campaign_list = []
-        for campaign in all_campaigns:
-            # Проверяем, что такой кампании еще нет в списке
-            if not any(c['id'] == campaign['id'] for c in campaign_list):
-                campaign_list.append(campaign)
-        
-        session['campaigns'] = campaign_list
-        
-        logger.info(f"Всего найдено {len(campaign_list)} уникальных кампаний через {success_tokens} токенов")
-        flash(f'Список кампаний обновлен. Найдено {len(campaign_list)} кампаний через {success_tokens} токенов')
+    # Страница следит за ходом задания через поток событий и переходит к итогу
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('main.job_status', job_id=job.id),
+            'stream_url': url_for('main.job_stream', job_id=job.id),
+            'result_url': result_url
+        }), 202
+    
+    if job.is_finished:
+        return redirect(result_url)
+    
+    flash('Обновление списка кампаний запущено. Результат появится на странице через некоторое время')
+    return redirect(url_for('main.campaigns'))
+
+def _flash_refresh_summary(summary):
+    """Сообщение пользователю об итогах обновления"""
+    if summary['succeeded']:
+        message = (f"Список кампаний обновлен. Активных кампаний: {summary['campaigns']} "
+                   f"в {summary['succeeded']} из {summary['accounts']} аккаунтов, "
+                   f"изменений получено: {summary.get('changed', 0)}")
+        if summary['timed_out']:
+            message += f", не успели обновиться: {summary['timed_out']}"
+        logger.info(message)
+        flash(message)
     else:
-        logger.warning("Не удалось получить ни одной кампании")
+        logger.warning("Не удалось обновить ни одного аккаунта")
         flash('Не удалось получить кампании через имеющиеся токены', 'warning')
-    
+
+@bp.route('/campaigns/refresh/result/<int:job_id>')
+@login_required
+def refresh_campaigns_result(job_id):
+    """Итог фонового обновления (сообщение показывается после перехода)"""
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        abort(404)
+    
+    if job.status == 'failed':
+        flash(f'Ошибка при обновлении кампаний: {job.error}', 'danger')
+    elif job.status == 'done':
+        _flash_refresh_summary(job.to_dict()['result'])
+    else:
+        flash('Обновление списка кампаний еще выполняется')
     return redirect(url_for('main.campaigns'))
 
+@bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """Состояние фонового задания пользователя"""
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': 'Задание не найдено'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/jobs/<int:job_id>/stream')
+@login_required
+def job_stream(job_id):
+    """Поток Server-Sent Events с ходом фонового задания (до его завершения)"""
+    return Response(
+        stream_with_context(stream_job(job_id, current_user.id)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 @bp.route('/campaigns/assign', methods=['GET', 'POST'])
 @login_required
 def assign_campaign():
@@ -403,20 +429,8 @@ def assign_campaign():
     setups = Setup.query.filter_by(user_id=current_user.id).all()
     form.setup_id.choices = [(setup.id, setup.name) for setup in setups]
     
-    # Загрузка списка кампаний из сессии
-    campaign_choices = []
-    campaigns = session.get('campaigns', [])
-    if campaigns:
-        for c in campaigns:
-            # Добавляем информацию об аккаунте, если есть
-            if 'account_name' in c and c['account_name']:
-                display_name = f"{c['name']} - {c['account_name']} ({c['id']})"
-            else:
-                display_name = f"{c['name']} ({c['id']})"
-                
-            campaign_choices.append((c['id'], display_name))
-    
-    form.campaign_ids.choices = campaign_choices
+    # Список кампаний из каталога (заполняется при обновлении списка)
+    form.campaign_ids.choices = get_campaign_choices(current_user.id)
     
     if form.validate_on_submit():
         setup_id = form.setup_id.data
@@ -433,11 +447,8 @@ def assign_campaign():
             flash('Эта кампания уже назначена на этот сетап', 'error')
         else:
             # Получение имени кампании
-            campaign_name = None
-            for choice in campaign_choices:
-                if choice[0] == campaign_id:
-                    campaign_name = choice[1]
-                    break
+            catalog_campaign = get_catalog_campaign(current_user.id, campaign_id)
+            campaign_name = catalog_campaign.display_name if catalog_campaign else None
             
             # Создание нового назначения
             campaign_setup = CampaignSetup(
@@ -450,6 +461,7 @@ def assign_campaign():
             db.session.add(campaign_setup)
             db.session.commit()
             logger.info(f"Кампания {campaign_id} назначена на сетап {setup_id}")
+            response_cache.invalidate('setups', current_user.id)
             flash('Кампания успешно назначена на сетап')
             return redirect(url_for('main.campaigns'))
     
@@ -467,6 +479,7 @@ def delete_campaign_setup(id):
     db.session.delete(campaign_setup)
     db.session.commit()
     logger.info(f"Кампания {campaign_setup.campaign_id} откреплена от сетапа {campaign_setup.setup_id}")
+    response_cache.invalidate('setups', current_user.id)
     flash('Кампания откреплена от сетапа')
     return redirect(url_for('main.campaigns'))
 
@@ -479,6 +492,7 @@ def toggle_campaign_setup(id):
     
     campaign_setup.is_active = not campaign_setup.is_active
     db.session.commit()
+    response_cache.invalidate('setups', current_user.id)
     
     status = 'активирована' if campaign_setup.is_active else 'деактивирована'
     logger.info(f"Кампания {campaign_setup.campaign_id} {status}")
@@ -486,6 +500,7 @@ def toggle_campaign_setup(id):
     return redirect(url_for('main.campaigns'))
 
 @bp.route('/api/conversion/add', methods=['GET', 'POST'])
+@csrf.exempt  # Публичный постбэк от внешних систем, CSRF токена у них нет
 def add_conversion():
     """API для добавления конверсии через GET или POST запросы"""
     # Получаем данные из GET или POST запроса
@@ -505,8 +520,8 @@ def add_conversion():
     if not ref or not form_id:
         return jsonify({'error': 'Необходимо указать ref и formid'}), 400
     
-    # Создаем запись о конверсии
-    conversion = Conversion(
+    # Создаем запись о конверсии (вставка через Core, без объекта ORM)
+    conversion_id = ingest_conversion(
         ref=ref,
         form_id=form_id,
         quid=quid,
@@ -514,13 +529,14 @@ def add_conversion():
         user_agent=request.user_agent.string if request.user_agent else None
     )
     
-    db.session.add(conversion)
-    db.session.commit()
+    # ack=1 - только подтверждение приема, без ID и сообщения
+    if data.get('ack') in ('1', 'true', True):
+        return jsonify({'success': True}), 201
     
     # Возвращаем успешный ответ
     return jsonify({
         'success': True, 
-        'id': conversion.id,
+        'id': conversion_id,
         'message': 'Конверсия успешно сохранена'
     }), 201
 
@@ -545,41 +561,36 @@ def get_conversion_stats():
             except ValueError:
                 return jsonify({'error': 'Неверный формат даты окончания (YYYY-MM-DD)'}), 400
         
-        if ref_prefix:
-            # Статистика по конкретному префиксу
-            daily_stats = Conversion.get_daily_stats_by_ref_prefix(ref_prefix, start_date, end_date)
-            
-            result = {}
-            for date, form_id, ref, count in daily_stats:  # Обновляем распаковку, добавляя ref
-                date_str = date.strftime('%Y-%m-%d')
-                if date_str not in result:
-                    result[date_str] = {}
-                # Сохраняем count и ref в результате для каждого form_id
-                result[date_str][form_id] = {'count': count, 'ref': ref}
-            
-            return jsonify({
-                'ref_prefix': ref_prefix,
-                'stats': result
-            })
-        else:
-            # Общая статистика по всем префиксам
-            from sqlalchemy import func
-            
-            query = db.session.query(
-                Conversion.ref_prefix,
-                func.count(Conversion.id).label('count')
-            ).filter(Conversion.ref_prefix != None).group_by(Conversion.ref_prefix)
-            
-            if start_date:
-                query = query.filter(Conversion.date >= start_date)
-            if end_date:
-                query = query.filter(Conversion.date <= end_date)
+        def load_stats():
+            if ref_prefix:
+                # Статистика по конкретному префиксу (в архивных днях ref = None)
+                daily_stats = daily_stats_by_ref_prefix(ref_prefix, start_date or None, end_date or None)
+                
+                result = {}
+                for date, form_id, ref, count in daily_stats:  # Обновляем распаковку, добавляя ref
+                    date_str = date.strftime('%Y-%m-%d')
+                    if date_str not in result:
+                        result[date_str] = {}
+                    # Сохраняем count и ref в результате для каждого form_id
+                    result[date_str][form_id] = {'count': count, 'ref': ref}
                 
-            stats = query.all()
+                return {
+                    'ref_prefix': ref_prefix,
+                    'stats': result
+                }
             
-            return jsonify({
+            # Общая статистика по всем префиксам (с учетом архивных месяцев)
+            stats = stats_by(('ref_prefix',), start_date=start_date or None, end_date=end_date or None)
+            
+            return {
                 'stats': {prefix: count for prefix, count in stats if prefix}
-            })
+            }
+        
+        return jsonify(response_cache.get_or_set('conversion_stats', load_stats, params={
+            'ref_prefix': ref_prefix,
+            'start_date': start_date,
+            'end_date': end_date
+        }))
     except Exception as e:
         logger.error(f"Ошибка при получении статистики конверсий: {str(e)}")
         return jsonify({
@@ -592,9 +603,8 @@ def get_conversion_stats():
 def conversions_page():
     """Страница с аналитикой конверсий"""
     try:
-        # Получаем уникальные ref_prefix
-        ref_prefixes = db.session.query(Conversion.ref_prefix).distinct().all()
-        ref_prefixes = [r[0] for r in ref_prefixes if r[0]]
+        # Получаем уникальные ref_prefix из справочника фильтров
+        ref_prefixes = get_facet_values('ref_prefix')
         
         return render_template('conversions.html', 
                               title='Конверсии', 
@@ -610,8 +620,9 @@ def conversions_list():
     """Страница со списком всех конверсий и фильтрацией"""
     try:
         # Получаем параметры для фильтрации и пагинации
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+        after = request.args.get('after', '')
+        before = request.args.get('before', '')
         ref = request.args.get('ref', '')
         ref_prefix = request.args.get('ref_prefix', '')
         form_id = request.args.get('form_id', '')
@@ -620,54 +631,47 @@ def conversions_list():
         end_date = request.args.get('end_date', '')
         date_range = request.args.get('dateRange', '')
         
-        # Строим запрос с фильтрами
-        query = Conversion.query
-        
-        if ref:
-            query = query.filter(Conversion.ref.like(f'%{ref}%'))
-        
-        if ref_prefix:
-            query = query.filter(Conversion.ref_prefix == ref_prefix)
-        
-        if form_id:
-            query = query.filter(Conversion.form_id == form_id)
-        
-        if quid:
-            query = query.filter(Conversion.quid.like(f'%{quid}%'))
+        start_date_obj = None
+        end_date_obj = None
         
         if start_date:
             try:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-                query = query.filter(Conversion.date >= start_date_obj)
             except ValueError:
                 flash('Неверный формат даты начала', 'warning')
         
         if end_date:
             try:
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                query = query.filter(Conversion.date <= end_date_obj)
             except ValueError:
                 flash('Неверный формат даты окончания', 'warning')
         
-        # Сортировка по времени (сначала новые)
-        query = query.order_by(Conversion.timestamp.desc())
+        # Строим запрос с фильтрами
+        query = Conversion.apply_filters(
+            Conversion.query,
+            ref=ref,
+            ref_prefix=ref_prefix,
+            form_id=form_id,
+            quid=quid,
+            start_date=start_date_obj,
+            end_date=end_date_obj
+        )
         
-        # Получаем данные с пагинацией
+        # Получаем данные с курсорной пагинацией (сначала новые)
         try:
-            conversions = query.paginate(page=page, per_page=per_page)
-        except Exception as e:
-            # Обработка ошибки пагинации - возвращаем первую страницу
+            conversions = paginate_keyset(query, per_page=per_page, after=after, before=before)
+        except ValueError as e:
+            # Поврежденный курсор - возвращаем первую страницу
             logger.error(f"Ошибка при пагинации конверсий: {str(e)}")
-            conversions = query.paginate(page=1, per_page=per_page)
+            conversions = paginate_keyset(query, per_page=per_page)
             flash('Произошла ошибка при пагинации, показана первая страница', 'warning')
         
-        # Обеспечиваем ненулевые значения для шаблонизатора
-        if conversions.pages == 0:
-            conversions.pages = 1
+        # Общее количество страница загружает отдельно (api_conversions_list с with_total),
+        # чтобы оценка не задерживала каждую загрузку списка
         
-        # Получаем уникальные значения для фильтров
-        unique_prefixes = db.session.query(Conversion.ref_prefix).distinct().all()
-        unique_form_ids = db.session.query(Conversion.form_id).distinct().all()
+        # Получаем уникальные значения для фильтров из справочника
+        unique_prefixes = get_facet_values('ref_prefix')
+        unique_form_ids = get_facet_values('form_id')
         
         return render_template('conversions_list.html',
                               title='Список конверсий',
@@ -679,8 +683,8 @@ def conversions_list():
                               start_date=start_date,
                               end_date=end_date,
                               date_range=date_range,  # Передаем выбранный период в шаблон
-                              unique_prefixes=[p[0] for p in unique_prefixes if p[0]],
-                              unique_form_ids=[f[0] for f in unique_form_ids if f[0]])
+                              unique_prefixes=unique_prefixes,
+                              unique_form_ids=unique_form_ids)
     except Exception as e:
         logger.error(f"Ошибка при отображении списка конверсий: {str(e)}")
         flash(f'Произошла ошибка при загрузке списка конверсий', 'danger')
@@ -689,10 +693,12 @@ def conversions_list():
 @bp.route('/api/conversions/list', methods=['GET'])
 @login_required
 def api_conversions_list():
-    """API для получения списка конверсий с пагинацией и фильтрацией"""
+    """API для получения списка конверсий с курсорной пагинацией и фильтрацией"""
     # Получаем параметры
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    after = request.args.get('after', '')
+    before = request.args.get('before', '')
+    with_total = request.args.get('with_total', '') in ('1', 'true')
     ref = request.args.get('ref', '')
     ref_prefix = request.args.get('ref_prefix', '')
     form_id = request.args.get('form_id', '')
@@ -700,51 +706,206 @@ def api_conversions_list():
     start_date = request.args.get('start_date', '')
     end_date = request.args.get('end_date', '')
     
+    start_date_obj = None
+    end_date_obj = None
+    
+    if start_date:
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Неверный формат даты начала'}), 400
+    
+    if end_date:
+        try:
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Неверный формат даты окончания'}), 400
+    
     # Строим запрос с фильтрами
-    query = Conversion.query
+    query = Conversion.apply_filters(
+        Conversion.query,
+        ref=ref,
+        ref_prefix=ref_prefix,
+        form_id=form_id,
+        quid=quid,
+        start_date=start_date_obj,
+        end_date=end_date_obj
+    )
+    
+    # Получаем данные с курсорной пагинацией (сначала новые)
+    try:
+        page = paginate_keyset(query, per_page=per_page, after=after, before=before)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Формируем результат
+    result = {
+        'items': [conversion.to_dict() for conversion in page.items],
+        'per_page': page.per_page,
+        'has_next': page.has_next,
+        'has_prev': page.has_prev,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+    
+    # Оценка общего количества только по запросу
+    if with_total:
+        total, total_exact = estimate_total(query)
+        result['total'] = total
+        result['total_exact'] = total_exact
     
-    if ref:
-        query = query.filter(Conversion.ref.like(f'%{ref}%'))
+    return jsonify(result)
+
+@bp.route('/api/conversions/export', methods=['GET'])
+@login_required
+def export_conversions():
+    """Потоковая выгрузка конверсий в CSV или Parquet с фильтрами списка"""
+    export_format = request.args.get('format', 'csv')
+    ref = request.args.get('ref', '')
+    ref_prefix = request.args.get('ref_prefix', '')
+    form_id = request.args.get('form_id', '')
+    quid = request.args.get('quid', '')
+    start_date = request.args.get('start_date', '')
+    end_date = request.args.get('end_date', '')
     
-    if ref_prefix:
-        query = query.filter(Conversion.ref_prefix == ref_prefix)
+    if export_format not in ('csv', 'parquet'):
+        return jsonify({'error': 'Поддерживаются форматы csv и parquet'}), 400
     
-    if form_id:
-        query = query.filter(Conversion.form_id == form_id)
+    if export_format == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Выгрузка в Parquet недоступна: не установлен pyarrow'}), 400
     
-    if quid:
-        query = query.filter(Conversion.quid.like(f'%{quid}%'))
+    start_date_obj = None
+    end_date_obj = None
     
     if start_date:
         try:
             start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Conversion.date >= start_date_obj)
         except ValueError:
             return jsonify({'error': 'Неверный формат даты начала'}), 400
     
     if end_date:
         try:
             end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Conversion.date <= end_date_obj)
         except ValueError:
             return jsonify({'error': 'Неверный формат даты окончания'}), 400
     
-    # Сортировка по времени (сначала новые)
-    query = query.order_by(Conversion.timestamp.desc())
+    query = Conversion.apply_filters(
+        Conversion.query,
+        ref=ref,
+        ref_prefix=ref_prefix,
+        form_id=form_id,
+        quid=quid,
+        start_date=start_date_obj,
+        end_date=end_date_obj
+    )
     
-    # Получаем данные с пагинацией
-    pagination = query.paginate(page=page, per_page=per_page)
+    filename = f"conversions_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
     
-    # Формируем результат
-    result = {
-        'items': [conversion.to_dict() for conversion in pagination.items],
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'page': pagination.page,
-        'per_page': pagination.per_page
-    }
+    if export_format == 'parquet':
+        body = iter_parquet(query)
+        mimetype = 'application/vnd.apache.parquet'
+    else:
+        body = iter_csv(query)
+        mimetype = 'text/csv; charset=utf-8'
     
-    return jsonify(result)
+    logger.info(f"Пользователь {current_user.id} запустил выгрузку конверсий ({export_format})")
+    
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/api/conversions/timeseries', methods=['GET'])
+@login_required
+def conversions_timeseries():
+    """Ряды конверсий по интервалам (час/день/неделя) для графиков"""
+    ref_prefix = request.args.get('ref_prefix', '')
+    bucket = request.args.get('bucket', 'day')
+    start_date = request.args.get('start_date', '')
+    end_date = request.args.get('end_date', '')
+    top = request.args.get('top', DEFAULT_TOP, type=int)
+    
+    start_date_obj = None
+    end_date_obj = None
+    
+    if start_date:
+        try:
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Неверный формат даты начала'}), 400
+    
+    if end_date:
+        try:
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Неверный формат даты окончания'}), 400
+    
+    try:
+        result = get_timeseries(
+            ref_prefix=ref_prefix or None,
+            start_date=start_date_obj,
+            end_date=end_date_obj,
+            bucket=bucket,
+            top=top
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # ETag по содержимому: повторный запрос с If-None-Match получает 304 без тела
+    response = current_app.response_class(
+        json.dumps(result, separators=(',', ':')),
+        mimetype='application/json'
+    )
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
+
+@bp.route('/api/conversions/stream', methods=['GET'])
+@login_required
+def conversions_stream():
+    """Поток Server-Sent Events с новыми конверсиями (фильтры ref_prefix и form_id)"""
+    ref_prefix = request.args.get('ref_prefix', '')
+    form_id = request.args.get('form_id', '')
+    
+    # Браузер передает ID последнего события при переподключении
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({'error': 'Неверный Last-Event-ID'}), 400
+    else:
+        last_event_id = None
+    
+    # Все места для потоков в процессе заняты: клиент переподключится позже,
+    # а потоки gunicorn остаются для постбэков
+    if not stream_slots.acquire(current_app.config['CONVERSION_STREAMS_PER_WORKER']):
+        return Response(
+            f"retry: {BUSY_RETRY_SECONDS * 1000}\n\n",
+            status=503,
+            mimetype='text/event-stream',
+            headers={'Retry-After': str(BUSY_RETRY_SECONDS), 'Cache-Control': 'no-cache'}
+        )
+    
+    body = stream_conversions(
+        last_event_id=last_event_id,
+        ref_prefix=ref_prefix or None,
+        form_id=form_id or None
+    )
+    
+    response = Response(
+        stream_with_context(body),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Место освобождается при закрытии ответа сервером, даже если поток не начался
+    response.call_on_close(stream_slots.release)
+    return response
 
 @bp.route('/add-test-conversion', methods=['GET'])
 @login_required
@@ -764,7 +925,7 @@ def add_test_conversion():
         quid = f"quid_{random.randint(10000, 99999)}"
         
         # Создаем конверсию
-        conversion = Conversion(
+        conversion = save_conversion(
             ref=ref,
             form_id=form_id,
             quid=quid,
@@ -772,9 +933,6 @@ def add_test_conversion():
             user_agent=request.user_agent.string if request.user_agent else None
         )
         
-        db.session.add(conversion)
-        db.session.commit()
-        
         flash(f'Тестовая конверсия успешно добавлена (ID: {conversion.id}, префикс: {conversion.ref_prefix})', 'success')
     except Exception as e:
         logger.error(f"Ошибка при добавлении тестовой конверсии: {str(e)}")
@@ -787,7 +945,7 @@ def add_test_conversion():
 def api_test_conversion():
     """Добавляет тестовую конверсию для проверки функциональности API"""
     # Создаем тестовую запись о конверсии
-    conversion = Conversion(
+    conversion = save_conversion(
         ref='test123',
         form_id='test_form_id',
         quid='test_quid',
@@ -795,9 +953,6 @@ def api_test_conversion():
         user_agent=request.user_agent.string if request.user_agent else None
     )
     
-    db.session.add(conversion)
-    db.session.commit()
-    
     return jsonify({
         'success': True, 
         'id': conversion.id,
@@ -828,46 +983,22 @@ def conversions_by_prefix(ref_prefix):
             except ValueError:
                 flash('Неверный формат даты окончания', 'warning')
         
-        # Формируем базовый запрос для статистики
-        from sqlalchemy import func
-        
-        # Получаем суммарную статистику по form_id
-        summary_query = db.session.query(
-            Conversion.form_id,
-            func.count(Conversion.id).label('count')
-        ).filter(Conversion.ref_prefix == ref_prefix)
-        
-        if start_date_obj:
-            summary_query = summary_query.filter(Conversion.date >= start_date_obj)
-        if end_date_obj:
-            summary_query = summary_query.filter(Conversion.date <= end_date_obj)
-            
-        summary_data = summary_query.group_by(Conversion.form_id).order_by(func.count(Conversion.id).desc()).all()
+        # Получаем суммарную статистику по form_id (с учетом архивных месяцев)
+        summary_data = response_cache.get_or_set(
+            'conversions_by_prefix',
+            lambda: sorted(stats_by(('form_id',), ref_prefix, start_date_obj, end_date_obj),
+                           key=lambda row: row[1], reverse=True),
+            params={'ref_prefix': ref_prefix, 'start_date': start_date_obj, 'end_date': end_date_obj}
+        )
         
         # Общее количество конверсий
         total_conversions = sum(count for _, count in summary_data)
         
-        # Подготовка данных для графиков
+        # Подготовка данных для графика распределения;
+        # динамика загружается отдельно через /api/conversions/timeseries
         form_ids = [form_id for form_id, _ in summary_data]
         counts = [count for _, count in summary_data]
         
-        # Получаем статистику по дням
-        daily_query = db.session.query(
-            Conversion.date,
-            func.count(Conversion.id).label('count')
-        ).filter(Conversion.ref_prefix == ref_prefix)
-        
-        if start_date_obj:
-            daily_query = daily_query.filter(Conversion.date >= start_date_obj)
-        if end_date_obj:
-            daily_query = daily_query.filter(Conversion.date <= end_date_obj)
-            
-        daily_data = daily_query.group_by(Conversion.date).order_by(Conversion.date).all()
-        
-        # Подготовка данных для графика по дням
-        dates = [date.strftime('%d.%m.%Y') for date, _ in daily_data]
-        daily_counts = [count for _, count in daily_data]
-        
         return render_template('conversions_by_prefix.html',
                             title=f'Конверсии по префиксу {ref_prefix}',
                             ref_prefix=ref_prefix,
@@ -875,9 +1006,6 @@ def conversions_by_prefix(ref_prefix):
                             total_conversions=total_conversions,
                             form_ids=form_ids,
                             counts=counts,
-                            daily_data=daily_data,
-                            dates=dates,
-                            daily_counts=daily_counts,
                             start_date=start_date,
                             end_date=end_date)
     except Exception as e:
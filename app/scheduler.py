@@ -6,6 +6,8 @@ from app.models.setup import Setup, CampaignSetup
 from app.models.user import User
 from app.services.facebook_api import FacebookAPI
 from app.models.facebook_token import FacebookToken
+from app.services.fb_api_client import FacebookAdClient
+from app.services.conversion_counter import ConversionCounter
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -46,7 +48,7 @@ def calculate_date_range_for_period(check_period):
     
     return since_date, until_date
 
-def check_campaign_thresholds(campaign_id=None, check_period=None):
+def check_campaign_thresholds(campaign_id=None, check_period=None, conversion_counter=None):
     """
     Проверяет пороги кампаний и отключает кампании, если они превышены.
     
@@ -54,6 +56,8 @@ def check_campaign_thresholds(campaign_id=None, check_period=None):
         campaign_id (str, optional): ID кампании для проверки. По умолчанию проверяются все кампании.
         check_period (str, optional): Период проверки ('today', 'last2days', 'last3days', 'last7days', 'alltime').
             По умолчанию используется период из настройки кампании.
+        conversion_counter (ConversionCounter, optional): Источник локальных конверсий.
+            По умолчанию создается ConversionCounter.
     
     Returns:
         bool: True если все проверки выполнены успешно, иначе False
@@ -77,6 +81,9 @@ def check_campaign_thresholds(campaign_id=None, check_period=None):
         if not campaign_setups:
             logger.info("Нет активных настроек кампаний для проверки")
             return True
+        
+        if conversion_counter is None:
+            conversion_counter = ConversionCounter()
             
         # Обработка каждой кампании
         for campaign_setup in campaign_setups:
@@ -139,8 +146,13 @@ def check_campaign_thresholds(campaign_id=None, check_period=None):
                 # Получаем расходы
                 spend = float(campaign_stats.get('spend', 0))
                 
-                # Получаем количество конверсий
-                conversion_count = 0  # Здесь нужно добавить логику получения конверсий
+                # Получаем количество конверсий по всем объявлениям кампании (form_id = ID объявления)
+                ads = FacebookAdClient(token_obj=token).get_ads_in_campaign(campaign_setup.campaign_id)
+                conversion_count = conversion_counter.count_for_campaign(
+                    [ad['id'] for ad in ads],
+                    datetime.strptime(since_date, '%Y-%m-%d').date(),
+                    datetime.strptime(until_date, '%Y-%m-%d').date()
+                )
                 
                 # Обновляем время последней проверки
                 campaign_setup.last_checked = datetime.utcnow()
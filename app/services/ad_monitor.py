@@ -3,14 +3,17 @@ import pandas as pd
 from datetime import datetime
 
 class AdMonitor:
-    def __init__(self, fb_client):
+    def __init__(self, fb_client, conversion_counter=None):
         """
         Инициализация монитора объявлений
         
         Args:
             fb_client (FacebookAdClient): Клиент для работы с FB API
+            conversion_counter (ConversionCounter, optional): Источник локальных конверсий.
+                Если не указан, конверсии берутся из insights FB
         """
         self.fb_client = fb_client
+        self.conversion_counter = conversion_counter
         self.logger = self._setup_logger()
         self.thresholds = []
         
@@ -63,13 +66,15 @@ class AdMonitor:
         max_threshold = applicable_thresholds.loc[applicable_thresholds['spend'].idxmax()]
         return max_threshold['conversions']
     
-    def check_ad_performance(self, ad_id, date_preset='today'):
+    def check_ad_performance(self, ad_id, date_preset='today', conversions=None):
         """
         Проверка производительности объявления и принятие решения
         
         Args:
             ad_id (str): ID объявления
             date_preset (str): Период времени
+            conversions (int, optional): Количество конверсий из локальной базы.
+                Если не указано, используются конверсии из insights FB
             
         Returns:
             dict: Результат проверки с решением
@@ -78,7 +83,7 @@ class AdMonitor:
         ad_data = self.fb_client.get_ad_insights(ad_id, date_preset)
         
         spend = ad_data['spend']
-        actual_conversions = ad_data['conversions']
+        actual_conversions = ad_data['conversions'] if conversions is None else conversions
         
         # Определение требуемого количества конверсий
         required_conversions = self.get_threshold_conversions(spend)
@@ -118,9 +123,27 @@ class AdMonitor:
         # Получение всех объявлений в кампании
         ads = self.fb_client.get_ads_in_campaign(campaign_id)
         
+        # Конверсии по всем объявлениям кампании получаем одним запросом
+        # за те же дни, что и расход: в часовом поясе рекламного аккаунта.
+        # Ошибка подсчета прерывает проверку кампании, объявления не отключаются
+        conversion_counts = None
+        if self.conversion_counter is not None:
+            from app.services.conversion_counter import date_range_for_preset
+            timezone_name = self.fb_client.get_account_timezone()
+            if timezone_name is None:
+                self.logger.warning(
+                    f"Часовой пояс аккаунта кампании {campaign_id} неизвестен, "
+                    f"конверсии считаются по дням UTC"
+                )
+            since_date, until_date = date_range_for_preset(date_preset, timezone_name)
+            conversion_counts = self.conversion_counter.count_by_ad(
+                [ad['id'] for ad in ads], since_date, until_date, timezone_name
+            )
+        
         results = []
         for ad in ads:
-            result = self.check_ad_performance(ad['id'], date_preset)
+            conversions = conversion_counts.get(str(ad['id']), 0) if conversion_counts is not None else None
+            result = self.check_ad_performance(ad['id'], date_preset, conversions)
             
             # Отключение объявления при необходимости
             if auto_disable and result['should_disable']:
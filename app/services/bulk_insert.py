@@ -0,0 +1,81 @@
+import io
+import logging
+from datetime import date, datetime
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк передается в COPY одним буфером (ограничивает память)
+COPY_CHUNK_SIZE = 10000
+
+
+def _copy_value(value):
+    """Значение в текстовом формате COPY (NULL - \\N, спецсимволы экранируются)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea в hex формате; обратная косая черта в COPY удваивается
+        return '\\\\x' + bytes(value).hex()
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def _copy_rows(table, rows, columns):
+    """Вставка через COPY FROM STDIN в транзакции текущей сессии (psycopg2)"""
+    preparer = db.engine.dialect.identifier_preparer
+    statement = (
+        f"COPY {preparer.format_table(table)} "
+        f"({', '.join(preparer.quote(name) for name in columns)}) FROM STDIN"
+    )
+
+    dbapi_connection = db.session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        for offset in range(0, len(rows), COPY_CHUNK_SIZE):
+            buffer = io.StringIO()
+            for row in rows[offset:offset + COPY_CHUNK_SIZE]:
+                buffer.write('\t'.join(_copy_value(row.get(name)) for name in columns))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+
+
+def bulk_insert(model, rows, columns=None):
+    """
+    Массовая вставка строк в текущей транзакции сессии
+
+    Для PostgreSQL (psycopg2) используется COPY, для остальных СУБД -
+    одна INSERT с executemany. Значения по умолчанию из модели не
+    подставляются, события ORM не вызываются, поэтому счетчики записей
+    (adjust_counter) и производные данные обновляет вызывающий код.
+
+    Args:
+        model: Модель или таблица SQLAlchemy
+        rows (list): Список словарей со значениями столбцов
+        columns (list, optional): Вставляемые столбцы (по умолчанию - ключи первой строки)
+
+    Returns:
+        int: Количество вставленных строк
+    """
+    if not rows:
+        return 0
+
+    table = getattr(model, '__table__', model)
+    rows = list(rows)
+    columns = list(columns or rows[0].keys())
+
+    dialect = db.engine.dialect
+    if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+        _copy_rows(table, rows, columns)
+    else:
+        db.session.execute(table.insert(), [{name: row.get(name) for name in columns} for row in rows])
+
+    return len(rows)
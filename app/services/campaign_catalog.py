@@ -0,0 +1,255 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, text
+from app.extensions import db, response_cache
+from app.models.campaign import CatalogCampaign, CampaignSyncState
+from app.models.token import FacebookToken, FacebookTokenAccount
+
+logger = logging.getLogger(__name__)
+
+# Обновляемые при повторном получении кампании столбцы
+CATALOG_COLUMNS = ('name', 'status', 'objective', 'account_id', 'account_name', 'token_id', 'updated_time', 'fetched_at')
+
+# Полная загрузка аккаунта (с удалением пропавших кампаний) не реже этого срока
+FULL_SYNC_INTERVAL = timedelta(hours=24)
+# Запас при запросе изменений: кампании, измененные около отметки, запрашиваются повторно
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# Список выбора кампаний зависит только от каталога пользователя
+response_cache.policy('campaign_choices', ttl=300, per_user=True, depends=('campaign_catalog',))
+
+# Подготовленные запросы UPSERT по диалектам БД
+_upsert_statements = {}
+
+
+def _upsert_statement():
+    """UPSERT каталога для SQLite и PostgreSQL (один раз на диалект, как в conversion_facets)"""
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return None
+
+    statement = _upsert_statements.get(dialect)
+    if statement is None:
+        table = CatalogCampaign.__table__
+        columns = ('user_id', 'campaign_id') + CATALOG_COLUMNS
+        statement = text(
+            f"INSERT INTO {table.name} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + name for name in columns)}) "
+            f"ON CONFLICT (user_id, campaign_id) DO UPDATE SET "
+            + ', '.join(f"{name} = excluded.{name}" for name in CATALOG_COLUMNS)
+        ).bindparams(*[bindparam(name, type_=table.c[name].type) for name in columns])
+        _upsert_statements[dialect] = statement
+    return statement
+
+
+def save_campaigns(user_id, campaigns, refreshed_accounts=(), fetched_at=None):
+    """
+    Запись результатов обновления в каталог (в текущей транзакции)
+
+    Кампании добавляются или обновляются по (user_id, campaign_id),
+    кампании в статусе DELETED удаляются. Для аккаунтов, список
+    которых получен полностью, удаляются кампании, которых не было
+    в ответе; аккаунты с ошибкой, не успевшие к сроку или обновленные
+    только изменениями сохраняют прежний список.
+
+    Args:
+        user_id (int): ID пользователя
+        campaigns (list): Словари кампаний (id, name, status, objective, updated_time, account_id, account_name, token_id)
+        refreshed_accounts (iterable): Аккаунты, список кампаний которых получен полностью
+        fetched_at (datetime, optional): Время обновления
+
+    Returns:
+        int: Количество записанных кампаний
+    """
+    fetched_at = fetched_at or datetime.utcnow()
+    deleted = [str(campaign['id']) for campaign in campaigns if campaign.get('status') == 'DELETED']
+    rows = [
+        {
+            'user_id': user_id,
+            'campaign_id': str(campaign['id']),
+            'name': campaign.get('name'),
+            'status': campaign.get('status'),
+            'objective': campaign.get('objective'),
+            'account_id': campaign.get('account_id'),
+            'account_name': campaign.get('account_name'),
+            'token_id': campaign.get('token_id'),
+            'updated_time': campaign.get('updated_time'),
+            'fetched_at': fetched_at
+        }
+        for campaign in campaigns
+        if campaign.get('status') != 'DELETED'
+    ]
+
+    table = CatalogCampaign.__table__
+    if deleted:
+        db.session.execute(
+            table.delete()
+            .where(table.c.user_id == user_id)
+            .where(table.c.campaign_id.in_(deleted))
+        )
+
+    if rows:
+        statement = _upsert_statement()
+        if statement is not None:
+            db.session.execute(statement, rows)
+        else:
+            # Для остальных СУБД - удаление прежних записей и вставка
+            db.session.execute(
+                table.delete()
+                .where(table.c.user_id == user_id)
+                .where(table.c.campaign_id.in_([row['campaign_id'] for row in rows]))
+            )
+            db.session.execute(table.insert(), rows)
+
+    refreshed_accounts = list(refreshed_accounts)
+    if refreshed_accounts:
+        db.session.execute(
+            table.delete()
+            .where(table.c.user_id == user_id)
+            .where(table.c.account_id.in_(refreshed_accounts))
+            .where(table.c.fetched_at < fetched_at)
+        )
+
+    return len(rows)
+
+
+def plan_sync(user_id, tasks, now=None, full=False):
+    """
+    Выбор способа загрузки для задач обновления (AccountTask)
+
+    Аккаунт, полностью загруженный не ранее FULL_SYNC_INTERVAL назад,
+    запрашивается только изменениями после отметки (наибольшее
+    updated_time из каталога) с запасом WATERMARK_OVERLAP; остальные -
+    полностью. Состояния читаются одним запросом.
+
+    Args:
+        user_id (int): ID пользователя
+        tasks (list): Объекты AccountTask (since заполняется на месте)
+        now (datetime, optional): Текущее время
+        full (bool): Загрузить все аккаунты полностью
+
+    Returns:
+        list: Те же задачи
+    """
+    now = now or datetime.utcnow()
+    states = {
+        state.account_id: state
+        for state in CampaignSyncState.query.filter_by(user_id=user_id).all()
+    }
+
+    for task in tasks:
+        state = states.get(task.account_id)
+        task.since = None
+        if full or state is None or state.full_synced_at is None:
+            continue
+        if now - state.full_synced_at >= FULL_SYNC_INTERVAL:
+            continue
+        # Аккаунт без кампаний: изменения после последней полной загрузки
+        task.since = (state.watermark or state.full_synced_at) - WATERMARK_OVERLAP
+
+    return tasks
+
+
+def update_campaign_counts(user_id, account_ids):
+    """
+    Количество активных кампаний аккаунтов по каталогу в связях токенов (без commit)
+
+    Args:
+        user_id (int): ID пользователя
+        account_ids (iterable): Аккаунты с префиксом act_
+
+    Returns:
+        dict: account_id -> количество активных кампаний
+    """
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+
+    counts = dict.fromkeys(account_ids, 0)
+    rows = (db.session.query(CatalogCampaign.account_id, db.func.count(CatalogCampaign.id))
+            .filter(CatalogCampaign.user_id == user_id)
+            .filter(CatalogCampaign.status == 'ACTIVE')
+            .filter(CatalogCampaign.account_id.in_(account_ids))
+            .group_by(CatalogCampaign.account_id)
+            .all())
+    counts.update(rows)
+
+    # В связях токенов ID аккаунта может быть записан без префикса act_
+    stored_ids = account_ids + [account_id[len('act_'):] for account_id in account_ids]
+    links = (FacebookTokenAccount.query
+             .join(FacebookToken, FacebookToken.id == FacebookTokenAccount.token_id)
+             .filter(FacebookToken.user_id == user_id)
+             .filter(FacebookTokenAccount.account_id.in_(stored_ids))
+             .all())
+    now = datetime.utcnow()
+    for link in links:
+        account_id = link.account_id if link.account_id.startswith('act_') else f'act_{link.account_id}'
+        link.campaign_count = counts[account_id]
+        link.last_checked = now
+
+    return counts
+
+
+def apply_refresh(user_id, refresh, fetched_at=None):
+    """
+    Запись результата CampaignRefresh в каталог (в текущей транзакции)
+
+    Сохраняет полученные кампании, отметки синхронизации аккаунтов
+    и количество активных кампаний в связях токенов.
+
+    Args:
+        user_id (int): ID пользователя
+        refresh (CampaignRefresh): Выполненное обновление
+        fetched_at (datetime, optional): Время обновления
+
+    Returns:
+        dict: Итог обновления (summary) и количество активных кампаний обновленных аккаунтов
+    """
+    fetched_at = fetched_at or datetime.utcnow()
+    save_campaigns(user_id, refresh.campaigns, refresh.refreshed_accounts, fetched_at)
+
+    synced = refresh.synced_accounts
+    states = {
+        state.account_id: state
+        for state in CampaignSyncState.query.filter_by(user_id=user_id).all()
+    }
+    for account_id, (full, watermark) in synced.items():
+        state = states.get(account_id)
+        if state is None:
+            state = CampaignSyncState(user_id=user_id, account_id=account_id)
+            db.session.add(state)
+        if watermark and (state.watermark is None or watermark > state.watermark):
+            state.watermark = watermark
+        state.synced_at = fetched_at
+        if full:
+            state.full_synced_at = fetched_at
+
+    counts = update_campaign_counts(user_id, synced)
+    return dict(refresh.summary(), campaigns=sum(counts.values()))
+
+
+def invalidate_catalog(user_id):
+    """Сброс кэша списка выбора после изменения каталога (после commit)"""
+    response_cache.invalidate('campaign_catalog', user_id)
+
+
+def get_campaign_choices(user_id):
+    """
+    Активные кампании пользователя для списка выбора
+
+    Returns:
+        list: Пары (campaign_id, отображаемое имя), по имени
+    """
+    def load():
+        campaigns = (CatalogCampaign.query
+                     .filter_by(user_id=user_id, status='ACTIVE')
+                     .order_by(CatalogCampaign.name, CatalogCampaign.campaign_id)
+                     .all())
+        return [(campaign.campaign_id, campaign.display_name) for campaign in campaigns]
+
+    return [tuple(choice) for choice in response_cache.get_or_set('campaign_choices', load, user_id=user_id)]
+
+
+def get_catalog_campaign(user_id, campaign_id):
+    """Кампания из каталога пользователя или None"""
+    return CatalogCampaign.query.filter_by(user_id=user_id, campaign_id=campaign_id).first()
@@ -0,0 +1,321 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from flask import current_app
+from app.extensions import db
+from app.models.token import FacebookTokenAccount
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_URL = 'https://graph.facebook.com/v18.0'
+CAMPAIGN_FIELDS = 'id,name,status,objective,updated_time'
+CAMPAIGN_PAGE_SIZE = 100
+# По умолчанию Graph API не возвращает удаленные и архивные кампании - без них
+# инкрементальная синхронизация не узнает об удалении
+CAMPAIGN_STATUSES = json.dumps(['ACTIVE', 'PAUSED', 'DELETED', 'ARCHIVED', 'IN_PROCESS', 'WITH_ISSUES'])
+
+# Одновременных запросов к Graph API за одно обновление
+REFRESH_MAX_WORKERS = 8
+# Таймаут одного запроса (не больше остатка общего срока)
+REQUEST_TIMEOUT = 30
+
+
+class AccountTask:
+    """Получение кампаний одного аккаунта; токены - в порядке попыток"""
+
+    def __init__(self, account_id, account_name, tokens, since=None):
+        self.account_id = account_id
+        self.account_name = account_name
+        # Снимки токенов (id, name, access_token, proxy_url): потоки не обращаются к ORM
+        self.tokens = tokens
+        # Запрашиваются только кампании, измененные после since (None - полная загрузка)
+        self.since = since
+        self.attempt = 0
+        self.errors = []
+
+    @property
+    def token(self):
+        return self.tokens[self.attempt]
+
+
+def build_tasks(tokens):
+    """
+    Задачи обновления: по одной на аккаунт, даже если к нему есть доступ у нескольких токенов
+
+    Аккаунт запрашивается первым токеном, остальные используются
+    при ошибке. Связи с аккаунтами читаются одним запросом.
+
+    Args:
+        tokens (list): Валидные токены пользователя
+
+    Returns:
+        list: Объекты AccountTask
+    """
+    snapshots = {
+        token.id: (token.id, token.name, token.access_token, token.proxy_url if token.use_proxy else None)
+        for token in tokens
+    }
+    if not snapshots:
+        return []
+
+    links = (FacebookTokenAccount.query
+             .filter(FacebookTokenAccount.token_id.in_(list(snapshots)))
+             .filter(db.or_(FacebookTokenAccount.is_active == True, FacebookTokenAccount.is_active.is_(None)))
+             .order_by(FacebookTokenAccount.id)
+             .all())
+
+    tasks = {}
+    for link in links:
+        account_id = link.account_id if link.account_id.startswith('act_') else f'act_{link.account_id}'
+        task = tasks.get(account_id)
+        if task is None:
+            task = tasks[account_id] = AccountTask(account_id, link.account_name, [])
+        elif not task.account_name and link.account_name:
+            task.account_name = link.account_name
+        task.tokens.append(snapshots[link.token_id])
+
+    return list(tasks.values())
+
+
+def parse_updated_time(value):
+    """Время Graph API (2024-01-31T12:00:00+0000) в naive UTC или None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def fetch_account_campaigns(token, account_id, deadline, since=None):
+    """
+    Кампании аккаунта во всех статусах с постраничной загрузкой
+
+    Args:
+        token (tuple): Снимок токена (id, name, access_token, proxy_url)
+        account_id (str): ID аккаунта с префиксом act_
+        deadline (float): Момент time.monotonic(), после которого запросы не выполняются
+        since (datetime, optional): Только кампании с updated_time позже этого момента (UTC)
+
+    Returns:
+        list: Словари кампаний (id, name, status, objective, updated_time)
+    """
+    _, _, access_token, proxy_url = token
+    proxies = {'http': proxy_url, 'https': proxy_url} if proxy_url else None
+
+    campaigns = []
+    url = f'{GRAPH_API_URL}/{account_id}/campaigns'
+    params = {
+        'access_token': access_token,
+        'fields': CAMPAIGN_FIELDS,
+        'effective_status': CAMPAIGN_STATUSES,
+        'limit': CAMPAIGN_PAGE_SIZE
+    }
+    if since is not None:
+        timestamp = int(since.replace(tzinfo=timezone.utc).timestamp())
+        params['filtering'] = json.dumps([{'field': 'updated_time', 'operator': 'GREATER_THAN', 'value': timestamp}])
+
+    with requests.Session() as session:
+        while url:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Истек срок обновления")
+
+            response = session.get(url, params=params, proxies=proxies, timeout=min(REQUEST_TIMEOUT, remaining))
+            if response.status_code != 200:
+                try:
+                    error = response.json().get('error', {})
+                    message = f"код {error.get('code')}: {error.get('message')}"
+                except ValueError:
+                    message = f"HTTP {response.status_code}"
+                raise RuntimeError(f"Ошибка Facebook API ({message})")
+
+            data = response.json()
+            for campaign in data.get('data', []):
+                campaigns.append({
+                    'id': campaign.get('id'),
+                    'name': campaign.get('name'),
+                    'status': campaign.get('status'),
+                    'objective': campaign.get('objective'),
+                    'updated_time': parse_updated_time(campaign.get('updated_time'))
+                })
+
+            # Ссылка на следующую страницу уже содержит все параметры
+            url = data.get('paging', {}).get('next')
+            params = None
+
+    return campaigns
+
+
+class CampaignRefresh:
+    """
+    Параллельное обновление кампаний по всем аккаунтам токенов пользователя
+
+    Для аккаунта с заданным since запрашиваются только измененные кампании.
+    Аккаунты запрашиваются одновременно (не более max_workers запросов),
+    при ошибке аккаунт повторяется со следующим токеном, у которого к нему
+    есть доступ. После срока deadline_seconds ожидание прекращается и
+    возвращаются уже полученные результаты. Потоки выполняют только
+    HTTP запросы; результат записывает в каталог campaign_catalog.apply_refresh.
+    """
+
+    def __init__(self, tasks, deadline_seconds=None, max_workers=REFRESH_MAX_WORKERS):
+        if deadline_seconds is None:
+            deadline_seconds = current_app.config.get('CAMPAIGN_REFRESH_DEADLINE', 45)
+        self.tasks = tasks
+        self.deadline_seconds = deadline_seconds
+        self.max_workers = max_workers
+        # account_id -> {'success', 'full', 'campaigns', 'error', 'token_id', 'account_name', 'watermark'}
+        self.results = {}
+        self.timed_out = []
+        # Кампании успешно обновленных аккаунтов по ID: пополняется по мере завершения аккаунтов
+        self._merged = {}
+
+    def run(self):
+        """
+        Выполнение обновления с событиями о ходе
+
+        Yields:
+            dict: Событие по завершении каждого аккаунта (type='account')
+        """
+        total = len(self.tasks)
+        if not total:
+            return
+
+        deadline = time.monotonic() + self.deadline_seconds
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, total))
+        pending = {}
+
+        def submit(task):
+            future = executor.submit(fetch_account_campaigns, task.token, task.account_id, deadline, task.since)
+            pending[future] = task
+
+        try:
+            for task in self.tasks:
+                submit(task)
+
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    task = pending.pop(future)
+                    token_id, token_name = task.token[0], task.token[1]
+                    try:
+                        campaigns = future.result()
+                    except Exception as e:
+                        task.errors.append(f"{token_name}: {str(e)}")
+                        logger.warning(f"Ошибка получения кампаний аккаунта {task.account_id} токеном {token_id}: {str(e)}")
+                        # Повтор с другим токеном, у которого есть доступ к аккаунту
+                        if task.attempt + 1 < len(task.tokens) and time.monotonic() < deadline:
+                            task.attempt += 1
+                            submit(task)
+                            continue
+                        self.results[task.account_id] = {
+                            'success': False, 'full': task.since is None, 'campaigns': [], 'error': '; '.join(task.errors),
+                            'token_id': token_id, 'account_name': task.account_name
+                        }
+                    else:
+                        self.results[task.account_id] = {
+                            'success': True, 'full': task.since is None, 'campaigns': campaigns, 'error': None,
+                            'token_id': token_id, 'account_name': task.account_name,
+                            'watermark': self._merge(task.account_id, task.account_name, token_id, campaigns)
+                        }
+
+                    result = self.results[task.account_id]
+                    yield {
+                        'type': 'account',
+                        'done': len(self.results),
+                        'total': total,
+                        'account_id': task.account_id,
+                        'account_name': task.account_name,
+                        'success': result['success'],
+                        'count': len(result['campaigns']),
+                        'error': result['error']
+                    }
+        finally:
+            # Незавершенные к сроку запросы не ждем: их результаты отбрасываются
+            self.timed_out = [task.account_id for task in pending.values()]
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self.timed_out:
+                logger.warning(f"Не успели обновиться к сроку аккаунты: {', '.join(self.timed_out)}")
+
+    def _merge(self, account_id, account_name, token_id, campaigns):
+        """
+        Добавление кампаний аккаунта к общему списку за один проход
+
+        Повторно полученная кампания (тот же ID) не заменяет первую.
+
+        Returns:
+            datetime: Наибольшее updated_time кампаний аккаунта или None
+        """
+        account_name = account_name or 'Unknown'
+        merged = self._merged
+        watermark = None
+        for campaign in campaigns:
+            updated_time = campaign['updated_time']
+            if updated_time and (watermark is None or updated_time > watermark):
+                watermark = updated_time
+            if campaign['id'] not in merged:
+                merged[campaign['id']] = {
+                    'id': campaign['id'],
+                    'name': campaign['name'],
+                    'status': campaign['status'],
+                    'objective': campaign['objective'],
+                    'updated_time': updated_time,
+                    'account_id': account_id,
+                    'account_name': account_name,
+                    'token_id': token_id
+                }
+        return watermark
+
+    def run_all(self):
+        """Выполнение обновления без событий"""
+        for _ in self.run():
+            pass
+        return self
+
+    @property
+    def campaigns(self):
+        """Полученные (новые и измененные) кампании всех успешно обновленных аккаунтов без повторов"""
+        return list(self._merged.values())
+
+    @property
+    def refreshed_accounts(self):
+        """Аккаунты, полный список кампаний которых получен (пропавшие кампании удаляются)"""
+        return [account_id for account_id, result in self.results.items() if result['success'] and result['full']]
+
+    @property
+    def synced_accounts(self):
+        """
+        Успешно обновленные аккаунты
+
+        Returns:
+            dict: account_id -> (полная загрузка, наибольшее updated_time полученных кампаний)
+        """
+        return {
+            account_id: (result['full'], result['watermark'])
+            for account_id, result in self.results.items()
+            if result['success']
+        }
+
+    def summary(self):
+        """
+        Итог обновления
+
+        Returns:
+            dict: Количество аккаунтов (всего, успешно, с ошибкой, не успевших) и полученных кампаний
+        """
+        return {
+            'accounts': len(self.tasks),
+            'succeeded': sum(1 for result in self.results.values() if result['success']),
+            'failed': sum(1 for result in self.results.values() if not result['success']),
+            'timed_out': len(self.timed_out),
+            'changed': len(self._merged)
+        }
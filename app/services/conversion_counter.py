@@ -0,0 +1,176 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import func
+from app.extensions import db
+from app.models.conversion import Conversion
+
+logger = logging.getLogger(__name__)
+
+
+def account_zone(timezone_name):
+    """
+    Часовой пояс рекламного аккаунта
+
+    Args:
+        timezone_name (str): Имя пояса из поля timezone_name аккаунта ('America/Los_Angeles')
+
+    Returns:
+        tzinfo: Пояс аккаунта или UTC, если имя не указано или неизвестно
+    """
+    if not timezone_name:
+        return timezone.utc
+    try:
+        return ZoneInfo(timezone_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Неизвестный часовой пояс аккаунта {timezone_name}, используется UTC")
+        return timezone.utc
+
+
+def date_range_for_preset(date_preset, timezone_name=None):
+    """
+    Преобразует date_preset Facebook в диапазон дат для локальных конверсий
+
+    Facebook считает расход за date_preset по дням в часовом поясе рекламного
+    аккаунта, поэтому и "сегодня" определяется в этом поясе. Границы дней
+    переводятся в UTC при подсчете (см. ConversionCounter.count_by_ad).
+
+    Args:
+        date_preset (str): Период ('today', 'yesterday', 'last_3d', 'last_7d', 'last_7_days', ...)
+        timezone_name (str, optional): Часовой пояс аккаунта (по умолчанию UTC)
+
+    Returns:
+        tuple: (since_date, until_date) в виде объектов date в поясе аккаунта
+    """
+    today = datetime.now(account_zone(timezone_name)).date()
+
+    if date_preset == 'yesterday':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+
+    days_by_preset = {
+        'today': 1,
+        'last_3d': 3,
+        'last_7d': 7,
+        'last_7_days': 7,
+        'last_14d': 14,
+        'last_30d': 30,
+        'last_90d': 90,
+    }
+    days = days_by_preset.get(date_preset)
+    if days is None:
+        logger.warning(f"Неизвестный период {date_preset}, используется 'today'")
+        days = 1
+
+    return today - timedelta(days=days - 1), today
+
+
+def _utc_midnight(day, zone):
+    """Начало дня day в поясе zone как наивное время UTC (как Conversion.timestamp)"""
+    local_midnight = datetime.combine(day, datetime.min.time(), tzinfo=zone)
+    return local_midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ConversionCounter:
+    """
+    Подсчет локальных конверсий по объявлениям (form_id = ID объявления FB)
+
+    Все методы выполняют один агрегирующий запрос, который использует
+    составной индекс ix_conversions_form_id_date.
+    """
+
+    def __init__(self):
+        self.logger = logger
+
+    def count_by_ad(self, ad_ids, since_date=None, until_date=None, timezone_name=None):
+        """
+        Получение количества конверсий для каждого объявления за период
+
+        Ошибка БД не перехватывается: нулевые счетчики вместо нее привели бы
+        к отключению объявлений, у которых конверсии есть.
+
+        Args:
+            ad_ids (list): Список ID объявлений
+            since_date (date, optional): Начальная дата (включительно)
+            until_date (date, optional): Конечная дата (включительно)
+            timezone_name (str, optional): Часовой пояс аккаунта, в котором заданы даты.
+                Без него даты сравниваются с датами конверсий в UTC
+
+        Returns:
+            dict: {ad_id: количество конверсий}, для объявлений без конверсий - 0
+        """
+        ad_ids = [str(ad_id) for ad_id in ad_ids if ad_id]
+        counts = {ad_id: 0 for ad_id in ad_ids}
+
+        if not ad_ids:
+            return counts
+
+        query = db.session.query(
+            Conversion.form_id,
+            func.count(Conversion.id)
+        ).filter(Conversion.form_id.in_(ad_ids))
+
+        zone = account_zone(timezone_name)
+        if zone is timezone.utc:
+            if since_date:
+                query = query.filter(Conversion.date >= since_date)
+            if until_date:
+                query = query.filter(Conversion.date <= until_date)
+        else:
+            # Границы дней аккаунта в UTC: фильтр по дате отсекает строки по индексу,
+            # точная граница - по времени конверсии
+            if since_date:
+                since = _utc_midnight(since_date, zone)
+                query = query.filter(Conversion.date >= since.date(), Conversion.timestamp >= since)
+            if until_date:
+                until = _utc_midnight(until_date + timedelta(days=1), zone)
+                query = query.filter(Conversion.date <= until.date(), Conversion.timestamp < until)
+
+        for form_id, count in query.group_by(Conversion.form_id).all():
+            counts[form_id] = count
+
+        return counts
+
+    def count_by_campaign(self, campaign_ads, since_date=None, until_date=None, timezone_name=None):
+        """
+        Получение количества конверсий для нескольких кампаний одним запросом
+
+        Args:
+            campaign_ads (dict): {campaign_id: [ad_id, ...]}
+            since_date (date, optional): Начальная дата (включительно)
+            until_date (date, optional): Конечная дата (включительно)
+            timezone_name (str, optional): Часовой пояс аккаунта (см. count_by_ad)
+
+        Returns:
+            dict: {campaign_id: {'total': int, 'ads': {ad_id: int}}}
+        """
+        all_ad_ids = set()
+        for ad_ids in campaign_ads.values():
+            all_ad_ids.update(str(ad_id) for ad_id in ad_ids if ad_id)
+
+        ad_counts = self.count_by_ad(all_ad_ids, since_date, until_date, timezone_name)
+
+        result = {}
+        for campaign_id, ad_ids in campaign_ads.items():
+            ads = {str(ad_id): ad_counts.get(str(ad_id), 0) for ad_id in ad_ids if ad_id}
+            result[campaign_id] = {
+                'total': sum(ads.values()),
+                'ads': ads
+            }
+
+        return result
+
+    def count_for_campaign(self, ad_ids, since_date=None, until_date=None, timezone_name=None):
+        """
+        Получение суммарного количества конверсий по объявлениям кампании
+
+        Args:
+            ad_ids (list): Список ID объявлений кампании
+            since_date (date, optional): Начальная дата (включительно)
+            until_date (date, optional): Конечная дата (включительно)
+            timezone_name (str, optional): Часовой пояс аккаунта (см. count_by_ad)
+
+        Returns:
+            int: Количество конверсий
+        """
+        return sum(self.count_by_ad(ad_ids, since_date, until_date, timezone_name).values())
@@ -0,0 +1,279 @@
+import json
+import logging
+import queue
+import threading
+import time
+from app.extensions import db
+from app.models.conversion import Conversion
+
+logger = logging.getLogger(__name__)
+
+# Максимальное число событий в очереди одного подписчика
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Сколько конверсий досылается клиенту при переподключении
+RESUME_LIMIT = 500
+
+# Интервал служебного комментария, удерживающего соединение (секунды)
+KEEPALIVE_SECONDS = 15
+
+# Интервал проверки новых конверсий в БД, если событий в процессе нет
+# (конверсии могли быть приняты другим воркером)
+POLL_SECONDS = 5
+
+# Максимальная длительность одного соединения (после нее браузер переподключается)
+STREAM_LIFETIME_SECONDS = 30 * 60
+
+# Пауза до повторного подключения, если все места для потоков заняты (секунды)
+BUSY_RETRY_SECONDS = 30
+
+# Сколько проверка БД перечитывает уже пройденные ID (секунды). В PostgreSQL
+# ID из последовательности фиксируются не по порядку: конверсия с меньшим ID
+# может появиться после большего, и строгое "id > последний отправленный"
+# пропустило бы ее навсегда
+LOOKBACK_SECONDS = 30
+
+
+class _Subscriber:
+    """Подписчик на новые конверсии с фильтром по ref_prefix и form_id"""
+
+    def __init__(self, ref_prefix=None, form_id=None):
+        self.ref_prefix = ref_prefix
+        self.form_id = form_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def matches(self, event):
+        if self.ref_prefix and event.get('ref_prefix') != self.ref_prefix:
+            return False
+        if self.form_id and event.get('form_id') != self.form_id:
+            return False
+        return True
+
+
+class ConversionBroker:
+    """Публикация принятых конверсий подписчикам внутри процесса"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, ref_prefix=None, form_id=None):
+        subscriber = _Subscriber(ref_prefix, form_id)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event):
+        """
+        Передача конверсии всем подходящим подписчикам без ожидания
+
+        Args:
+            event (dict): Данные конверсии (Conversion.to_dict)
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            if not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                # Медленный клиент: соединение закрывается, при переподключении
+                # пропущенное досылается из БД по Last-Event-ID
+                subscriber.overflowed = True
+
+    def subscribers_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+broker = ConversionBroker()
+
+
+class StreamSlots:
+    """
+    Ограничение числа открытых потоков в процессе
+
+    Поток SSE занимает поток gunicorn на все время соединения; без
+    ограничения открытые страницы конверсий занимают все потоки воркера,
+    и постбэки ждут в очереди.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self, limit):
+        """
+        Args:
+            limit (int): Максимальное число потоков в процессе
+
+        Returns:
+            bool: True если место получено (освобождается release)
+        """
+        with self._lock:
+            if self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+stream_slots = StreamSlots()
+
+
+def publish_event(build_event):
+    """
+    Публикация сохраненной конверсии (вызывается после фиксации транзакции)
+
+    Args:
+        build_event (callable): Функция, возвращающая данные конверсии в виде
+            Conversion.to_dict; вызывается только при наличии подписчиков
+    """
+    if not broker.subscribers_count():
+        return
+    try:
+        broker.publish(build_event())
+    except Exception as e:
+        logger.error(f"Ошибка при публикации конверсии: {str(e)}")
+
+
+def publish_conversion(conversion):
+    """Публикация сохраненного объекта конверсии"""
+    publish_event(conversion.to_dict)
+
+
+def _load_since(last_id, ref_prefix=None, form_id=None, limit=RESUME_LIMIT):
+    """Конверсии с ID больше last_id по возрастанию ID"""
+    query = Conversion.query.filter(Conversion.id > last_id)
+    if ref_prefix:
+        query = query.filter(Conversion.ref_prefix == ref_prefix)
+    if form_id:
+        query = query.filter(Conversion.form_id == form_id)
+
+    events = [conversion.to_dict() for conversion in query.order_by(Conversion.id).limit(limit)]
+    # Не удерживаем соединение с БД на время ожидания событий
+    db.session.remove()
+    return events
+
+
+def _load_unsent(floor_id, sent_ids, ref_prefix=None, form_id=None, limit=RESUME_LIMIT):
+    """
+    Конверсии с ID больше floor_id, еще не отправленные клиенту
+
+    Все ID выше floor_id, кроме sent_ids, - неотправленные, поэтому первых
+    limit + len(sent_ids) ID по возрастанию достаточно, чтобы найти limit
+    неотправленных. Сначала читаются только ID, строки загружаются лишь
+    для неотправленных.
+    """
+    query = db.session.query(Conversion.id).filter(Conversion.id > floor_id)
+    if ref_prefix:
+        query = query.filter(Conversion.ref_prefix == ref_prefix)
+    if form_id:
+        query = query.filter(Conversion.form_id == form_id)
+
+    candidates = query.order_by(Conversion.id).limit(limit + len(sent_ids))
+    unsent = [conversion_id for (conversion_id,) in candidates if conversion_id not in sent_ids][:limit]
+    events = []
+    if unsent:
+        conversions = Conversion.query.filter(Conversion.id.in_(unsent)).order_by(Conversion.id)
+        events = [conversion.to_dict() for conversion in conversions]
+    db.session.remove()
+    return events
+
+
+def _last_conversion_id():
+    last_id = db.session.query(db.func.max(Conversion.id)).scalar() or 0
+    db.session.remove()
+    return last_id
+
+
+def _format_event(event, cursor):
+    # ID события - наибольший отправленный ID: после конверсии, зафиксированной
+    # с опозданием, переподключение не повторяет уже отправленные
+    return f"id: {cursor}\nevent: conversion\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def stream_conversions(last_event_id=None, ref_prefix=None, form_id=None):
+    """
+    Генератор потока Server-Sent Events с новыми конверсиями
+
+    ID события - наибольший отправленный ID конверсии, поэтому
+    переподключившийся клиент получает пропущенные конверсии из БД по
+    заголовку Last-Event-ID, а затем - новые из очереди процесса. Проверка БД
+    перечитывает ID за последние LOOKBACK_SECONDS и досылает конверсии,
+    зафиксированные позже конверсий с большим ID.
+
+    Args:
+        last_event_id (int, optional): ID последней полученной клиентом конверсии
+        ref_prefix (str, optional): Фильтр по префиксу ref
+        form_id (str, optional): Фильтр по ID объявления
+
+    Yields:
+        str: Фрагменты потока text/event-stream
+    """
+    # Подписываемся до чтения БД, чтобы не потерять конверсии, принятые в промежутке
+    subscriber = broker.subscribe(ref_prefix, form_id)
+    try:
+        last_sent = _last_conversion_id() if last_event_id is None else last_event_id
+        yield "retry: 3000\n\n"
+
+        if last_event_id is not None:
+            for event in _load_since(last_sent, ref_prefix, form_id):
+                last_sent = max(last_sent, event['id'])
+                yield _format_event(event, last_sent)
+
+        # ID не больше floor_id считаются окончательно пройденными (в том числе
+        # досланные при переподключении); отправленные после него ID хранятся
+        # LOOKBACK_SECONDS для отсева повторов
+        floor_id = last_sent
+        sent = {}
+
+        started = time.monotonic()
+        last_activity = started
+        last_poll = started
+
+        while time.monotonic() - started < STREAM_LIFETIME_SECONDS:
+            if subscriber.overflowed:
+                break
+
+            try:
+                event = subscriber.queue.get(timeout=1)
+            except queue.Empty:
+                event = None
+
+            now = time.monotonic()
+
+            if event is not None and event['id'] > floor_id and event['id'] not in sent:
+                last_sent = max(last_sent, event['id'])
+                sent[event['id']] = now
+                yield _format_event(event, last_sent)
+                last_activity = now
+
+            if now - last_poll >= POLL_SECONDS:
+                last_poll = now
+                for conversion_id, sent_at in list(sent.items()):
+                    if now - sent_at >= LOOKBACK_SECONDS:
+                        floor_id = max(floor_id, conversion_id)
+                        del sent[conversion_id]
+
+                for polled in _load_unsent(floor_id, sent, ref_prefix, form_id):
+                    last_sent = max(last_sent, polled['id'])
+                    sent[polled['id']] = now
+                    yield _format_event(polled, last_sent)
+                    last_activity = now
+
+            if now - last_activity >= KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_activity = now
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,155 @@
+import csv
+import io
+import logging
+from app.models.conversion import Conversion, UserAgent, unpack_ip
+
+logger = logging.getLogger(__name__)
+
+# Столбцы выгрузки (совпадают с Conversion.to_dict)
+EXPORT_COLUMNS = ('id', 'ref', 'ref_prefix', 'form_id', 'quid', 'timestamp', 'date', 'ip_address', 'user_agent')
+
+# Количество строк, читаемых из БД за один раз
+EXPORT_BATCH_SIZE = 1000
+
+# Количество строк в одной группе Parquet
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+def parquet_available():
+    """Проверка наличия pyarrow для выгрузки в Parquet"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _iter_rows(query):
+    """Потоковое чтение строк конверсий без загрузки всей выборки в память"""
+    rows = query.outerjoin(UserAgent, UserAgent.id == Conversion.user_agent_id).with_entities(
+        Conversion.id,
+        Conversion.ref,
+        Conversion.ref_prefix,
+        Conversion.form_id,
+        Conversion.quid,
+        Conversion.timestamp,
+        Conversion.date,
+        Conversion.ip_packed,
+        UserAgent.value
+    ).order_by(
+        Conversion.timestamp.asc(), Conversion.id.asc()
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+    for row in rows:
+        yield tuple(row[:7]) + (unpack_ip(row[7]), row[8])
+
+
+def iter_csv(query):
+    """
+    Генератор CSV выгрузки конверсий
+
+    Args:
+        query: Запрос Conversion.query с примененными фильтрами
+
+    Yields:
+        str: Очередной фрагмент CSV
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    rows_in_buffer = 0
+    for row in _iter_rows(query):
+        writer.writerow([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in row
+        ])
+        rows_in_buffer += 1
+
+        if rows_in_buffer >= EXPORT_BATCH_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            rows_in_buffer = 0
+
+    yield buffer.getvalue()
+
+
+class _StreamSink(io.RawIOBase):
+    """Файловый объект, накапливающий записанные байты до их отправки клиенту"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_parquet(query, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    """
+    Генератор Parquet выгрузки конверсий, записываемой группами строк
+
+    В памяти одновременно находится не более одной группы строк.
+
+    Args:
+        query: Запрос Conversion.query с примененными фильтрами
+        row_group_size (int): Количество строк в группе
+
+    Yields:
+        bytes: Очередной фрагмент файла Parquet
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('ref', pa.string()),
+        ('ref_prefix', pa.string()),
+        ('form_id', pa.string()),
+        ('quid', pa.string()),
+        ('timestamp', pa.timestamp('us')),
+        ('date', pa.date32()),
+        ('ip_address', pa.string()),
+        ('user_agent', pa.string()),
+    ])
+
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    def write_group(group):
+        table = pa.Table.from_pylist(
+            [dict(zip(EXPORT_COLUMNS, row)) for row in group],
+            schema=schema
+        )
+        writer.write_table(table, row_group_size=row_group_size)
+
+    group = []
+    try:
+        for row in _iter_rows(query):
+            group.append(row)
+            if len(group) >= row_group_size:
+                write_group(group)
+                group = []
+                yield sink.drain()
+
+        if group:
+            write_group(group)
+    finally:
+        writer.close()
+
+    yield sink.drain()
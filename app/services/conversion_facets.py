@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import bindparam, func, text
+from app.extensions import db
+from app.services.bulk_insert import bulk_insert
+from app.models.conversion import Conversion, ConversionFacet
+
+logger = logging.getLogger(__name__)
+
+# Поля конверсий, значения которых хранятся в справочнике
+FACETS = ('ref_prefix', 'form_id')
+
+# Время жизни кэша значений в памяти процесса (секунды)
+FACET_CACHE_TTL = 60
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Подготовленные запросы UPSERT по диалектам БД
+_upsert_statements = {}
+
+
+def _upsert_statement():
+    """
+    UPSERT для справочника с учетом диалекта БД
+
+    Конструкция on_conflict_do_update не кэшируется SQLAlchemy и компилировалась
+    бы при каждой конверсии, поэтому запрос строится один раз как text()
+    с типизированными параметрами и выполняется с разными значениями.
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return None
+
+    statement = _upsert_statements.get(dialect)
+    if statement is None:
+        table = ConversionFacet.__table__
+        latest = 'max' if dialect == 'sqlite' else 'greatest'
+        statement = text(
+            f"INSERT INTO {table.name} (facet, value, count, last_seen) "
+            f"VALUES (:facet, :value, :count, :last_seen) "
+            f"ON CONFLICT (facet, value) DO UPDATE SET "
+            f"count = {table.name}.count + excluded.count, "
+            f"last_seen = {latest}({table.name}.last_seen, excluded.last_seen)"
+        ).bindparams(*[
+            bindparam(name, type_=table.c[name].type) for name in ('facet', 'value', 'count', 'last_seen')
+        ])
+        _upsert_statements[dialect] = statement
+    return statement
+
+
+def record_conversion_facets(ref_prefix, form_id, timestamp=None, count=1):
+    """
+    Обновление справочника при приеме конверсии
+
+    Выполняется в текущей транзакции, фиксируется вместе с конверсией.
+
+    Args:
+        ref_prefix (str): Префикс ref
+        form_id (str): ID объявления
+        timestamp (datetime, optional): Время конверсии
+        count (int): Количество добавленных конверсий
+    """
+    timestamp = timestamp or datetime.utcnow()
+    values = [
+        {'facet': facet, 'value': value, 'count': count, 'last_seen': timestamp}
+        for facet, value in (('ref_prefix', ref_prefix), ('form_id', form_id))
+        if value
+    ]
+
+    if not values:
+        return
+
+    statement = _upsert_statement()
+    if statement is not None:
+        db.session.execute(statement, values)
+    else:
+        # Для остальных СУБД - обычное чтение и обновление
+        for item in values:
+            entry = ConversionFacet.query.filter_by(facet=item['facet'], value=item['value']).first()
+            if entry:
+                entry.count += count
+                entry.last_seen = max(entry.last_seen or timestamp, timestamp)
+            else:
+                db.session.add(ConversionFacet(**item))
+
+    # Новое значение должно сразу появиться в фильтрах этого процесса
+    new_values = [item for item in values if item['value'] not in _cached_values(item['facet'])]
+    if new_values:
+        invalidate_facet_cache()
+
+
+def _cached_values(facet):
+    with _cache_lock:
+        entry = _cache.get(facet)
+    return entry[1] if entry else ()
+
+
+def invalidate_facet_cache():
+    """Сброс кэша значений в памяти процесса"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def get_facet_values(facet):
+    """
+    Получение списка значений фильтра из справочника
+
+    Args:
+        facet (str): 'ref_prefix' или 'form_id'
+
+    Returns:
+        list: Отсортированный список значений
+    """
+    if facet not in FACETS:
+        raise ValueError(f"Неизвестный фильтр {facet}")
+
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(facet)
+        if entry and entry[0] > now:
+            return list(entry[1])
+
+    try:
+        rows = db.session.query(ConversionFacet.value).filter(
+            ConversionFacet.facet == facet,
+            ConversionFacet.count > 0
+        ).order_by(ConversionFacet.value).all()
+        values = [row[0] for row in rows]
+    except Exception as e:
+        logger.error(f"Ошибка при получении значений фильтра {facet}: {str(e)}")
+        return []
+
+    with _cache_lock:
+        _cache[facet] = (now + FACET_CACHE_TTL, tuple(values))
+
+    return values
+
+
+def get_facets(facet):
+    """
+    Получение значений фильтра со счетчиками и временем последней конверсии
+
+    Args:
+        facet (str): 'ref_prefix' или 'form_id'
+
+    Returns:
+        list: Список словарей, отсортированный по убыванию количества
+    """
+    entries = ConversionFacet.query.filter(
+        ConversionFacet.facet == facet,
+        ConversionFacet.count > 0
+    ).order_by(ConversionFacet.count.desc()).all()
+    return [entry.to_dict() for entry in entries]
+
+
+def rebuild_facets():
+    """
+    Пересчет справочника по таблице конверсий
+
+    Используется при первоначальном заполнении и для сверки после удаления конверсий.
+
+    Returns:
+        int: Количество записей в справочнике
+    """
+    try:
+        entries = []
+        for facet in FACETS:
+            column = getattr(Conversion, facet)
+            rows = db.session.query(
+                column,
+                func.count(Conversion.id),
+                func.max(Conversion.timestamp)
+            ).filter(column != None).group_by(column).all()
+
+            entries.extend(
+                {'facet': facet, 'value': value, 'count': count, 'last_seen': last_seen}
+                for value, count, last_seen in rows if value
+            )
+
+        ConversionFacet.query.delete()
+        bulk_insert(ConversionFacet, entries)
+        db.session.commit()
+        invalidate_facet_cache()
+
+        logger.info(f"Справочник фильтров конверсий пересчитан: {len(entries)} значений")
+        return len(entries)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при пересчете справочника фильтров: {str(e)}")
+        return 0
@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime
+from app.extensions import db
+from app.models.conversion import Conversion, UserAgent, pack_ip, unpack_ip
+from app.services.conversion_facets import record_conversion_facets
+from app.services.conversion_timeseries import record_conversion_hour
+from app.services.conversion_events import publish_conversion, publish_event
+
+logger = logging.getLogger(__name__)
+
+
+def save_conversion(ref, form_id, quid=None, ip_address=None, user_agent=None, timestamp=None):
+    """
+    Сохранение конверсии вместе с обновлением производных данных
+
+    Вариант через ORM для тестовых маршрутов, которым нужен объект
+    конверсии. Постбэки принимаются через ingest_conversion.
+
+    Args:
+        ref (str): Полный ref параметр
+        form_id (str): ID объявления FB
+        quid (str, optional): Уникальный идентификатор запроса
+        ip_address (str, optional): IP адрес клиента
+        user_agent (str, optional): User-Agent клиента
+        timestamp (datetime, optional): Время конверсии (по умолчанию - текущее)
+
+    Returns:
+        Conversion: Сохраненная конверсия
+    """
+    conversion = Conversion(
+        ref=ref,
+        form_id=form_id,
+        quid=quid,
+        timestamp=timestamp,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
+
+    try:
+        db.session.add(conversion)
+        record_conversion_facets(conversion.ref_prefix, conversion.form_id, conversion.timestamp)
+        record_conversion_hour(conversion.ref_prefix, conversion.form_id, conversion.timestamp)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    publish_conversion(conversion)
+
+    return conversion
+
+
+def prepare_conversion_row(ref, form_id, quid=None, ip_address=None, user_agent=None, timestamp=None):
+    """
+    Подготовка строки таблицы conversions без создания объекта ORM
+
+    Производные поля вычисляются так же, как в Conversion.__init__.
+
+    Returns:
+        dict: Значения столбцов conversions
+    """
+    timestamp = timestamp or datetime.utcnow()
+    return {
+        'ref': ref,
+        'ref_prefix': ref[:3] if ref and len(ref) >= 3 else None,
+        'form_id': form_id,
+        'quid': quid,
+        'timestamp': timestamp,
+        'date': timestamp.date(),
+        'ip_packed': pack_ip(ip_address),
+        'user_agent_id': UserAgent.intern(user_agent)
+    }
+
+
+def ingest_conversion(ref, form_id, quid=None, ip_address=None, user_agent=None, timestamp=None):
+    """
+    Быстрый прием конверсии вставкой через SQLAlchemy Core
+
+    В отличие от save_conversion не создает объект ORM, не проходит учет
+    изменений сессии при flush и не перечитывает строку после фиксации:
+    ID берется из результата вставки (lastrowid/RETURNING).
+
+    Args:
+        ref (str): Полный ref параметр
+        form_id (str): ID объявления FB
+        quid (str, optional): Уникальный идентификатор запроса
+        ip_address (str, optional): IP адрес клиента
+        user_agent (str, optional): User-Agent клиента
+        timestamp (datetime, optional): Время конверсии (по умолчанию - текущее)
+
+    Returns:
+        int: ID сохраненной конверсии
+    """
+    row = prepare_conversion_row(ref, form_id, quid, ip_address, user_agent, timestamp)
+
+    try:
+        # Значения передаются параметрами, чтобы скомпилированный запрос брался из кэша
+        result = db.session.execute(Conversion.__table__.insert(), row)
+        conversion_id = result.inserted_primary_key[0]
+        record_conversion_facets(row['ref_prefix'], row['form_id'], row['timestamp'])
+        record_conversion_hour(row['ref_prefix'], row['form_id'], row['timestamp'])
+        # Счетчик конверсий не обновляется: он оценивается по наибольшему ID (entity_counters)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    publish_event(lambda: {
+        'id': conversion_id,
+        'ref': row['ref'],
+        'ref_prefix': row['ref_prefix'],
+        'form_id': row['form_id'],
+        'quid': row['quid'],
+        'timestamp': row['timestamp'].isoformat(),
+        'date': row['date'].isoformat(),
+        'ip_address': unpack_ip(row['ip_packed']),
+        'user_agent': user_agent or None
+    })
+
+    return conversion_id
@@ -0,0 +1,129 @@
+import base64
+import json
+import logging
+from datetime import datetime
+from sqlalchemy import tuple_
+from app.extensions import db
+from app.models.conversion import Conversion
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница для оценки общего количества записей
+ESTIMATE_TOTAL_CAP = 10000
+
+
+def encode_cursor(conversion):
+    """
+    Кодирование позиции конверсии (timestamp, id) в непрозрачный токен
+
+    Args:
+        conversion (Conversion): Конверсия, на которой стоит курсор
+
+    Returns:
+        str: Токен курсора
+    """
+    raw = json.dumps([conversion.timestamp.isoformat(), conversion.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Декодирование токена курсора
+
+    Args:
+        token (str): Токен, полученный из encode_cursor
+
+    Returns:
+        tuple: (timestamp, id)
+
+    Raises:
+        ValueError: Если токен поврежден
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        timestamp, conversion_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(conversion_id)
+    except Exception:
+        raise ValueError("Некорректный курсор пагинации")
+
+
+class KeysetPage:
+    """Страница конверсий, полученная по курсору (timestamp, id)"""
+
+    def __init__(self, items, per_page, has_next, has_prev):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        return encode_cursor(self.items[0]) if self.has_prev and self.items else None
+
+
+def paginate_keyset(query, per_page=50, after=None, before=None):
+    """
+    Курсорная пагинация конверсий (сначала новые)
+
+    Стоимость запроса не зависит от номера страницы: вместо OFFSET и COUNT(*)
+    используется условие по (timestamp, id) и LIMIT per_page + 1.
+
+    Args:
+        query: Запрос Conversion.query с примененными фильтрами
+        per_page (int): Количество записей на странице
+        after (str, optional): Курсор, после которого нужна следующая страница
+        before (str, optional): Курсор, перед которым нужна предыдущая страница
+
+    Returns:
+        KeysetPage: Страница с курсорами для перехода
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    position = tuple_(Conversion.timestamp, Conversion.id)
+
+    if before:
+        # Идем назад: берем записи новее курсора в обратном порядке
+        query = query.filter(position > decode_cursor(before))
+        query = query.order_by(Conversion.timestamp.asc(), Conversion.id.asc())
+        rows = query.limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, per_page, has_next=True, has_prev=has_prev)
+
+    if after:
+        query = query.filter(position < decode_cursor(after))
+
+    query = query.order_by(Conversion.timestamp.desc(), Conversion.id.desc())
+    rows = query.limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    return KeysetPage(rows[:per_page], per_page, has_next=has_next, has_prev=bool(after))
+
+
+def estimate_total(query, cap=ESTIMATE_TOTAL_CAP):
+    """
+    Оценка количества записей с ограничением сверху
+
+    Считает не более cap строк, поэтому стоимость ограничена даже для больших таблиц.
+
+    Args:
+        query: Запрос Conversion.query с примененными фильтрами
+        cap (int): Максимальное количество подсчитываемых строк
+
+    Returns:
+        tuple: (count, is_exact) - количество и признак точного значения
+    """
+    try:
+        limited = query.with_entities(Conversion.id).limit(cap + 1).subquery()
+        count = db.session.query(db.func.count()).select_from(limited).scalar() or 0
+    except Exception as e:
+        logger.error(f"Ошибка при оценке количества конверсий: {str(e)}")
+        return 0, False
+
+    if count > cap:
+        return cap, False
+    return count, True
@@ -0,0 +1,264 @@
+import gzip
+import logging
+import os
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from app.extensions import db
+from app.models.conversion import Conversion, ConversionDailyStat, ConversionArchive
+from app.services.conversion_export import iter_csv
+from app.services.entity_counters import adjust_counter
+
+logger = logging.getLogger(__name__)
+
+# Столбцы, по которым возможна группировка агрегатов
+STAT_COLUMNS = ('date', 'ref_prefix', 'form_id')
+
+
+def month_start(value):
+    """Первый день месяца для указанной даты"""
+    return value.replace(day=1)
+
+
+def add_months(value, months):
+    """Сдвиг первого дня месяца на указанное количество месяцев"""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def live_data_start():
+    """
+    Дата, с которой конверсии хранятся построчно
+
+    Returns:
+        date: Первый день месяца после последнего архивного или None, если архивов нет
+    """
+    last_month = db.session.query(func.max(ConversionArchive.month)).scalar()
+    return add_months(last_month, 1) if last_month else None
+
+
+def _archive_path(archive_dir, month):
+    """Путь к файлу архива месяца, не перезаписывающий предыдущие выгрузки"""
+    base = os.path.join(archive_dir, f"conversions_{month:%Y_%m}")
+    path = f"{base}.csv.gz"
+    suffix = 1
+    while os.path.exists(path):
+        path = f"{base}_{suffix}.csv.gz"
+        suffix += 1
+    return path
+
+
+def archive_month(month, archive_dir=None):
+    """
+    Перенос конверсий месяца в сжатый архив и дневные агрегаты
+
+    Строки выгружаются в gzip CSV, сворачиваются в ConversionDailyStat
+    и удаляются из таблицы conversions одной транзакцией.
+
+    Args:
+        month (date): Любая дата архивируемого месяца
+        archive_dir (str, optional): Каталог архивов (по умолчанию CONVERSION_ARCHIVE_DIR)
+
+    Returns:
+        ConversionArchive: Запись об архиве или None, если в месяце нет конверсий
+    """
+    month = month_start(month)
+    next_month = add_months(month, 1)
+    archive_dir = archive_dir or current_app.config['CONVERSION_ARCHIVE_DIR']
+
+    month_filter = (Conversion.date >= month, Conversion.date < next_month)
+    rows_count = Conversion.query.filter(*month_filter).count()
+    if not rows_count:
+        return None
+
+    # Сначала пишем архив во временный файл, чтобы не удалить строки без копии
+    os.makedirs(archive_dir, exist_ok=True)
+    path = _archive_path(archive_dir, month)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as archive_file:
+        for chunk in iter_csv(Conversion.query.filter(*month_filter)):
+            archive_file.write(chunk)
+    os.replace(tmp_path, path)
+
+    try:
+        # Сворачиваем строки месяца в дневные агрегаты, добавляя к уже имеющимся
+        rollup = db.session.query(
+            Conversion.date,
+            Conversion.ref_prefix,
+            Conversion.form_id,
+            func.count(Conversion.id)
+        ).filter(*month_filter).group_by(
+            Conversion.date, Conversion.ref_prefix, Conversion.form_id
+        ).all()
+
+        existing = {
+            (stat.date, stat.ref_prefix, stat.form_id): stat
+            for stat in ConversionDailyStat.query.filter(
+                ConversionDailyStat.date >= month,
+                ConversionDailyStat.date < next_month
+            )
+        }
+        for day, ref_prefix, form_id, count in rollup:
+            stat = existing.get((day, ref_prefix, form_id))
+            if stat:
+                stat.count += count
+            else:
+                db.session.add(ConversionDailyStat(
+                    date=day, ref_prefix=ref_prefix, form_id=form_id, count=count
+                ))
+
+        archive = ConversionArchive.query.filter_by(month=month).first()
+        if archive:
+            archive.rows_count += rows_count
+            archive.file_path = path
+            archive.archived_at = datetime.utcnow()
+        else:
+            archive = ConversionArchive(month=month, rows_count=rows_count, file_path=path)
+            db.session.add(archive)
+
+        Conversion.query.filter(*month_filter).delete(synchronize_session=False)
+        # Массовое удаление не вызывает событий ORM, счетчик корректируется явно
+        adjust_counter('conversions', -rows_count)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logger.info(f"Конверсии за {month:%Y-%m} перенесены в архив {path}: {rows_count} строк")
+    return archive
+
+
+def apply_retention(retention_months=None, archive_dir=None, today=None):
+    """
+    Архивация всех месяцев старше срока хранения
+
+    Args:
+        retention_months (int, optional): Сколько месяцев хранить построчно
+            (по умолчанию CONVERSION_RETENTION_MONTHS, 0 - не архивировать)
+        archive_dir (str, optional): Каталог архивов
+        today (date, optional): Текущая дата
+
+    Returns:
+        list: Список заархивированных месяцев
+    """
+    if retention_months is None:
+        retention_months = current_app.config.get('CONVERSION_RETENTION_MONTHS', 0)
+    if not retention_months:
+        return []
+
+    today = today or datetime.utcnow().date()
+    cutoff = add_months(month_start(today), -retention_months)
+
+    oldest = db.session.query(func.min(Conversion.date)).filter(Conversion.date < cutoff).scalar()
+    if not oldest:
+        return []
+
+    archived = []
+    month = month_start(oldest)
+    while month < cutoff:
+        try:
+            if archive_month(month, archive_dir):
+                archived.append(month)
+        except Exception as e:
+            logger.error(f"Ошибка при архивации конверсий за {month:%Y-%m}: {str(e)}")
+            break
+        month = add_months(month, 1)
+
+    if archived:
+        # Счетчики справочника фильтров должны учитывать удаленные строки
+        from app.services.conversion_facets import rebuild_facets
+        rebuild_facets()
+
+    return archived
+
+
+def stats_by(group_by, ref_prefix=None, start_date=None, end_date=None):
+    """
+    Количество конверсий с группировкой с учетом архивных месяцев
+
+    Диапазон дат делится по границе архива: архивная часть читается из
+    ConversionDailyStat, актуальная - из conversions. Источник, не
+    пересекающийся с диапазоном, не запрашивается.
+
+    Args:
+        group_by (tuple): Столбцы группировки из STAT_COLUMNS
+        ref_prefix (str, optional): Фильтр по префиксу ref
+        start_date (date, optional): Начальная дата (включительно)
+        end_date (date, optional): Конечная дата (включительно)
+
+    Returns:
+        list: Список кортежей (*значения группировки, count)
+    """
+    for name in group_by:
+        if name not in STAT_COLUMNS:
+            raise ValueError(f"Группировка по {name} не поддерживается")
+
+    live_start = live_data_start()
+    totals = {}
+
+    def collect(model, count_column, range_start, range_end):
+        columns = [getattr(model, name) for name in group_by]
+        query = db.session.query(*columns, count_column)
+        if ref_prefix:
+            query = query.filter(model.ref_prefix == ref_prefix)
+        if range_start:
+            query = query.filter(model.date >= range_start)
+        if range_end:
+            query = query.filter(model.date <= range_end)
+        for row in query.group_by(*columns).all():
+            key = tuple(row[:-1])
+            totals[key] = totals.get(key, 0) + (row[-1] or 0)
+
+    # Архивная часть диапазона
+    if live_start and (start_date is None or start_date < live_start):
+        archive_end = live_start - timedelta(days=1)
+        if end_date and end_date < archive_end:
+            archive_end = end_date
+        collect(ConversionDailyStat, func.sum(ConversionDailyStat.count), start_date, archive_end)
+
+    # Актуальная часть диапазона
+    if not (live_start and end_date and end_date < live_start):
+        live_from = start_date
+        if live_start and (live_from is None or live_from < live_start):
+            live_from = live_start
+        collect(Conversion, func.count(Conversion.id), live_from, end_date)
+
+    return [key + (count,) for key, count in totals.items()]
+
+
+def daily_stats_by_ref_prefix(ref_prefix, start_date=None, end_date=None):
+    """
+    Статистика префикса по дням и объявлениям с учетом архивных месяцев
+
+    Актуальные дни группируются и по ref, как Conversion.get_daily_stats_by_ref_prefix.
+    В архиве ref не хранится, поэтому архивные дни отдаются с ref = None.
+
+    Args:
+        ref_prefix (str): Префикс ref
+        start_date (date, optional): Начальная дата (включительно)
+        end_date (date, optional): Конечная дата (включительно)
+
+    Returns:
+        list: Список кортежей (date, form_id, ref, count)
+    """
+    live_start = live_data_start()
+    rows = []
+
+    # Архивная часть диапазона (stats_by читает только архив, если диапазон кончается до live_start)
+    if live_start and (start_date is None or start_date < live_start):
+        archive_end = live_start - timedelta(days=1)
+        if end_date and end_date < archive_end:
+            archive_end = end_date
+        rows.extend(
+            (day, form_id, None, count)
+            for day, form_id, count in stats_by(('date', 'form_id'), ref_prefix, start_date, archive_end)
+        )
+
+    # Актуальная часть диапазона
+    if not (live_start and end_date and end_date < live_start):
+        live_from = start_date
+        if live_start and (live_from is None or live_from < live_start):
+            live_from = live_start
+        rows.extend(Conversion.get_daily_stats_by_ref_prefix(ref_prefix, live_from, end_date))
+
+    return rows
@@ -0,0 +1,238 @@
+import logging
+from sqlalchemy import text, bindparam
+from app.extensions import db
+from app.models.conversion import Conversion
+
+logger = logging.getLogger(__name__)
+
+# Полнотекстовый индекс SQLite FTS5 (триграммы) по полям ref и quid
+SEARCH_TABLE = 'conversions_search'
+
+# Для PostgreSQL - GIN индексы pg_trgm по тем же полям (поиск через ILIKE)
+TRGM_INDEXES = {
+    'ref': 'ix_conversions_ref_trgm',
+    'quid': 'ix_conversions_quid_trgm',
+}
+
+# Столбцы конверсий, по которым работает поиск
+SEARCH_COLUMNS = ('ref', 'quid')
+
+# Минимальная длина подстроки для триграммного поиска
+MIN_TRIGRAM_LENGTH = 3
+
+_CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        ref, quid, content='conversions', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON conversions BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON conversions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF ref, quid ON conversions BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+        INSERT INTO {SEARCH_TABLE}(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""",
+]
+
+_DROP_STATEMENTS = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+
+# Кэш проверки наличия индекса (один раз на процесс)
+_fts_available = None
+
+
+def _ensure_trgm_indexes():
+    """
+    Создание триграммных индексов PostgreSQL
+
+    Расширение pg_trgm может требовать прав владельца БД; без него
+    поиск идет через ILIKE без индекса.
+    """
+    global _fts_available
+
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for column_name, index_name in TRGM_INDEXES.items():
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {index_name} ON conversions "
+                    f"USING gin ({column_name} gin_trgm_ops)"
+                ))
+        _fts_available = True
+    except Exception as e:
+        logger.warning(f"Не удалось создать триграммные индексы pg_trgm: {str(e)}")
+        _fts_available = False
+
+    return _fts_available
+
+
+def ensure_search_index(rebuild=False):
+    """
+    Создание поискового индекса FTS5 и триггеров синхронизации
+
+    Индекс поддерживается триггерами на таблице conversions, поэтому
+    новые конверсии попадают в него при вставке без изменений в коде приема.
+    Для PostgreSQL создаются GIN индексы pg_trgm, которые СУБД
+    поддерживает сама.
+
+    Args:
+        rebuild (bool): Перестроить индекс по существующим данным
+
+    Returns:
+        bool: True если индекс доступен
+    """
+    global _fts_available
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return _ensure_trgm_indexes()
+
+    if dialect != 'sqlite':
+        logger.info("Поисковый индекс доступен только для SQLite и PostgreSQL, используется поиск без индекса")
+        _fts_available = False
+        return False
+
+    try:
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': SEARCH_TABLE}
+            ).first() is not None
+
+            for statement in _CREATE_STATEMENTS:
+                connection.execute(text(statement))
+
+            # Заполняем индекс существующими конверсиями
+            if rebuild or not exists:
+                connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+                logger.info("Поисковый индекс конверсий перестроен")
+
+        _fts_available = True
+    except Exception as e:
+        # Например, SQLite собран без FTS5 или без токенизатора trigram
+        logger.warning(f"Не удалось создать поисковый индекс FTS5: {str(e)}")
+        _fts_available = False
+
+    return _fts_available
+
+
+def drop_search_index():
+    """Удаление поискового индекса и триггеров"""
+    global _fts_available
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        statements = [f"DROP INDEX IF EXISTS {index_name}" for index_name in TRGM_INDEXES.values()]
+    elif dialect == 'sqlite':
+        statements = _DROP_STATEMENTS
+    else:
+        return
+
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+    _fts_available = False
+
+
+def search_index_available():
+    """
+    Проверка наличия поискового индекса FTS5
+
+    Returns:
+        bool: True если индекс создан
+    """
+    global _fts_available
+
+    if _fts_available is None:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            try:
+                with db.engine.connect() as connection:
+                    found = connection.execute(
+                        text("SELECT count(*) FROM pg_indexes WHERE tablename = 'conversions' "
+                             "AND indexname IN :names").bindparams(bindparam('names', expanding=True)),
+                        {'names': list(TRGM_INDEXES.values())}
+                    ).scalar()
+                _fts_available = found == len(TRGM_INDEXES)
+            except Exception as e:
+                logger.error(f"Ошибка при проверке поискового индекса: {str(e)}")
+                _fts_available = False
+        elif dialect != 'sqlite':
+            _fts_available = False
+        else:
+            try:
+                with db.engine.connect() as connection:
+                    _fts_available = connection.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {'name': SEARCH_TABLE}
+                    ).first() is not None
+            except Exception as e:
+                logger.error(f"Ошибка при проверке поискового индекса: {str(e)}")
+                _fts_available = False
+
+    return _fts_available
+
+
+def substring_condition(column, term):
+    """
+    Условие поиска подстроки через ILIKE '%term%'
+
+    Без индекса это полный просмотр, как и исходный LIKE '%term%', зато
+    результат не зависит от длины строки, наличия индекса и сортировки БД.
+    Символы % и _ ищутся буквально.
+
+    Args:
+        column: Столбец модели (например, Conversion.ref)
+        term (str): Искомая строка
+
+    Returns:
+        Условие SQLAlchemy
+    """
+    # Шаблон передается готовой строкой, чтобы планировщик PostgreSQL мог использовать индекс pg_trgm
+    escaped = term.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    return column.ilike(f'%{escaped}%', escape='/')
+
+
+def search_condition(column_name, term):
+    """
+    Условие поиска подстроки в ref или quid
+
+    Подстроки от трех символов ищутся по триграммному индексу (FTS5 в SQLite,
+    pg_trgm в PostgreSQL). Более короткие строки, а также базы без индекса
+    ищутся через ILIKE '%term%' без индекса. Поиск во всех случаях без учета регистра.
+
+    Args:
+        column_name (str): 'ref' или 'quid'
+        term (str): Искомая строка
+
+    Returns:
+        Условие SQLAlchemy
+    """
+    if column_name not in SEARCH_COLUMNS:
+        raise ValueError(f"Поиск по столбцу {column_name} не поддерживается")
+
+    column = getattr(Conversion, column_name)
+
+    if len(term) < MIN_TRIGRAM_LENGTH or not search_index_available():
+        return substring_condition(column, term)
+
+    if db.engine.dialect.name == 'postgresql':
+        # ILIKE без учета регистра, как токенизатор trigram в FTS5; индекс pg_trgm
+        # подходит для него при любой сортировке БД
+        return substring_condition(column, term)
+
+    # Фраза в кавычках ищется как подстрока, кавычки внутри экранируются удвоением
+    match = f'{column_name} : "' + term.replace('"', '""') + '"'
+    param = f'{column_name}_match'
+    return Conversion.id.in_(
+        text(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :{param}")
+        .bindparams(**{param: match})
+        .columns(Conversion.id)
+    )
@@ -0,0 +1,321 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, func, text
+from app.extensions import db
+from app.services.bulk_insert import bulk_insert
+from app.models.conversion import Conversion, ConversionHourlyStat
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые размеры интервалов графика
+BUCKETS = ('hour', 'day', 'week')
+
+# Количество form_id, выводимых отдельными рядами (остальные - в "other")
+DEFAULT_TOP = 10
+MAX_TOP = 50
+
+# Максимальная длина периода для почасового графика (дни)
+MAX_HOURLY_DAYS = 31
+
+# Период по умолчанию, если даты не указаны (дни)
+DEFAULT_DAYS = 30
+
+# Час считается закрытым (пересчитывается) через этот срок после его окончания:
+# к этому времени транзакции приема конверсий этого часа уже зафиксированы
+CLOSED_HOUR_GRACE = timedelta(minutes=5)
+
+# Подготовленные запросы UPSERT по диалектам БД
+_upsert_statements = {}
+
+
+def hour_start(timestamp):
+    """Начало часа для указанного времени"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert_statement():
+    """
+    UPSERT для почасовых агрегатов с учетом диалекта БД
+
+    Строится один раз как text() с типизированными параметрами
+    (см. conversion_facets._upsert_statement).
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        return None
+
+    statement = _upsert_statements.get(dialect)
+    if statement is None:
+        table = ConversionHourlyStat.__table__
+        statement = text(
+            f"INSERT INTO {table.name} (hour, date, ref_prefix, form_id, count) "
+            f"VALUES (:hour, :date, :ref_prefix, :form_id, :count) "
+            f"ON CONFLICT (hour, ref_prefix, form_id) DO UPDATE SET "
+            f"count = {table.name}.count + excluded.count"
+        ).bindparams(*[
+            bindparam(name, type_=table.c[name].type) for name in ('hour', 'date', 'ref_prefix', 'form_id', 'count')
+        ])
+        _upsert_statements[dialect] = statement
+    return statement
+
+
+def record_conversion_hour(ref_prefix, form_id, timestamp=None, count=1):
+    """
+    Обновление почасового агрегата при приеме конверсии
+
+    Выполняется в текущей транзакции, фиксируется вместе с конверсией.
+
+    Args:
+        ref_prefix (str): Префикс ref
+        form_id (str): ID объявления
+        timestamp (datetime, optional): Время конверсии
+        count (int): Количество добавленных конверсий
+    """
+    hour = hour_start(timestamp or datetime.utcnow())
+    values = {
+        'hour': hour,
+        'date': hour.date(),
+        'ref_prefix': ref_prefix or '',
+        'form_id': form_id or '',
+        'count': count
+    }
+
+    statement = _upsert_statement()
+    if statement is not None:
+        db.session.execute(statement, values)
+        return
+
+    # Для остальных СУБД - обычное чтение и обновление
+    stat = ConversionHourlyStat.query.filter_by(
+        hour=values['hour'], ref_prefix=values['ref_prefix'], form_id=values['form_id']
+    ).first()
+    if stat:
+        stat.count += count
+    else:
+        db.session.add(ConversionHourlyStat(**values))
+
+
+def _hour_expression():
+    """
+    Усечение времени конверсии до часа средствами СУБД
+
+    Выражения те же, что при первоначальном заполнении агрегатов
+    (миграция a6c9b7d0e106).
+
+    Returns:
+        Выражение SQLAlchemy или None, если диалект не поддерживается
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Строка в формате хранения DateTime в SQLite, разбирается типом столбца
+        return func.strftime('%Y-%m-%d %H:00:00.000000', Conversion.timestamp, type_=db.DateTime)
+    if dialect == 'postgresql':
+        return func.date_trunc('hour', Conversion.timestamp, type_=db.DateTime)
+    return None
+
+
+def rebuild_hourly_stats(since=None, until=None):
+    """
+    Пересчет почасовых агрегатов по таблице конверсий
+
+    Агрегаты месяцев, перенесенных в архив, не затрагиваются:
+    построчных данных для них уже нет. Пересчитываются только закрытые
+    часы: агрегаты текущего часа в это время увеличивает прием конверсий,
+    и прибавление между чтением конверсий и перезаписью агрегата потерялось бы.
+
+    Args:
+        since (date, optional): Дата, начиная с которой пересчитываются агрегаты
+            (по умолчанию - начало построчно хранимых данных)
+        until (datetime, optional): Начало первого не пересчитываемого часа
+            (по умолчанию - последний час, закончившийся CLOSED_HOUR_GRACE назад)
+
+    Returns:
+        int: Количество записей агрегатов
+    """
+    from app.services.conversion_retention import live_data_start
+
+    if since is None:
+        since = live_data_start()
+    if until is None:
+        until = hour_start(datetime.utcnow() - CLOSED_HOUR_GRACE)
+
+    try:
+        ref_prefix = func.coalesce(Conversion.ref_prefix, '')
+        form_id = func.coalesce(Conversion.form_id, '')
+        hour = _hour_expression()
+        if hour is not None:
+            # Группировка по часу выполняется в СУБД: в Python приходят только агрегаты
+            query = db.session.query(hour, ref_prefix, form_id, func.count(Conversion.id))
+            query = query.filter(Conversion.timestamp < until)
+            if since:
+                query = query.filter(Conversion.date >= since)
+            counts = {
+                (hour_value, ref_prefix_value, form_id_value): count
+                for hour_value, ref_prefix_value, form_id_value, count
+                in query.group_by(hour, ref_prefix, form_id)
+            }
+        else:
+            # Для остальных СУБД усечение до часа выполняется в Python
+            counts = {}
+            query = db.session.query(Conversion.timestamp, ref_prefix, form_id).filter(Conversion.timestamp < until)
+            if since:
+                query = query.filter(Conversion.date >= since)
+            for timestamp, ref_prefix_value, form_id_value in query.yield_per(5000):
+                key = (hour_start(timestamp), ref_prefix_value, form_id_value)
+                counts[key] = counts.get(key, 0) + 1
+
+        delete_query = ConversionHourlyStat.query.filter(ConversionHourlyStat.hour < until)
+        if since:
+            delete_query = delete_query.filter(ConversionHourlyStat.date >= since)
+        delete_query.delete(synchronize_session=False)
+
+        entries = [
+            {'hour': hour, 'date': hour.date(), 'ref_prefix': ref_prefix, 'form_id': form_id, 'count': count}
+            for (hour, ref_prefix, form_id), count in counts.items()
+        ]
+        bulk_insert(ConversionHourlyStat, entries)
+        db.session.commit()
+
+        logger.info(f"Почасовые агрегаты конверсий пересчитаны: {len(entries)} записей")
+        return len(entries)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при пересчете почасовых агрегатов: {str(e)}")
+        return 0
+
+
+def _bucket_keys(bucket, start_date, end_date):
+    """Список всех интервалов периода, включая интервалы без конверсий"""
+    if bucket == 'hour':
+        current = datetime.combine(start_date, datetime.min.time())
+        end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        step = timedelta(hours=1)
+    elif bucket == 'week':
+        current = start_date - timedelta(days=start_date.weekday())
+        end = end_date + timedelta(days=1)
+        step = timedelta(weeks=1)
+    else:
+        current = start_date
+        end = end_date + timedelta(days=1)
+        step = timedelta(days=1)
+
+    keys = []
+    while current < end:
+        keys.append(current)
+        current += step
+    return keys
+
+
+def resolve_period(bucket, start_date=None, end_date=None, today=None):
+    """
+    Проверка параметров графика и заполнение периода по умолчанию
+
+    Args:
+        bucket (str): 'hour', 'day' или 'week'
+        start_date (date, optional): Начальная дата (включительно)
+        end_date (date, optional): Конечная дата (включительно)
+        today (date, optional): Текущая дата
+
+    Returns:
+        tuple: (start_date, end_date)
+
+    Raises:
+        ValueError: Если параметры недопустимы
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Интервал {bucket} не поддерживается")
+
+    today = today or datetime.utcnow().date()
+    end_date = end_date or today
+    start_date = start_date or end_date - timedelta(days=DEFAULT_DAYS - 1)
+
+    if start_date > end_date:
+        raise ValueError("Начальная дата позже конечной")
+    if bucket == 'hour' and (end_date - start_date).days >= MAX_HOURLY_DAYS:
+        raise ValueError(f"Почасовой график доступен для периода не более {MAX_HOURLY_DAYS} дней")
+
+    return start_date, end_date
+
+
+def get_timeseries(ref_prefix=None, start_date=None, end_date=None, bucket='day', top=DEFAULT_TOP):
+    """
+    Ряды количества конверсий по интервалам для графиков
+
+    Данные читаются из почасовых агрегатов. Отдельными рядами выводятся
+    top form_id с наибольшим количеством конверсий за период,
+    остальные суммируются в ряд "other".
+
+    Args:
+        ref_prefix (str, optional): Фильтр по префиксу ref
+        start_date (date, optional): Начальная дата (включительно)
+        end_date (date, optional): Конечная дата (включительно)
+        bucket (str): 'hour', 'day' или 'week'
+        top (int): Количество отдельных рядов form_id
+
+    Returns:
+        dict: Ряды в колоночном виде (метки интервалов и массивы значений)
+
+    Raises:
+        ValueError: Если параметры недопустимы
+    """
+    start_date, end_date = resolve_period(bucket, start_date, end_date)
+    top = max(0, min(top, MAX_TOP))
+
+    keys = _bucket_keys(bucket, start_date, end_date)
+    index = {key: position for position, key in enumerate(keys)}
+
+    filters = [
+        ConversionHourlyStat.hour >= datetime.combine(start_date, datetime.min.time()),
+        ConversionHourlyStat.hour < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    ]
+    if ref_prefix:
+        filters.append(ConversionHourlyStat.ref_prefix == ref_prefix)
+
+    # Почасовой график группируется по часу, остальные - по дате
+    group_column = ConversionHourlyStat.hour if bucket == 'hour' else ConversionHourlyStat.date
+    rows = db.session.query(
+        group_column,
+        ConversionHourlyStat.form_id,
+        func.sum(ConversionHourlyStat.count)
+    ).filter(*filters).group_by(group_column, ConversionHourlyStat.form_id).all()
+
+    # Итоги по form_id считаются по тем же строкам: отдельный запрос итогов
+    # мог бы не увидеть form_id, появившийся между запросами
+    totals_by_form = {}
+    for _, form_id, count in rows:
+        totals_by_form[form_id] = totals_by_form.get(form_id, 0) + int(count or 0)
+
+    ranked = sorted(totals_by_form.items(), key=lambda item: (-item[1], item[0]))
+    form_ids = [form_id for form_id, _ in ranked[:top]]
+    series_index = {form_id: position for position, form_id in enumerate(form_ids)}
+    has_other = len(ranked) > top
+
+    series = [[0] * len(keys) for _ in form_ids]
+    other = [0] * len(keys) if has_other else None
+    totals = [0] * len(keys)
+
+    for key, form_id, count in rows:
+        if bucket == 'week':
+            key = key - timedelta(days=key.weekday())
+        position = index.get(key)
+        if position is None:
+            continue
+
+        count = int(count or 0)
+        totals[position] += count
+        if form_id in series_index:
+            series[series_index[form_id]][position] += count
+        else:
+            other[position] += count
+
+    return {
+        'bucket': bucket,
+        'ref_prefix': ref_prefix,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'buckets': [key.isoformat() for key in keys],
+        'form_ids': form_ids,
+        'series': series,
+        'other': other,
+        'totals': totals
+    }
@@ -0,0 +1,37 @@
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from app.models.setup import Setup, CampaignSetup
+from app.models.token import FacebookToken
+
+# Запросы списков с предварительной загрузкой связанных записей.
+# Связи accounts, thresholds и campaigns объявлены как lazy='dynamic' (запрос
+# на каждое обращение) и не поддерживают selectinload, поэтому списки читают
+# связи только для чтения account_list и threshold_list: связанные записи всех
+# строк загружаются одним запросом, и число запросов страницы не зависит от числа строк.
+
+
+def tokens_with_accounts(query=None):
+    """Токены с аккаунтами (FacebookToken.account_list)"""
+    query = query if query is not None else FacebookToken.query
+    return query.options(selectinload(FacebookToken.account_list))
+
+
+def setups_with_thresholds(query=None):
+    """Сетапы с порогами (Setup.threshold_list)"""
+    query = query if query is not None else Setup.query
+    return query.options(selectinload(Setup.threshold_list))
+
+
+def campaign_setups_with_setup(query=None, thresholds=False, joined=False):
+    """
+    Назначения кампаний с сетапами
+
+    Args:
+        query: Запрос CampaignSetup (по умолчанию - все назначения)
+        thresholds (bool): Загрузить и пороги сетапов (для проверки кампаний)
+        joined (bool): Запрос уже соединен с Setup - сетап берется из того же JOIN
+    """
+    query = query if query is not None else CampaignSetup.query
+    loader = contains_eager(CampaignSetup.setup) if joined else joinedload(CampaignSetup.setup)
+    if thresholds:
+        loader = loader.selectinload(Setup.threshold_list)
+    return query.options(loader)
@@ -0,0 +1,151 @@
+import logging
+from datetime import datetime
+from sqlalchemy import event, func
+from app.extensions import db
+from app.models.counter import EntityCounter
+from app.models.user import User
+from app.models.setup import Setup
+from app.models.token import FacebookToken
+from app.models.conversion import Conversion
+
+logger = logging.getLogger(__name__)
+
+# Счетчики админ-панели и модели, записи которых они считают
+COUNTED_MODELS = {
+    'users': User,
+    'conversions': Conversion,
+    'setups': Setup,
+    'tokens': FacebookToken
+}
+
+# Счетчики, которые не обновляются при каждой вставке: каждая вставка конверсии
+# блокировала бы одну и ту же строку entity_counters и выстраивала прием постбэков
+# в очередь. Значение - точный пересчет плюс рост наибольшего ID после него
+ID_ESTIMATED = {'conversions'}
+
+_events_registered = False
+
+
+def _increment_statement(name, delta):
+    table = EntityCounter.__table__
+    return table.update().where(table.c.name == name).values(value=table.c.value + delta)
+
+
+def _make_listener(name, delta):
+    def listener(mapper, connection, target):
+        # Выполняется в транзакции вставки/удаления записи
+        connection.execute(_increment_statement(name, delta))
+    return listener
+
+
+def register_counter_events():
+    """
+    Подписка на вставку и удаление записей считаемых моделей
+
+    Счетчик меняется в той же транзакции, что и запись. Массовые операции
+    (Query.delete, вставки через Core) событий не вызывают - для них
+    используется adjust_counter, а расхождения устраняет reconcile_counters.
+    Вставки в таблицы из ID_ESTIMATED не учитываются (см. get_counters).
+    """
+    global _events_registered
+
+    if _events_registered:
+        return
+
+    for name, model in COUNTED_MODELS.items():
+        if name not in ID_ESTIMATED:
+            event.listen(model, 'after_insert', _make_listener(name, 1))
+        event.listen(model, 'after_delete', _make_listener(name, -1))
+
+    _events_registered = True
+
+
+def adjust_counter(name, delta):
+    """
+    Изменение счетчика в текущей транзакции (для массовых операций)
+
+    Args:
+        name (str): Имя счетчика
+        delta (int): Изменение значения
+    """
+    if delta:
+        db.session.execute(_increment_statement(name, delta))
+
+
+def reconcile_counters(names=None):
+    """
+    Точный пересчет счетчиков по таблицам
+
+    Args:
+        names (list, optional): Имена счетчиков (по умолчанию - все)
+
+    Returns:
+        dict: Новые значения счетчиков
+    """
+    names = names or list(COUNTED_MODELS)
+    values = {}
+
+    try:
+        now = datetime.utcnow()
+        existing = {
+            counter.name: counter
+            for counter in EntityCounter.query.filter(EntityCounter.name.in_(names))
+        }
+
+        for name in names:
+            model = COUNTED_MODELS[name]
+            query = db.session.query(func.count(model.id))
+            high_water_id = None
+            if name in ID_ESTIMATED:
+                # Считаются записи до запомненного ID, чтобы рост после него не учелся дважды
+                high_water_id = db.session.query(func.max(model.id)).scalar() or 0
+                query = query.filter(model.id <= high_water_id)
+            value = query.scalar() or 0
+            values[name] = value
+
+            counter = existing.get(name)
+            if counter:
+                counter.value = value
+                counter.reconciled_at = now
+                counter.high_water_id = high_water_id
+            else:
+                db.session.add(EntityCounter(name=name, value=value, reconciled_at=now,
+                                             high_water_id=high_water_id))
+
+        db.session.commit()
+        logger.info(f"Счетчики записей пересчитаны: {values}")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Ошибка при пересчете счетчиков записей: {str(e)}")
+
+    return values
+
+
+def get_counters():
+    """
+    Текущие значения счетчиков без обращения к считаемым таблицам
+
+    Отсутствующие счетчики (например, сразу после установки) пересчитываются.
+    Для счетчиков из ID_ESTIMATED к пересчитанному значению добавляется рост
+    наибольшего ID после пересчета (один поиск по первичному ключу). Пропуски
+    ID и удаления по одной записи уточняет ежедневный reconcile_counters.
+
+    Returns:
+        dict: {имя: {'value': int, 'reconciled_at': datetime}}
+    """
+    counters = {}
+    for counter in EntityCounter.query.all():
+        value = counter.value
+        if counter.name in ID_ESTIMATED and counter.high_water_id is not None:
+            model = COUNTED_MODELS[counter.name]
+            max_id = db.session.query(func.max(model.id)).scalar() or 0
+            value += max(max_id - counter.high_water_id, 0)
+        counters[counter.name] = {'value': value, 'reconciled_at': counter.reconciled_at}
+
+    missing = [name for name in COUNTED_MODELS if name not in counters]
+    if missing:
+        now = datetime.utcnow()
+        for name, value in reconcile_counters(missing).items():
+            counters[name] = {'value': value, 'reconciled_at': now}
+
+    return counters
@@ -1,16 +1,61 @@
-import os
 import requests
 import logging
 import json
 from facebook_business.api import FacebookAdsApi
+from facebook_business.session import FacebookSession
 from facebook_business.adobjects.adaccount import AdAccount
 from facebook_business.adobjects.campaign import Campaign
 from facebook_business.adobjects.adset import AdSet
 from facebook_business.adobjects.ad import Ad
+from facebook_business.exceptions import FacebookRequestError
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Заголовки Graph API с загрузкой лимитов запросов
+USAGE_HEADERS = ('x-app-usage', 'x-ad-account-usage', 'x-business-use-case-usage')
+
+# Часовые пояса рекламных аккаунтов {ad_account_id: timezone_name} (меняются редко)
+_account_timezones = {}
+
+
+def parse_usage_headers(headers):
+    """
+    Загрузка лимитов Graph API по заголовкам ответа
+
+    Args:
+        headers: Заголовки ответа (без учета регистра, как у requests)
+
+    Returns:
+        tuple: (максимальная загрузка в процентах или None, минут до восстановления доступа)
+    """
+    usage_pct = None
+    regain_minutes = 0
+
+    for name in USAGE_HEADERS:
+        raw = headers.get(name)
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            continue
+
+        # x-business-use-case-usage: {business_id: [{type, call_count, ...}, ...]}
+        if name == 'x-business-use-case-usage':
+            entries = [entry for items in data.values() for entry in items]
+        else:
+            entries = [data]
+
+        for entry in entries:
+            for key in ('call_count', 'total_time', 'total_cputime', 'acc_id_util_pct'):
+                value = entry.get(key)
+                if isinstance(value, (int, float)):
+                    usage_pct = value if usage_pct is None else max(usage_pct, value)
+            regain_minutes = max(regain_minutes, entry.get('estimated_time_to_regain_access') or 0)
+
+    return usage_pct, regain_minutes
+
 class FacebookAdClient:
     def __init__(self, access_token=None, app_id=None, app_secret=None, ad_account_id=None, token_obj=None):
         """
@@ -42,17 +87,26 @@ class FacebookAdClient:
             self.ad_account_id = ad_account_id
             self.proxy_url = None
 
-        # Настройка прокси через переменные окружения
-        if self.proxy_url:
-            os.environ['http_proxy'] = self.proxy_url
-            os.environ['https_proxy'] = self.proxy_url
+        # Коды ошибок Graph API и загрузка лимитов (для выбора токена, см. token_router)
+        self.error_codes = set()
+        self.usage_pct = None
+        self.regain_access_minutes = 0
+
+        # Прокси задается сессиям клиента, а не через os.environ, и API создается
+        # отдельным объектом, а не глобальным FacebookAdsApi.init: проверки кампаний
+        # с разными токенами идут параллельно в потоках одного процесса
+        proxies = {'http': self.proxy_url, 'https': self.proxy_url} if self.proxy_url else None
+        if proxies:
             logger.info(f"Настроен прокси: {self.proxy_url}")
         
-        # Инициализация API без параметра session
-        self.api = FacebookAdsApi.init(
-            self.app_id, 
-            self.app_secret, 
-            self.access_token,
+        # Сессия прямых запросов к Graph API
+        self.session = requests.Session()
+        if proxies:
+            self.session.proxies = proxies
+        
+        # API SDK этого клиента: передается каждому объекту (api=self.api)
+        self.api = FacebookAdsApi(
+            FacebookSession(self.app_id, self.app_secret, self.access_token, proxies=proxies),
             api_version='v18.0'
         )
         
@@ -62,9 +116,29 @@ class FacebookAdClient:
             if not self.ad_account_id.startswith('act_'):
                 self.ad_account_id = f'act_{self.ad_account_id}'
             
-            self.account = AdAccount(self.ad_account_id)
+            self.account = AdAccount(self.ad_account_id, api=self.api)
             logger.info(f"Настроен аккаунт по умолчанию: {self.ad_account_id}")
     
+    def _track_response(self, response):
+        """Запоминает загрузку лимитов и код ошибки из ответа прямого запроса"""
+        usage_pct, regain_minutes = parse_usage_headers(response.headers)
+        if usage_pct is not None:
+            self.usage_pct = usage_pct
+        self.regain_access_minutes = max(self.regain_access_minutes, regain_minutes)
+
+        if response.status_code != 200:
+            try:
+                code = response.json().get('error', {}).get('code')
+            except ValueError:
+                code = None
+            if code is not None:
+                self.error_codes.add(code)
+
+    def _track_error(self, error):
+        """Запоминает код ошибки SDK"""
+        if isinstance(error, FacebookRequestError) and error.api_error_code() is not None:
+            self.error_codes.add(error.api_error_code())
+
     def set_account(self, account_id):
         """
         Устанавливает текущий рекламный аккаунт
@@ -82,9 +156,48 @@ class FacebookAdClient:
             account_id = f'act_{account_id}'
             
         self.ad_account_id = account_id
-        self.account = AdAccount(self.ad_account_id)
+        self.account = AdAccount(self.ad_account_id, api=self.api)
         logger.info(f"Установлен аккаунт: {self.ad_account_id}")
     
+    def get_account_timezone(self):
+        """
+        Часовой пояс текущего рекламного аккаунта
+
+        Facebook считает расход за date_preset по дням в этом поясе.
+
+        Returns:
+            str: Имя пояса (timezone_name аккаунта) или None, если аккаунт
+                не задан или пояс получить не удалось
+        """
+        if not self.ad_account_id:
+            return None
+        if self.ad_account_id in _account_timezones:
+            return _account_timezones[self.ad_account_id]
+
+        try:
+            response = self.session.get(
+                f'https://graph.facebook.com/v18.0/{self.ad_account_id}',
+                params={
+                    'access_token': self.access_token,
+                    'fields': 'timezone_name'
+                },
+                timeout=30
+            )
+            self._track_response(response)
+
+            if response.status_code != 200:
+                logger.warning(f"Ошибка API при получении часового пояса аккаунта: "
+                               f"{response.status_code} - {response.text}")
+                return None
+
+            timezone_name = response.json().get('timezone_name')
+        except Exception as e:
+            logger.warning(f"Ошибка при получении часового пояса аккаунта {self.ad_account_id}: {str(e)}")
+            return None
+
+        _account_timezones[self.ad_account_id] = timezone_name
+        return timezone_name
+
     def get_campaigns(self, status_filter=None, limit=1000):
         """
         Получение списка кампаний с поддержкой пагинации
@@ -120,11 +233,12 @@ class FacebookAdClient:
             while url and len(all_campaigns) < limit:
                 logger.info(f"Запрашиваем страницу: {url}")
                 
-                response = requests.get(
+                response = self.session.get(
                     url,
                     params=api_params if next_url is None else {},  # Используем параметры только для первого запроса
                     timeout=30
                 )
+                self._track_response(response)
                 
                 if response.status_code != 200:
                     logger.warning(f"Ошибка API: {response.status_code} - {response.text}")
@@ -139,7 +253,7 @@ class FacebookAdClient:
                 
                 for campaign_data in campaigns_data:
                     if not status_filter or campaign_data.get('status') == status_filter:
-                        campaign = Campaign(campaign_data.get('id'))
+                        campaign = Campaign(campaign_data.get('id'), api=self.api)
                         campaign['id'] = campaign_data.get('id')
                         campaign['name'] = campaign_data.get('name')
                         campaign['status'] = campaign_data.get('status')
@@ -190,6 +304,7 @@ class FacebookAdClient:
             return campaigns[:limit]
         
         except Exception as e:
+            self._track_error(e)
             logger.error(f"Ошибка при использовании SDK: {str(e)}")
             
             # Если все методы не сработали, возвращаем пустой список
@@ -207,15 +322,16 @@ class FacebookAdClient:
             list: Список объектов объявлений
         """
         try:
-            campaign = Campaign(campaign_id)
+            campaign = Campaign(campaign_id, api=self.api)
             ads = campaign.get_ads(fields=['id', 'name', 'status', 'creative'])
             logger.info(f"Получено {len(ads)} объявлений для кампании {campaign_id}")
             return ads
         except Exception as e:
+            self._track_error(e)
             logger.error(f"Ошибка при получении объявлений для кампании {campaign_id}: {str(e)}")
             # В случае ошибки пробуем прямой запрос
             try:
-                response = requests.get(
+                response = self.session.get(
                     f'https://graph.facebook.com/v18.0/{campaign_id}/ads',
                     params={
                         'access_token': self.access_token,
@@ -223,6 +339,7 @@ class FacebookAdClient:
                     },
                     timeout=30
                 )
+                self._track_response(response)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -232,7 +349,7 @@ class FacebookAdClient:
                     # Преобразуем в формат, ожидаемый приложением
                     ads = []
                     for ad_data in ads_data:
-                        ad = Ad(ad_data.get('id'))
+                        ad = Ad(ad_data.get('id'), api=self.api)
                         for key, value in ad_data.items():
                             setattr(ad, key, value)
                         ads.append(ad)
@@ -258,7 +375,7 @@ class FacebookAdClient:
         """
         try:
             # Сначала пробуем через прямой API запрос
-            response = requests.get(
+            response = self.session.get(
                 f'https://graph.facebook.com/v18.0/{ad_id}/insights',
                 params={
                     'access_token': self.access_token,
@@ -268,6 +385,7 @@ class FacebookAdClient:
                 },
                 timeout=30
             )
+            self._track_response(response)
             
             if response.status_code == 200:
                 data = response.json()
@@ -299,7 +417,7 @@ class FacebookAdClient:
             
         # Если прямой API запрос не сработал, пробуем через SDK
         try:
-            ad = Ad(ad_id)
+            ad = Ad(ad_id, api=self.api)
             insights = ad.get_insights(
                 fields=['ad_id', 'spend', 'actions'],
                 params={
@@ -326,6 +444,7 @@ class FacebookAdClient:
                 'conversions': conversions
             }
         except Exception as e:
+            self._track_error(e)
             logger.error(f"Ошибка при получении статистики для объявления {ad_id}: {str(e)}")
             return {'ad_id': ad_id, 'spend': 0, 'conversions': 0}
     
@@ -341,7 +460,7 @@ class FacebookAdClient:
         """
         try:
             # Сначала пробуем прямой API запрос
-            response = requests.post(
+            response = self.session.post(
                 f'https://graph.facebook.com/v18.0/{ad_id}',
                 params={
                     'access_token': self.access_token,
@@ -349,6 +468,7 @@ class FacebookAdClient:
                 },
                 timeout=30
             )
+            self._track_response(response)
             
             if response.status_code == 200:
                 logger.info(f"Объявление {ad_id} отключено через прямой API запрос")
@@ -362,7 +482,7 @@ class FacebookAdClient:
         
         # Если прямой API запрос не сработал, пробуем через SDK
         try:
-            ad = Ad(ad_id)
+            ad = Ad(ad_id, api=self.api)
             result = ad.api_update(
                 params={
                     'status': Ad.Status.paused,
@@ -371,5 +491,6 @@ class FacebookAdClient:
             logger.info(f"Объявление {ad_id} отключено через SDK")
             return result
         except Exception as e:
+            self._track_error(e)
             logger.error(f"Ошибка при отключении объявления {ad_id}: {str(e)}")
             return False
\ No newline at end of file
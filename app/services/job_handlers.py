@@ -0,0 +1,75 @@
+import logging
+from flask import current_app
+from app.extensions import db, response_cache
+from app.models.token import FacebookToken
+from app.services.campaign_catalog import apply_refresh, invalidate_catalog, plan_sync
+from app.services.campaign_refresh import CampaignRefresh, build_tasks
+from app.services.job_queue import job_handler
+from app.services.token_checker import TokenChecker
+from app.services.token_router import token_router
+
+logger = logging.getLogger(__name__)
+
+
+def _refresh_into_catalog(context, user_id, tokens, full=False):
+    """
+    Синхронизация каталога по аккаунтам токенов с записью хода
+
+    Аккаунты, загруженные полностью недавно, запрашиваются только
+    изменениями (см. campaign_catalog.plan_sync).
+
+    Returns:
+        dict: Итог обновления (campaign_catalog.apply_refresh)
+    """
+    # В фоне нет ограничения timeout gunicorn - срок задания больше срока запроса
+    refresh = CampaignRefresh(
+        plan_sync(user_id, build_tasks(tokens), full=full),
+        deadline_seconds=current_app.config.get('CAMPAIGN_REFRESH_JOB_DEADLINE', 300)
+    )
+    context.progress(0, len(refresh.tasks), force=True)
+
+    for event in refresh.run():
+        status = f"получено изменений: {event['count']}" if event['success'] else 'ошибка'
+        context.progress(
+            event['done'], event['total'],
+            f"{event['account_name'] or event['account_id']} - {status}"
+        )
+
+    summary = apply_refresh(user_id, refresh)
+    db.session.commit()
+    response_cache.invalidate('tokens', user_id)
+    invalidate_catalog(user_id)
+    return summary
+
+
+@job_handler('refresh_campaigns')
+def refresh_campaigns(context, full=False):
+    """Обновление списка кампаний по всем валидным токенам пользователя"""
+    tokens = FacebookToken.query.filter_by(user_id=context.user_id, status='valid').all()
+    return _refresh_into_catalog(context, context.user_id, tokens, full)
+
+
+@job_handler('refresh_token_campaigns')
+def refresh_token_campaigns(context, token_id):
+    """Полная загрузка кампаний аккаунтов одного токена"""
+    token = FacebookToken.query.filter_by(id=token_id, user_id=context.user_id).first()
+    if token is None:
+        raise ValueError(f"Токен {token_id} не найден")
+    return _refresh_into_catalog(context, context.user_id, [token], full=True)
+
+
+@job_handler('check_token')
+def check_token(context, token_id):
+    """Проверка токена и его аккаунтов"""
+    token = FacebookToken.query.filter_by(id=token_id, user_id=context.user_id).first()
+    if token is None:
+        raise ValueError(f"Токен {token_id} не найден")
+
+    context.progress(0, 1, token.name, force=True)
+    TokenChecker(token).check_and_update_token()
+    # Статус и доступные аккаунты могли измениться
+    token_router.invalidate()
+    response_cache.invalidate('tokens', context.user_id)
+    context.progress(1, 1, token.name, force=True)
+
+    return {'token_id': token.id, 'status': token.status, 'error_message': token.error_message}
@@ -0,0 +1,331 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app.extensions import db
+from app.models.job import BackgroundJob
+from app.services.leader_lock import make_holder_id
+from app.services.sql_profiler import sql_profiler
+
+logger = logging.getLogger(__name__)
+
+# Пауза между опросами очереди, когда заданий нет (секунды)
+POLL_SECONDS = 1.0
+# Как часто исполнитель отмечает, что его задания еще выполняются
+HEARTBEAT_SECONDS = 15
+# Задание без отметки дольше этого срока считается брошенным (процесс остановлен)
+STALE_SECONDS = 120
+# Сколько раз брошенное задание возвращается в очередь
+MAX_ATTEMPTS = 3
+# Сколько хранятся завершенные задания
+FINISHED_RETENTION = timedelta(days=7)
+
+# Обработчики заданий по типу: handler(context, **params) -> dict с итогом
+_handlers = {}
+
+
+def job_handler(kind):
+    """Регистрация обработчика заданий типа kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, user_id=None, **params):
+    """
+    Постановка задания в очередь (с фиксацией транзакции)
+
+    Args:
+        kind (str): Тип задания (зарегистрированный обработчик)
+        user_id (int, optional): Владелец задания - только он видит статус
+        **params: Параметры обработчика (сериализуются в JSON)
+
+    Returns:
+        BackgroundJob: Созданное задание
+    """
+    job = BackgroundJob(kind=kind, user_id=user_id, params=json.dumps(params), status='queued', attempts=0)
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Задание {job.id} ({kind}) поставлено в очередь")
+    return job
+
+
+def submit(kind, user_id=None, **params):
+    """
+    Запуск задания из обработчика запроса
+
+    При BACKGROUND_JOBS задание только ставится в очередь и выполняется
+    потоками планировщика; без фоновых исполнителей (разработка, один
+    процесс) выполняется сразу в текущем запросе.
+
+    Returns:
+        BackgroundJob: Задание (при выполнении на месте - уже завершенное)
+    """
+    job = enqueue(kind, user_id, **params)
+    if not current_app.config.get('BACKGROUND_JOBS', True):
+        job.status = 'running'
+        job.worker = 'inline'
+        job.attempts = 1
+        job.started_at = job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        run_job(job.id)
+        job = db.session.get(BackgroundJob, job.id)
+    return job
+
+
+def get_job(job_id, user_id):
+    """Задание пользователя или None"""
+    return BackgroundJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+
+class JobContext:
+    """Передается обработчику: запись хода выполнения отдельной транзакцией"""
+
+    def __init__(self, job_id, user_id=None):
+        self.job_id = job_id
+        self.user_id = user_id
+        self._last_write = 0.0
+
+    def progress(self, done, total, message=None, force=False):
+        """
+        Ход выполнения задания
+
+        Пишется в БД отдельной короткой транзакцией (не чаще раза в 0.5 с),
+        поэтому виден клиентам сразу и не фиксирует изменения обработчика.
+        """
+        now = time.monotonic()
+        if not force and done < total and now - self._last_write < 0.5:
+            return
+        self._last_write = now
+
+        table = BackgroundJob.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    table.update()
+                    .where(table.c.id == self.job_id)
+                    .values(
+                        progress=json.dumps({'done': done, 'total': total, 'message': message}),
+                        heartbeat_at=datetime.utcnow()
+                    )
+                )
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка записи хода задания {self.job_id}: {str(e)}")
+
+
+def claim_next(worker):
+    """
+    Захват самого раннего задания из очереди
+
+    UPDATE с условием status='queued' выполнит только один из
+    конкурирующих исполнителей, поэтому задание не выполнится дважды.
+
+    Returns:
+        int: ID захваченного задания или None, если очередь пуста
+    """
+    table = BackgroundJob.__table__
+    while True:
+        with db.engine.begin() as connection:
+            job_id = connection.execute(
+                db.select(table.c.id)
+                .where(table.c.status == 'queued')
+                .order_by(table.c.id)
+                .limit(1)
+            ).scalar()
+            if job_id is None:
+                return None
+
+            now = datetime.utcnow()
+            claimed = connection.execute(
+                table.update()
+                .where(table.c.id == job_id)
+                .where(table.c.status == 'queued')
+                .values(status='running', worker=worker, started_at=now, heartbeat_at=now,
+                        attempts=table.c.attempts + 1)
+            ).rowcount == 1
+
+        if claimed:
+            return job_id
+
+
+def run_job(job_id):
+    """
+    Выполнение задания обработчиком и запись итога
+
+    Returns:
+        bool: True, если задание выполнено успешно
+    """
+    # Обработчики регистрируются при импорте модуля
+    import app.services.job_handlers  # noqa: F401
+
+    job = db.session.get(BackgroundJob, job_id)
+    handler = _handlers.get(job.kind)
+    params = json.loads(job.params) if job.params else {}
+
+    try:
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задания: {job.kind}")
+        with sql_profiler.trace('job', job.kind):
+            result = handler(JobContext(job_id, job.user_id), **params)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Задание {job_id} ({job.kind}) завершилось ошибкой: {str(e)}")
+        job = db.session.get(BackgroundJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return False
+
+    job = db.session.get(BackgroundJob, job_id)
+    job.status = 'done'
+    job.result = json.dumps(result or {}, default=str)
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    logger.info(f"Задание {job_id} ({job.kind}) выполнено")
+    return True
+
+
+def recover_stale_jobs(now=None):
+    """
+    Возврат в очередь заданий остановленных исполнителей
+
+    Задание, превысившее MAX_ATTEMPTS, считается неудачным.
+
+    Returns:
+        int: Количество обработанных заданий
+    """
+    now = now or datetime.utcnow()
+    table = BackgroundJob.__table__
+    stale = (table.c.status == 'running') & (table.c.heartbeat_at < now - timedelta(seconds=STALE_SECONDS))
+
+    with db.engine.begin() as connection:
+        failed = connection.execute(
+            table.update()
+            .where(stale)
+            .where(table.c.attempts >= MAX_ATTEMPTS)
+            .values(status='failed', error='Исполнитель остановлен во время выполнения', finished_at=now)
+        ).rowcount
+        requeued = connection.execute(
+            table.update().where(stale).values(status='queued', worker=None)
+        ).rowcount
+
+    if failed or requeued:
+        logger.warning(f"Брошенные задания: возвращено в очередь {requeued}, неудачных {failed}")
+    return failed + requeued
+
+
+def purge_finished_jobs(now=None):
+    """Удаление завершенных заданий старше FINISHED_RETENTION"""
+    now = now or datetime.utcnow()
+    table = BackgroundJob.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            table.delete()
+            .where(table.c.status.in_(('done', 'failed')))
+            .where(table.c.finished_at < now - FINISHED_RETENTION)
+        ).rowcount
+
+
+class JobWorkerPool:
+    """
+    Потоки-исполнители заданий (запускаются в процессе планировщика)
+
+    Каждый поток захватывает задания из общей таблицы, поэтому пулов
+    может быть несколько (например, в резервных экземплярах планировщика).
+    Отдельный поток отмечает выполняемые задания, чтобы другие процессы
+    не вернули их в очередь.
+    """
+
+    def __init__(self, app, threads=4):
+        self.app = app
+        self.threads = threads
+        self.worker = make_holder_id()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        with self.app.app_context():
+            recover_stale_jobs()
+
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Запущено исполнителей заданий: {self.threads} ({self.worker})")
+
+    def stop(self, timeout=30):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = claim_next(self.worker)
+                    if job_id is not None:
+                        run_job(job_id)
+                        continue
+            except Exception as e:
+                logger.error(f"Ошибка исполнителя заданий: {str(e)}")
+            self._stop.wait(POLL_SECONDS)
+
+    def _heartbeat(self):
+        table = BackgroundJob.__table__
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(
+                            table.update()
+                            .where(table.c.worker == self.worker)
+                            .where(table.c.status == 'running')
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+                    recover_stale_jobs()
+            except Exception as e:
+                logger.error(f"Ошибка отметки заданий: {str(e)}")
+
+
+def stream_job(job_id, user_id, poll_seconds=0.5, lifetime=600):
+    """
+    Генератор потока Server-Sent Events с ходом задания
+
+    Состояние читается из БД (задание выполняется другим процессом),
+    событие отправляется при изменении; после завершения поток закрывается.
+
+    Yields:
+        str: Фрагменты потока text/event-stream
+    """
+    yield "retry: 3000\n\n"
+    started = time.monotonic()
+    last_sent = None
+
+    while time.monotonic() - started < lifetime:
+        # Свежее состояние из БД, а не из identity map сессии
+        db.session.expire_all()
+        job = get_job(job_id, user_id)
+        if job is None:
+            yield "event: error\ndata: {}\n\n"
+            return
+
+        state = job.to_dict()
+        payload = json.dumps(state)
+        if payload != last_sent:
+            yield f"event: {'done' if job.is_finished else 'progress'}\ndata: {payload}\n\n"
+            last_sent = payload
+        if job.is_finished:
+            return
+
+        # Соединение с БД не держим между опросами
+        db.session.remove()
+        time.sleep(poll_seconds)
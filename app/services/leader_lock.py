@@ -0,0 +1,145 @@
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.extensions import db
+from app.models.lease import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+# Время жизни аренды без продления (секунды)
+DEFAULT_LEASE_SECONDS = 60
+
+
+def make_holder_id():
+    """Идентификатор владельца: хост, PID и случайный суффикс (PID может повториться в другом контейнере)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLock:
+    """
+    Блокировка ведущего процесса на основе аренды в общей БД
+
+    Роль получает процесс, первым записавший аренду или заставший ее
+    просроченной. Владелец должен продлевать аренду чаще, чем она истекает;
+    если он завис или остановлен, роль через lease_seconds переходит
+    к другому процессу. Время берется из часов процессов, поэтому
+    расхождение часов между машинами должно быть много меньше lease_seconds.
+    """
+
+    def __init__(self, name, lease_seconds=DEFAULT_LEASE_SECONDS, holder=None):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.holder = holder or make_holder_id()
+        # Момент, до которого роль гарантированно наша (по последнему успешному продлению)
+        self._held_until = None
+
+    @property
+    def is_held(self):
+        return self._held_until is not None and datetime.utcnow() < self._held_until
+
+    def acquire(self):
+        """
+        Получение или продление аренды
+
+        Выполняется отдельной короткой транзакцией, не затрагивая сессию.
+        При ошибке БД роль считается удерживаемой до истечения последней
+        успешной аренды: другие процессы не смогут забрать ее раньше.
+
+        Returns:
+            bool: True, если процесс является ведущим
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        table = LeaderLease.__table__
+
+        try:
+            with db.engine.begin() as connection:
+                # Продление своей аренды или захват просроченной - одним UPDATE,
+                # поэтому из двух конкурентов его выполнит только один
+                result = connection.execute(
+                    table.update()
+                    .where(table.c.name == self.name)
+                    .where(db.or_(table.c.holder == self.holder, table.c.expires_at < now))
+                    .values(
+                        holder=self.holder,
+                        acquired_at=db.case((table.c.holder == self.holder, table.c.acquired_at), else_=now),
+                        renewed_at=now,
+                        expires_at=expires_at
+                    )
+                )
+                acquired = result.rowcount == 1
+
+            if not acquired:
+                acquired = self._insert(now, expires_at)
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка продления аренды {self.name}: {str(e)}")
+            return self.is_held
+
+        was_held = self.is_held
+        self._held_until = expires_at if acquired else None
+
+        if acquired and not was_held:
+            logger.info(f"Роль {self.name} получена процессом {self.holder}")
+        elif was_held and not acquired:
+            logger.warning(f"Роль {self.name} потеряна процессом {self.holder}")
+
+        return acquired
+
+    def _insert(self, now, expires_at):
+        """Первая запись аренды (строки еще нет)"""
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(LeaderLease.__table__.insert().values(
+                    name=self.name,
+                    holder=self.holder,
+                    acquired_at=now,
+                    renewed_at=now,
+                    expires_at=expires_at
+                ))
+            return True
+        except IntegrityError:
+            # Строка уже есть и аренда действует - роль у другого процесса
+            return False
+
+    def release(self):
+        """Досрочное освобождение аренды (при штатной остановке)"""
+        if self._held_until is None:
+            return
+
+        table = LeaderLease.__table__
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    table.update()
+                    .where(table.c.name == self.name)
+                    .where(table.c.holder == self.holder)
+                    .values(expires_at=datetime.utcnow())
+                )
+            logger.info(f"Роль {self.name} освобождена процессом {self.holder}")
+        except SQLAlchemyError as e:
+            logger.error(f"Ошибка освобождения аренды {self.name}: {str(e)}")
+        finally:
+            self._held_until = None
+
+
+def get_lease(name):
+    """
+    Текущая аренда роли для отображения
+
+    Returns:
+        dict: Владелец и время аренды или None, если роль еще не занималась
+    """
+    lease = LeaderLease.query.filter_by(name=name).first()
+    if lease is None:
+        return None
+    return {
+        'name': lease.name,
+        'holder': lease.holder,
+        'acquired_at': lease.acquired_at,
+        'renewed_at': lease.renewed_at,
+        'expires_at': lease.expires_at,
+        'active': lease.expires_at > datetime.utcnow()
+    }
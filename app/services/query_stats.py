@@ -0,0 +1,46 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.extensions import db
+
+
+class QueryCounter:
+    """Счетчик SQL запросов, выполненных текущим потоком"""
+
+    def __init__(self):
+        self.statements = []
+        self._thread_id = threading.get_ident()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Запросы других потоков (воркеры, планировщик) не учитываются
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Подсчет SQL запросов внутри блока
+
+    Пример:
+        with count_queries() as counter:
+            client.get('/auth/tokens')
+        assert counter.count == 5, counter.statements
+
+    Args:
+        engine: Движок SQLAlchemy (по умолчанию - движок приложения)
+
+    Yields:
+        QueryCounter: Счетчик с выполненными запросами
+    """
+    engine = engine if engine is not None else db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Префикс ключей, в которых хранятся версии пространств инвалидации
+VERSION_PREFIX = 'version:'
+
+
+class MemoryCacheBackend:
+    """LRU кэш в памяти процесса (не разделяется между воркерами gunicorn)"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        result = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                result[key] = value
+        return result
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Кэш в отдельном файле SQLite, общий для всех процессов на хосте"""
+
+    name = 'sqlite'
+
+    # Как часто (в операциях записи) удалять просроченные записи
+    PURGE_EVERY = 200
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Отдельное соединение для создания схемы: при preload_app кэш создается
+        # в мастер-процессе gunicorn, и его соединения не должны наследоваться воркерами
+        connection = sqlite3.connect(path, timeout=5)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)')
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _connection(self):
+        # Соединение SQLite нельзя использовать из разных потоков
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA busy_timeout=5000')
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache_entries WHERE key IN ({placeholders}) '
+            f'AND (expires_at IS NULL OR expires_at > ?)',
+            (*keys, time.time())
+        ).fetchall()
+        return dict(rows)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, expires_at)
+            )
+
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge()
+
+    def _purge(self):
+        """Удаление просроченных записей и самых старых при превышении лимита"""
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+            connection.execute(
+                'DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND key IN ('
+                'SELECT key FROM cache_entries WHERE expires_at IS NOT NULL '
+                'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM cache_entries')
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+class NullCacheBackend:
+    """Отключенный кэш: каждое обращение - промах"""
+
+    name = 'null'
+
+    def get_many(self, keys):
+        return {}
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
+
+
+class CachePolicy:
+    """Политика кэширования данных представления"""
+
+    def __init__(self, name, ttl, per_user=False, depends=()):
+        self.name = name
+        self.ttl = ttl  # Время жизни записи (секунды)
+        self.per_user = per_user  # Отдельная запись для каждого пользователя
+        self.depends = tuple(depends)  # Пространства, при изменении которых запись устаревает
+
+
+class ResponseCache:
+    """
+    Кэш вычисляемых данных представлений с подключаемым хранилищем
+
+    Каждое представление объявляет политику: время жизни, разделение по
+    пользователям и пространства инвалидации ('conversions', 'setups', ...).
+    Инвалидация меняет версию пространства, поэтому устаревшие записи
+    просто перестают находиться и вытесняются по TTL/LRU.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryCacheBackend()
+        self.policies = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Выбор хранилища по настройкам приложения
+
+        RESPONSE_CACHE_BACKEND: 'memory', 'sqlite' или 'null'. Без настройки - 'memory';
+        Config по умолчанию выбирает 'sqlite', если включены фоновые задания
+        """
+        backend_name = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('RESPONSE_CACHE_SIZE', 1024)
+
+        if backend_name == 'sqlite':
+            path = app.config.get('RESPONSE_CACHE_PATH') or os.path.join(app.instance_path, 'cache.db')
+            try:
+                self.backend = SQLiteCacheBackend(path, max_entries=max_entries)
+            except sqlite3.Error as e:
+                logger.error(f"Не удалось открыть файл кэша {path}, используется кэш в памяти: {str(e)}")
+                self.backend = MemoryCacheBackend(max_entries)
+        elif backend_name == 'null':
+            self.backend = NullCacheBackend()
+        else:
+            self.backend = MemoryCacheBackend(max_entries)
+
+        app.extensions['response_cache'] = self
+
+    def policy(self, name, ttl, per_user=False, depends=()):
+        """
+        Объявление политики кэширования представления
+
+        Args:
+            name (str): Имя представления
+            ttl (int): Время жизни записи (секунды)
+            per_user (bool): Отдельная запись для каждого пользователя
+            depends (tuple): Пространства инвалидации
+
+        Returns:
+            CachePolicy: Зарегистрированная политика
+        """
+        policy = CachePolicy(name, ttl, per_user, depends)
+        self.policies[name] = policy
+        with self._stats_lock:
+            self._stats.setdefault(name, {'hits': 0, 'misses': 0})
+        return policy
+
+    @staticmethod
+    def _version_key(namespace, user_id=None):
+        if user_id is None:
+            return f'{VERSION_PREFIX}{namespace}'
+        return f'{VERSION_PREFIX}{namespace}:user:{user_id}'
+
+    def _versions(self, policy, user_id):
+        """Текущие версии пространств, от которых зависит запись"""
+        keys = [
+            self._version_key(namespace, user_id if policy.per_user else None)
+            for namespace in policy.depends
+        ]
+        found = self.backend.get_many(keys)
+
+        versions = []
+        for key in keys:
+            version = found.get(key)
+            if version is None:
+                # Версия неизвестна (новое хранилище или вытеснена) - начинаем новую,
+                # чтобы не вернуть записи, сохраненные при прежней версии
+                version = self._new_version()
+                self.backend.set(key, version)
+            versions.append(version)
+        return versions
+
+    @staticmethod
+    def _new_version():
+        return uuid.uuid4().hex[:12]
+
+    def _record(self, name, hit):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {'hits': 0, 'misses': 0})
+            stats['hits' if hit else 'misses'] += 1
+
+    def get_or_set(self, name, loader, user_id=None, params=None):
+        """
+        Получение данных представления из кэша или их вычисление
+
+        Args:
+            name (str): Имя представления с объявленной политикой
+            loader (callable): Функция вычисления данных (результат должен сериализоваться в JSON)
+            user_id (int, optional): ID пользователя для политик per_user
+            params (dict, optional): Параметры запроса, влияющие на результат
+
+        Returns:
+            Данные представления (кортежи возвращаются списками)
+        """
+        policy = self.policies[name]
+
+        try:
+            versions = self._versions(policy, user_id)
+            key_parts = [name, '.'.join(versions)]
+            if policy.per_user:
+                key_parts.append(f'user:{user_id}')
+            if params:
+                key_parts.append(json.dumps(params, sort_keys=True, default=str))
+            key = '|'.join(key_parts)
+
+            cached = self.backend.get_many([key]).get(key)
+        except Exception as e:
+            # Недоступность кэша не должна ломать страницу
+            logger.error(f"Ошибка чтения кэша {name}: {str(e)}")
+            self._record(name, False)
+            return loader()
+
+        if cached is not None:
+            self._record(name, True)
+            return json.loads(cached)
+
+        self._record(name, False)
+        value = loader()
+        # Сериализация и обратное чтение дают одинаковый результат для всех хранилищ
+        serialized = json.dumps(value, default=str)
+
+        try:
+            self.backend.set(key, serialized, policy.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка записи кэша {name}: {str(e)}")
+
+        return json.loads(serialized)
+
+    def invalidate(self, namespace, user_id=None):
+        """
+        Инвалидация данных, зависящих от пространства
+
+        Меняет общую версию пространства и, если указан пользователь,
+        его персональную версию.
+
+        Args:
+            namespace (str): Пространство ('conversions', 'setups', 'tokens', 'users')
+            user_id (int, optional): ID пользователя, чьи данные изменились
+        """
+        try:
+            self.backend.set(self._version_key(namespace), self._new_version())
+            if user_id is not None:
+                self.backend.set(self._version_key(namespace, user_id), self._new_version())
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации кэша {namespace}: {str(e)}")
+
+    def clear(self):
+        """Удаление всех записей кэша"""
+        self.backend.clear()
+
+    def get_stats(self):
+        """
+        Статистика попаданий по представлениям в текущем процессе
+
+        Returns:
+            dict: Хранилище, количество записей и список по политикам
+        """
+        with self._stats_lock:
+            snapshot = {name: dict(stats) for name, stats in self._stats.items()}
+
+        views = []
+        for name, stats in sorted(snapshot.items()):
+            total = stats['hits'] + stats['misses']
+            policy = self.policies.get(name)
+            views.append({
+                'name': name,
+                'ttl': policy.ttl if policy else None,
+                'per_user': policy.per_user if policy else False,
+                'depends': ', '.join(policy.depends) if policy else '',
+                'hits': stats['hits'],
+                'misses': stats['misses'],
+                'hit_rate': round(stats['hits'] * 100.0 / total, 1) if total else 0.0
+            })
+
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+
+        return {'backend': self.backend.name, 'size': size, 'views': views}
@@ -0,0 +1,279 @@
+import heapq
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import request
+from sqlalchemy import event, func
+from app.extensions import db
+from app.models.profile import SQLProfileSample
+
+logger = logging.getLogger(__name__)
+
+# Сколько самых медленных запросов хранится в замере
+SLOWEST_STATEMENTS = 5
+# Длина текста запроса в замере (параметры не сохраняются)
+STATEMENT_LENGTH = 500
+# Атрибут контекста выполнения с временем начала запроса
+_STARTED_ATTR = '_sql_profiler_started'
+
+
+class QueryTrace:
+    """Счетчики SQL запросов одного запроса HTTP или задания"""
+
+    __slots__ = ('kind', 'name', 'sampled', 'statements', 'db_time', 'slowest', 'started', '_sequence')
+
+    def __init__(self, kind, name, sampled=False):
+        self.kind = kind
+        self.name = name
+        self.sampled = sampled
+        self.statements = 0
+        self.db_time = 0.0
+        self.slowest = []  # Куча (время, порядковый номер, текст)
+        self.started = time.perf_counter()
+        self._sequence = 0
+
+    def record(self, statement, elapsed):
+        self.statements += 1
+        self.db_time += elapsed
+        self._sequence += 1
+
+        # Куча ограничена SLOWEST_STATEMENTS: быстрый запрос не копирует текст
+        item = (elapsed, self._sequence, statement)
+        if len(self.slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self.slowest, item)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    @property
+    def db_ms(self):
+        return self.db_time * 1000
+
+    @property
+    def duration_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def slowest_statements(self):
+        """Самые медленные запросы по убыванию времени"""
+        return [
+            {'sql': ' '.join(statement.split())[:STATEMENT_LENGTH], 'ms': round(elapsed * 1000, 2)}
+            for elapsed, _, statement in sorted(self.slowest, reverse=True)
+        ]
+
+
+class SQLProfiler:
+    """
+    Число и время SQL запросов каждого запроса HTTP и фонового задания
+
+    Запросы учитываются событиями курсора SQLAlchemy в замере текущего
+    потока. Счетчики ведутся всегда (их стоимость - два вызова perf_counter
+    на запрос) и отдаются в заголовке Server-Timing. В БД сохраняется только
+    выборка: доля SQL_PROFILER_SAMPLE_RATE замеров и все замеры, в которых
+    запросы заняли не меньше SQL_PROFILER_SLOW_MS. Замеры всех процессов
+    (воркеры gunicorn, планировщик) собираются в одной таблице и сводятся
+    в админ-панели.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.slow_ms = 500
+        self.server_timing = True
+        self.process = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._engines = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SQL_PROFILER_ENABLED', True)
+        self.sample_rate = app.config.get('SQL_PROFILER_SAMPLE_RATE', 0.05)
+        self.slow_ms = app.config.get('SQL_PROFILER_SLOW_MS', 500)
+        self.server_timing = app.config.get('SQL_PROFILER_SERVER_TIMING', True)
+        app.extensions['sql_profiler'] = self
+        if not self.enabled:
+            return
+
+        with app.app_context():
+            self._listen(db.engine)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _listen(self, engine):
+        if engine in self._engines:
+            return
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines.add(engine)
+
+    @property
+    def current(self):
+        """Замер текущего потока (None вне запроса и задания)"""
+        return getattr(self._local, 'trace', None)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Время начала хранится в контексте выполнения: запрос с ошибкой не оставляет следов
+        if context is not None and self.current is not None:
+            setattr(context, _STARTED_ATTR, time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, _STARTED_ATTR, None)
+        trace = self.current
+        if started is not None and trace is not None:
+            trace.record(statement, time.perf_counter() - started)
+
+    def start(self, kind, name):
+        """
+        Начало замера в текущем потоке
+
+        Returns:
+            QueryTrace: Замер (предыдущий замер потока восстанавливается в finish)
+        """
+        trace = QueryTrace(kind, name[:100], sampled=random.random() < self.sample_rate)
+        trace_stack = self._local.__dict__.setdefault('stack', [])
+        trace_stack.append(self.current)
+        self._local.trace = trace
+        return trace
+
+    def finish(self, trace, status=None):
+        """
+        Завершение замера и сохранение выборки
+
+        Args:
+            trace (QueryTrace): Замер из start
+            status (int): HTTP статус ответа
+        """
+        if self.current is not trace:
+            return
+        parent = self._local.stack.pop() if self._local.stack else None
+        self._local.trace = parent
+        if parent is not None:
+            # Вложенный замер (задание, выполненное в запросе) входит и во внешний
+            parent.statements += trace.statements
+            parent.db_time += trace.db_time
+
+        if trace.sampled or trace.db_ms >= self.slow_ms:
+            self._save(trace, status)
+
+    def _save(self, trace, status=None):
+        # Запись идет отдельным соединением и не попадает в замер
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(SQLProfileSample.__table__.insert().values(
+                    kind=trace.kind,
+                    name=trace.name,
+                    statements=trace.statements,
+                    db_ms=round(trace.db_ms, 2),
+                    duration_ms=round(trace.duration_ms, 2),
+                    status=status,
+                    slowest=json.dumps(trace.slowest_statements()),
+                    process=self.process,
+                    created_at=datetime.utcnow()
+                ))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить замер SQL {trace.kind} {trace.name}: {str(e)}")
+
+    @contextmanager
+    def trace(self, kind, name):
+        """
+        Замер блока кода (фоновые задания, задания планировщика)
+
+        Пример:
+            with sql_profiler.trace('job', 'check_campaign'):
+                ...
+
+        Yields:
+            QueryTrace: Замер (None, если профилирование выключено)
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        trace = self.start(kind, name)
+        try:
+            yield trace
+        finally:
+            self.finish(trace)
+
+    def _before_request(self):
+        if request.endpoint != 'static':
+            # Без endpoint (404) - одно имя, чтобы адреса сканеров не плодили строки сводки
+            self.start('request', request.endpoint or 'unmatched')
+
+    def _after_request(self, response):
+        trace = self.current
+        if trace is None or trace.kind != 'request':
+            return response
+
+        if self.server_timing:
+            response.headers.add(
+                'Server-Timing', f'db;dur={trace.db_ms:.1f};desc="{trace.statements} SQL"'
+            )
+        self.finish(trace, response.status_code)
+        return response
+
+    def _teardown_request(self, exc=None):
+        # Ответ не сформирован (ошибка до after_request) - замер сбрасывается
+        trace = self.current
+        if trace is not None and trace.kind == 'request':
+            self.finish(trace, 500)
+
+
+sql_profiler = SQLProfiler()
+
+
+def get_profile_summary(since):
+    """
+    Сводка замеров по запросам и заданиям
+
+    Args:
+        since (datetime): Начало периода (UTC)
+
+    Returns:
+        list: Словари по (kind, name), по убыванию суммарного времени БД
+    """
+    table = SQLProfileSample.__table__
+    total_db_ms = func.sum(table.c.db_ms)
+    rows = db.session.execute(
+        db.select(
+            table.c.kind,
+            table.c.name,
+            func.count().label('samples'),
+            func.avg(table.c.statements).label('avg_statements'),
+            func.max(table.c.statements).label('max_statements'),
+            func.avg(table.c.db_ms).label('avg_db_ms'),
+            func.max(table.c.db_ms).label('max_db_ms'),
+            func.avg(table.c.duration_ms).label('avg_duration_ms'),
+            total_db_ms.label('total_db_ms')
+        )
+        .where(table.c.created_at >= since)
+        .group_by(table.c.kind, table.c.name)
+        .order_by(total_db_ms.desc())
+    ).all()
+    return [dict(row._mapping) for row in rows]
+
+
+def get_slowest_samples(since, limit=20):
+    """Замеры с наибольшим временем БД за период"""
+    return (SQLProfileSample.query
+            .filter(SQLProfileSample.created_at >= since)
+            .order_by(SQLProfileSample.db_ms.desc())
+            .limit(limit)
+            .all())
+
+
+def purge_samples(retention_days, now=None):
+    """Удаление замеров старше retention_days дней"""
+    now = now or datetime.utcnow()
+    table = SQLProfileSample.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            table.delete().where(table.c.created_at < now - timedelta(days=retention_days))
+        ).rowcount
@@ -1,17 +1,35 @@
 import logging
-import os
-import socket
 import requests
 import json
-from facebook_business.api import FacebookAdsApi
-from facebook_business.adobjects.adaccount import AdAccount
-from facebook_business.adobjects.campaign import Campaign
-from facebook_business.exceptions import FacebookRequestError
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.extensions import db
 
 logger = logging.getLogger(__name__)
 
+GRAPH_API_URL = 'https://graph.facebook.com/v18.0'
+ACCOUNT_FIELDS = 'name,account_status'
+ACCOUNT_CHECK_TIMEOUT = 30
+
+# Graph API принимает до 50 ID в одном запросе ?ids=
+MULTI_ID_CHUNK_SIZE = 50
+# Одновременных запросов при проверке одного токена
+CHECK_MAX_WORKERS = 4
+
+# Коды ошибок, относящиеся к токену, а не к отдельному аккаунту
+# (190 - токен недействителен, 102 - сессия, 10 - разрешения приложения)
+TOKEN_ERROR_CODES = {190, 102, 10}
+# Ограничение скорости: токен принят, но запросы временно отклоняются
+RATE_LIMIT_ERROR_CODES = {4, 17, 32, 613, 80004}
+# Таймаут или ошибка соединения (ответа Graph API нет)
+NETWORK_ERROR = 'network'
+# Ошибки, при которых доступ к аккаунту не проверен, а не отклонен
+UNVERIFIED_ERROR_CODES = RATE_LIMIT_ERROR_CODES | {NETWORK_ERROR}
+
 class TokenChecker:
-    def __init__(self):
+    def __init__(self, token=None):
+        self.token = token
         self.logger = logger
     
     def _parse_fb_error(self, response_text):
@@ -50,173 +68,285 @@ class TokenChecker:
         except Exception as e:
             return f"Не удалось распознать ошибку API: {response_text[:200]}"
     
+    def _account_request_error(self, response):
+        """
+        Разбор ответа Graph API с ошибкой
+
+        Returns:
+            tuple: (код ошибки или None, понятное сообщение)
+        """
+        try:
+            code = response.json().get('error', {}).get('code')
+        except ValueError:
+            code = None
+        if response.text:
+            return code, self._parse_fb_error(response.text)
+        return code, f"Ошибка API: код {response.status_code}"
+
+    def _fetch_single_account(self, session, token_obj, account_id):
+        """
+        Запрос одного аккаунта (когда запрос пачкой отклонен целиком)
+
+        Returns:
+            dict: Состояние аккаунта (name, status, accessible, error, error_code)
+        """
+        try:
+            response = session.get(
+                f'{GRAPH_API_URL}/{account_id}',
+                params={
+                    'access_token': token_obj.access_token,
+                    'fields': ACCOUNT_FIELDS
+                },
+                timeout=ACCOUNT_CHECK_TIMEOUT
+            )
+        except requests.exceptions.Timeout:
+            return {'name': None, 'status': None, 'accessible': False, 'error_code': NETWORK_ERROR,
+                    'error': f"Превышено время ожидания при проверке аккаунта {account_id}"}
+        except requests.exceptions.RequestException as e:
+            return {'name': None, 'status': None, 'accessible': False, 'error_code': NETWORK_ERROR,
+                    'error': f"Ошибка соединения при проверке аккаунта {account_id}: {str(e)}"}
+
+        if response.status_code == 200:
+            account_info = response.json()
+            return {'name': account_info.get('name', 'Unknown'), 'status': account_info.get('account_status'),
+                    'accessible': True, 'error': None, 'error_code': None}
+
+        code, error_message = self._account_request_error(response)
+        return {'name': None, 'status': None, 'accessible': False, 'error': error_message, 'error_code': code}
+
+    def _fetch_account_chunk(self, session, token_obj, account_ids):
+        """
+        Запрос пачки аккаунтов одним обращением ?ids=act_1,act_2,...
+
+        Graph API отклоняет такой запрос целиком, если хотя бы один ID
+        недоступен. Тогда, если ошибка не относится к самому токену,
+        аккаунты пачки запрашиваются по одному.
+
+        Args:
+            session: requests.Session токена
+            token_obj: Объект модели FacebookToken
+            account_ids (list): ID аккаунтов с префиксом act_ (не более MULTI_ID_CHUNK_SIZE)
+
+        Returns:
+            dict: {account_id: состояние аккаунта}
+        """
+        try:
+            response = session.get(
+                f'{GRAPH_API_URL}/',
+                params={
+                    'ids': ','.join(account_ids),
+                    'access_token': token_obj.access_token,
+                    'fields': ACCOUNT_FIELDS
+                },
+                timeout=ACCOUNT_CHECK_TIMEOUT
+            )
+        except requests.exceptions.Timeout:
+            error_message = "Превышено время ожидания при проверке аккаунтов. Проверьте соединение или настройки прокси."
+            return {aid: {'name': None, 'status': None, 'accessible': False, 'error': error_message, 'error_code': NETWORK_ERROR}
+                    for aid in account_ids}
+        except requests.exceptions.RequestException as e:
+            error_message = f"Ошибка соединения при проверке аккаунтов: {str(e)}"
+            return {aid: {'name': None, 'status': None, 'accessible': False, 'error': error_message, 'error_code': NETWORK_ERROR}
+                    for aid in account_ids}
+
+        if response.status_code == 200:
+            data = response.json()
+            results = {}
+            for aid in account_ids:
+                account_info = data.get(aid)
+                if account_info is None:
+                    results[aid] = {'name': None, 'status': None, 'accessible': False, 'error_code': None,
+                                    'error': f"Аккаунт {aid} не вернулся в ответе API"}
+                else:
+                    results[aid] = {'name': account_info.get('name', 'Unknown'),
+                                    'status': account_info.get('account_status'),
+                                    'accessible': True, 'error': None, 'error_code': None}
+            return results
+
+        code, error_message = self._account_request_error(response)
+        if code in TOKEN_ERROR_CODES or code in RATE_LIMIT_ERROR_CODES or len(account_ids) == 1:
+            # Ошибка самого токена или лимит - отдельные запросы дадут тот же результат
+            return {aid: {'name': None, 'status': None, 'accessible': False, 'error': error_message, 'error_code': code}
+                    for aid in account_ids}
+
+        self.logger.info(f"Запрос пачки из {len(account_ids)} аккаунтов отклонен ({error_message}), проверяем по одному")
+        return {aid: self._fetch_single_account(session, token_obj, aid) for aid in account_ids}
+
+    def check_accounts(self, token_obj, account_ids):
+        """
+        Параллельная проверка доступа токена к аккаунтам
+
+        Аккаунты запрашиваются пачками по MULTI_ID_CHUNK_SIZE, пачки -
+        одновременно (не более CHECK_MAX_WORKERS запросов). Первая ошибка
+        не прерывает проверку: возвращается состояние каждого аккаунта.
+        Обращений к БД нет, поэтому метод можно вызывать вне контекста приложения.
+
+        Args:
+            token_obj: Объект модели FacebookToken
+            account_ids (list): ID аккаунтов (с префиксом act_ или без)
+
+        Returns:
+            dict: {account_id: {'name', 'status', 'accessible', 'error', 'error_code'}}
+        """
+        account_ids = list(dict.fromkeys(
+            aid if aid.startswith('act_') else f'act_{aid}' for aid in account_ids
+        ))
+        chunks = [account_ids[i:i + MULTI_ID_CHUNK_SIZE] for i in range(0, len(account_ids), MULTI_ID_CHUNK_SIZE)]
+
+        session = requests.Session()
+        if token_obj.use_proxy and token_obj.proxy_url:
+            # Прокси задается для сессии, а не через os.environ: проверки разных токенов идут параллельно
+            session.proxies = {'http': token_obj.proxy_url, 'https': token_obj.proxy_url}
+            self.logger.info(f"Используется прокси: {token_obj.proxy_url}")
+
+        results = {}
+        try:
+            if len(chunks) == 1:
+                results.update(self._fetch_account_chunk(session, token_obj, chunks[0]))
+            else:
+                with ThreadPoolExecutor(max_workers=min(CHECK_MAX_WORKERS, len(chunks))) as executor:
+                    for chunk_result in executor.map(
+                            lambda chunk: self._fetch_account_chunk(session, token_obj, chunk), chunks):
+                        results.update(chunk_result)
+        finally:
+            session.close()
+
+        return results
+
+    def get_token_account_ids(self, token_obj):
+        """
+        ID аккаунтов, которые нужно проверить для токена
+
+        Args:
+            token_obj: Объект модели FacebookToken
+
+        Returns:
+            list: ID аккаунтов (пустой, если аккаунты не указаны)
+        """
+        # Получаем список ID аккаунтов (может быть несколько через запятую)
+        account_ids = [aid.strip() for aid in token_obj.get_account_ids()]
+
+        # Если у токена еще нет аккаунтов, берем из полей
+        if not account_ids and hasattr(token_obj, 'account_id'):
+            raw_account_ids = token_obj.account_id
+            if raw_account_ids:
+                account_ids = [aid.strip() for aid in raw_account_ids.split(',')]
+
+        return account_ids
+
     def check_token(self, token_obj):
         """
         Проверяет валидность токена Facebook и получает информацию о связанных аккаунтах
-        
+
+        Все аккаунты проверяются за один проход (см. check_accounts).
+        Токен недействителен, если Graph API отклонил сам токен или
+        ни один аккаунт не доступен; недоступные аккаунты при валидном
+        токене перечисляются в сообщении и помечаются неактивными.
+
         Args:
             token_obj: Объект модели FacebookToken
-            
+
         Returns:
             tuple: (status, error_message, accounts_data)
                 status: 'valid' или 'invalid'
                 error_message: Сообщение об ошибке или None
-                accounts_data: Словарь с данными аккаунтов или None
+                accounts_data: Словарь с состоянием каждого аккаунта или None
         """
         self.logger.info(f"Начало проверки токена {token_obj.id} ({token_obj.name})")
         self.logger.info(f"Токен: {token_obj.access_token[:15]}...")
-        
+
         try:
-            # Настройка прокси через переменные окружения, если указан
-            if token_obj.use_proxy and token_obj.proxy_url:
-                os.environ['http_proxy'] = token_obj.proxy_url
-                os.environ['https_proxy'] = token_obj.proxy_url
-                # Установка таймаута для соединения
-                socket.setdefaulttimeout(30)  # Увеличиваем до 30 секунд
-                self.logger.info(f"Используется прокси: {token_obj.proxy_url}")
-            
-            # Инициализация API без параметра session
-            api = FacebookAdsApi.init(
-                token_obj.app_id or None, 
-                token_obj.app_secret or None, 
-                token_obj.access_token,
-                api_version='v18.0'
-            )
-            
-            accounts_data = {}
-            
-            # Получаем список ID аккаунтов (может быть несколько через запятую)
-            account_ids = [aid.strip() for aid in token_obj.get_account_ids()]
-            
-            # Если у токена еще нет аккаунтов, берем из полей
-            if not account_ids and hasattr(token_obj, 'account_id'):
-                raw_account_ids = token_obj.account_id
-                if raw_account_ids:
-                    account_ids = [aid.strip() for aid in raw_account_ids.split(',')]
-            
+            account_ids = self.get_token_account_ids(token_obj)
+
             # Проверка на пустой список аккаунтов
             if not account_ids:
                 self.logger.warning(f"Для токена {token_obj.id} не указаны ID аккаунтов")
                 return ('invalid', "Не указаны ID аккаунтов", None)
-            
+
             self.logger.info(f"Проверка следующих аккаунтов: {account_ids}")
-            
-            # Проверяем каждый аккаунт
-            for account_id in account_ids:
-                # Убедимся, что ID аккаунта начинается с 'act_'
-                if not account_id.startswith('act_'):
-                    account_id = f'act_{account_id}'
-                
-                self.logger.info(f"Проверка аккаунта {account_id}")
-                
-                try:
-                    # Пробуем сначала прямой запрос к API с увеличенным таймаутом
-                    response = requests.get(
-                        f'https://graph.facebook.com/v18.0/{account_id}',
-                        params={
-                            'access_token': token_obj.access_token,
-                            'fields': 'name,account_status'
-                        },
-                        timeout=30  # 30 секунд таймаут
-                    )
-                    
-                    self.logger.info(f"Статус ответа API: {response.status_code}")
-                    
-                    if response.status_code == 200:
-                        account_info = response.json()
-                        self.logger.info(f"Получена информация об аккаунте: {account_info}")
-                        
-                        accounts_data[account_id] = {
-                            'name': account_info.get('name', 'Unknown'),
-                            'status': account_info.get('account_status')
-                        }
-                        
-                        # Добавляем или обновляем связь с аккаунтом
-                        token_obj.add_account(account_id, account_info.get('name'))
-                        self.logger.info(f"Аккаунт {account_id} ({account_info.get('name')}) доступен")
-                    elif response.status_code == 400 and 'error' in response.json():
-                        error_message = self._parse_fb_error(response.text)
-                        self.logger.error(f"Ошибка API для аккаунта {account_id}: {error_message}")
-                        return ('invalid', error_message, None)
-                    else:
-                        self.logger.error(f"Ошибка доступа к аккаунту {account_id}: {response.status_code} - {response.text}")
-                        error_message = self._parse_fb_error(response.text) if response.text else f"Ошибка API: код {response.status_code}"
-                        return ('invalid', error_message, None)
-                    
-                except requests.exceptions.Timeout:
-                    self.logger.error(f"Превышено время ожидания при проверке аккаунта {account_id}")
-                    return ('invalid', f"Превышено время ожидания при проверке аккаунта {account_id}. Проверьте соединение или настройки прокси.", None)
-                except requests.exceptions.ConnectionError:
-                    self.logger.error(f"Ошибка соединения при проверке аккаунта {account_id}")
-                    return ('invalid', f"Ошибка соединения при проверке аккаунта {account_id}. Проверьте доступность сети или настройки прокси.", None)
-                except Exception as e:
-                    self.logger.error(f"Неизвестная ошибка при прямом запросе: {str(e)}")
-                    
-                    # Пробуем использовать SDK, если прямой запрос не сработал
-                    try:
-                        self.logger.info(f"Пробуем проверить аккаунт {account_id} через SDK")
-                        account = AdAccount(account_id)
-                        account_info = account.api_get(fields=['name', 'account_status'])
-                        
-                        accounts_data[account_id] = {
-                            'name': account_info.get('name', 'Unknown'),
-                            'status': account_info.get('account_status')
-                        }
-                        
-                        # Добавляем или обновляем связь с аккаунтом
-                        token_obj.add_account(account_id, account_info.get('name'))
-                        self.logger.info(f"Аккаунт {account_id} ({account_info.get('name')}) доступен через SDK")
-                    except FacebookRequestError as fb_error:
-                        error_code = fb_error.api_error_code()
-                        error_message = fb_error.api_error_message()
-                        
-                        # Обработка конкретных ошибок API
-                        if error_code == 190:  # Недействительный токен доступа
-                            self.logger.error(f"Токен доступа недействителен: {error_message}")
-                            return ('invalid', f"Токен доступа недействителен: {error_message}", None)
-                        else:
-                            self.logger.error(f"Ошибка Facebook API [{error_code}]: {error_message}")
-                            return ('invalid', f"Ошибка Facebook API: {error_message}", None)
-                    except Exception as sdk_error:
-                        self.logger.error(f"Ошибка при проверке аккаунта {account_id} через SDK: {str(sdk_error)}")
-                        # Если не удалось проверить хотя бы один аккаунт, считаем это ошибкой
-                        return ('invalid', f"Ошибка при проверке аккаунта {account_id}: {str(sdk_error)}", None)
-            
-            # Если запрос успешен, токен валиден
-            self.logger.info(f"Токен {token_obj.id} успешно проверен, найдено {len(accounts_data)} аккаунтов")
-            return ('valid', None, accounts_data)
-            
-        except FacebookRequestError as e:
-            error_code = e.api_error_code()
-            error_message = e.api_error_message()
-            
-            # Обработка конкретных ошибок API
-            if error_code == 190:  # Недействительный токен доступа
-                error_message = "Токен доступа недействителен или истек срок его действия"
-            elif error_code == 200:  # Ограничение разрешений
-                error_message = "Недостаточно разрешений для доступа к рекламным аккаунтам. Требуются разрешения ads_management и ads_read."
-            
-            self.logger.error(f"Token {token_obj.id} ({token_obj.name}) check failed: {error_message}")
-            return ('invalid', error_message, None)
-            
-        except requests.exceptions.Timeout:
-            error_message = "Превышено время ожидания при соединении с Facebook API. Проверьте соединение или настройки прокси."
-            self.logger.error(f"Token {token_obj.id} ({token_obj.name}) check failed: {error_message}")
-            return ('invalid', error_message, None)
-            
-        except requests.exceptions.ConnectionError:
-            error_message = "Ошибка соединения с Facebook API. Проверьте доступность сети или настройки прокси."
-            self.logger.error(f"Token {token_obj.id} ({token_obj.name}) check failed: {error_message}")
-            return ('invalid', error_message, None)
-            
+            accounts_data = self.check_accounts(token_obj, account_ids)
+
+            return self.apply_account_results(token_obj, accounts_data)
+
         except Exception as e:
             error_message = f"Ошибка проверки токена: {str(e)}"
             self.logger.error(f"Token {token_obj.id} ({token_obj.name}) check failed: {error_message}")
             return ('invalid', error_message, None)
-    
+
+    def apply_account_results(self, token_obj, accounts_data):
+        """
+        Определяет статус токена по результатам check_accounts и обновляет связи с аккаунтами
+
+        Изменения остаются в сессии, фиксирует их вызывающий код.
+
+        Args:
+            token_obj: Объект модели FacebookToken
+            accounts_data (dict): Результат check_accounts
+
+        Returns:
+            tuple: (status, error_message, accounts_data) - как у check_token
+        """
+        # Ошибка самого токена одинакова для всех аккаунтов
+        token_errors = [data for data in accounts_data.values() if data['error_code'] in TOKEN_ERROR_CODES]
+        if token_errors:
+            error_message = token_errors[0]['error']
+            self.logger.error(f"Token {token_obj.id} ({token_obj.name}) check failed: {error_message}")
+            return ('invalid', error_message, None)
+
+        accessible = {aid: data for aid, data in accounts_data.items() if data['accessible']}
+        failed = {aid: data for aid, data in accounts_data.items() if not data['accessible']}
+
+        # Добавляем или обновляем связь с аккаунтами
+        for account_id, data in accounts_data.items():
+            if data['accessible']:
+                account = token_obj.add_account(account_id, data['name'])
+                account.is_active = True
+            elif data['error_code'] not in UNVERIFIED_ERROR_CODES:
+                # При превышении лимита или сбое сети доступ не проверен - связь не трогаем
+                self.logger.error(f"Ошибка доступа к аккаунту {account_id}: {data['error']}")
+                existing = token_obj.accounts.filter_by(account_id=account_id).first()
+                if existing:
+                    existing.is_active = False
+                    existing.last_checked = datetime.utcnow()
+
+        if not accessible:
+            first_error = next(iter(failed.values()))['error']
+            if all(data['error_code'] in UNVERIFIED_ERROR_CODES for data in failed.values()):
+                if any(data['error_code'] in RATE_LIMIT_ERROR_CODES for data in failed.values()):
+                    # Graph API принял токен, но отклонил запросы по лимиту
+                    return ('valid', first_error, accounts_data)
+                # Graph API недоступен - кратковременный сбой не должен менять статус валидного токена
+                return ('valid' if token_obj.status == 'valid' else 'invalid', first_error, accounts_data)
+            return ('invalid', first_error, None)
+
+        self.logger.info(f"Токен {token_obj.id} успешно проверен, доступно {len(accessible)} из {len(accounts_data)} аккаунтов")
+        if failed:
+            error_message = "Нет доступа к аккаунтам: " + "; ".join(
+                f"{aid} - {data['error']}" for aid, data in failed.items()
+            )
+            return ('valid', error_message, accounts_data)
+
+        return ('valid', None, accounts_data)
+
+    def check_and_update_token(self, token_obj=None):
+        """
+        Проверяет токен и сохраняет результат (статус, ошибку, аккаунты)
+
+        Args:
+            token_obj: Объект модели FacebookToken (по умолчанию - переданный в конструктор)
+
+        Returns:
+            bool: True, если токен валиден
+        """
+        token_obj = token_obj or self.token
+        status, error_message, _ = self.check_token(token_obj)
+        token_obj.update_status(status, error_message)
+        db.session.commit()
+        return status == 'valid'
+
     def fetch_campaigns(self, token_obj, account_id=None):
         """
-        Получает список кампаний для указанного аккаунта
+        Получает все кампании (во всех статусах, все страницы) для аккаунтов токена
         
         Args:
             token_obj: Объект модели FacebookToken
@@ -226,182 +356,20 @@ class TokenChecker:
             dict: Словарь с результатами по аккаунтам
                 {account_id: {'success': bool, 'campaigns': list, 'error': str}}
         """
-        from app.services.fb_api_client import FacebookAdClient
-        from facebook_business.adobjects.campaign import Campaign
-        import requests
-        import json
+        from app.services.campaign_refresh import fetch_account_campaigns
         
-        # Отладочный вывод
-        self.logger.info(f"fetch_campaigns: token_id={token_obj.id}, account_id={account_id}")
-        self.logger.info(f"Token access_token: {token_obj.access_token[:15]}...")
-        self.logger.info(f"Token accounts: {token_obj.get_account_ids()}")
+        account_ids = [account_id] if account_id else self.get_token_account_ids(token_obj)
+        snapshot = (token_obj.id, token_obj.name, token_obj.access_token,
+                    token_obj.proxy_url if token_obj.use_proxy else None)
         
         results = {}
+        for aid in account_ids:
+            aid = aid if aid.startswith('act_') else f'act_{aid}'
+            try:
+                campaigns = fetch_account_campaigns(snapshot, aid, time.monotonic() + ACCOUNT_CHECK_TIMEOUT * 4)
+                results[aid] = {'success': True, 'campaigns': campaigns, 'error': None}
+            except Exception as e:
+                self.logger.error(f"Ошибка получения кампаний аккаунта {aid} токеном {token_obj.id}: {str(e)}")
+                results[aid] = {'success': False, 'campaigns': [], 'error': str(e)}
         
-        try:
-            # Определяем список аккаунтов для проверки
-            if account_id:
-                if not account_id.startswith('act_'):
-                    account_id = f'act_{account_id}'
-                account_ids = [account_id]
-            else:
-                account_ids = token_obj.get_account_ids()
-            
-            # Проверяем, что у нас есть аккаунты для проверки
-            if not account_ids:
-                self.logger.warning(f"Для токена {token_obj.id} ({token_obj.name}) не найдены связанные аккаунты")
-                return {}
-            
-            self.logger.info(f"Получение кампаний для аккаунтов: {account_ids}")
-            
-            # Получаем кампании для каждого аккаунта
-            for aid in account_ids:
-                try:
-                    # Убедимся, что ID аккаунта начинается с 'act_'
-                    if not aid.startswith('act_'):
-                        aid = f'act_{aid}'
-                    
-                    self.logger.info(f"Запрос кампаний для аккаунта {aid} с токеном {token_obj.id}")
-                    
-                    # В первую очередь пробуем прямой запрос к API, так как это более надежный метод
-                    try:
-                        response = requests.get(
-                            f'https://graph.facebook.com/v18.0/{aid}/campaigns',
-                            params={
-                                'access_token': token_obj.access_token,
-                                'fields': 'id,name,status,objective',
-                                'limit': 100  # Увеличим лимит для получения большего числа кампаний
-                            },
-                            timeout=30  # Увеличиваем таймаут до 30 секунд
-                        )
-                        
-                        # Отладочный вывод
-                        self.logger.info(f"API response status: {response.status_code}")
-                        self.logger.info(f"API response headers: {dict(response.headers)}")
-                        
-                        if response.status_code == 200:
-                            self.logger.info(f"API response text: {response.text[:200]}...")  # Первые 200 символов
-                            self.logger.info(f"Успешный прямой запрос к API для аккаунта {aid}")
-                            data = response.json()
-                            campaigns_data = data.get('data', [])
-                            
-                            # Создаем список объектов Campaign из полученных данных
-                            campaigns = []
-                            for campaign_data in campaigns_data:
-                                # Фильтруем только активные кампании
-                                if campaign_data.get('status') == 'ACTIVE':
-                                    campaign = Campaign(campaign_data.get('id'))
-                                    # Вручную устанавливаем атрибуты
-                                    campaign['id'] = campaign_data.get('id')
-                                    campaign['name'] = campaign_data.get('name')
-                                    campaign['status'] = campaign_data.get('status')
-                                    campaign['objective'] = campaign_data.get('objective')
-                                    campaigns.append(campaign)
-                            
-                            self.logger.info(f"Для аккаунта {aid} найдено {len(campaigns)} активных кампаний из {len(campaigns_data)} через прямой запрос")
-                            
-                            # Если нет кампаний, создаем тестовую для отладки
-                            if not campaigns:
-                                self.logger.warning(f"Не найдено активных кампаний для аккаунта {aid}")
-                                
-                                # ВРЕМЕННО: Создаем тестовую кампанию для отладки интерфейса
-                                # Закомментируйте или удалите в production
-                                test_campaign = Campaign("123456789123")
-                                test_campaign['id'] = "123456789123"
-                                test_campaign['name'] = "Тестовая кампания (отладка)"
-                                test_campaign['status'] = "ACTIVE"
-                                test_campaign['objective'] = "OUTCOME_SALES"
-                                campaigns = [test_campaign]
-                                self.logger.info(f"Создана тестовая кампания для отладки")
-                            
-                            # Обновляем счетчик кампаний
-                            token_obj.update_campaign_count(aid, len(campaigns))
-                            
-                            results[aid] = {
-                                'success': True,
-                                'campaigns': campaigns,
-                                'error': None
-                            }
-                            continue  # Переходим к следующему аккаунту, так как этот успешно обработан
-                        else:
-                            error_message = self._parse_fb_error(response.text)
-                            self.logger.warning(f"Ошибка прямого запроса к API для аккаунта {aid}: {error_message}")
-                            self.logger.info(f"API response text: {response.text}")
-                            # Продолжаем выполнение и пробуем использовать SDK
-                    except Exception as direct_api_error:
-                        self.logger.warning(f"Ошибка при прямом запросе к API для аккаунта {aid}: {str(direct_api_error)}")
-                        # Продолжаем выполнение и пробуем использовать SDK
-                    
-                    # Если прямой запрос не удался, пробуем использовать SDK
-                    try:
-                        # Создаем клиент Facebook API
-                        fb_client = FacebookAdClient(token_obj=token_obj)
-                        fb_client.set_account(aid)
-                        
-                        # Получаем ВСЕ кампании и фильтруем на стороне клиента
-                        all_campaigns = fb_client.get_campaigns()
-                        
-                        if all_campaigns is None:
-                            all_campaigns = []
-                        
-                        # Фильтруем только активные на стороне клиента
-                        campaigns = []
-                        for c in all_campaigns:
-                            if hasattr(c, 'status') and c['status'] == 'ACTIVE':
-                                campaigns.append(c)
-                        
-                        self.logger.info(f"Для аккаунта {aid} найдено {len(campaigns)} активных кампаний из {len(all_campaigns)} через SDK")
-                        
-                        # Если нет кампаний, создаем тестовую для отладки
-                        if not campaigns:
-                            self.logger.warning(f"Не найдено активных кампаний для аккаунта {aid}")
-                            
-                            # ВРЕМЕННО: Создаем тестовую кампанию для отладки интерфейса
-                            # Закомментируйте или удалите в production
-                            test_campaign = Campaign("987654321")
-                            test_campaign['id'] = "987654321"
-                            test_campaign['name'] = "Тестовая кампания SDK (отладка)"
-                            test_campaign['status'] = "ACTIVE"
-                            test_campaign['objective'] = "OUTCOME_SALES"
-                            campaigns = [test_campaign]
-                            self.logger.info(f"Создана тестовая кампания для отладки через SDK")
-                        
-                        # Обновляем счетчик кампаний
-                        token_obj.update_campaign_count(aid, len(campaigns))
-                        
-                        results[aid] = {
-                            'success': True,
-                            'campaigns': campaigns,
-                            'error': None
-                        }
-                    except Exception as sdk_error:
-                        self.logger.error(f"Ошибка при получении кампаний через SDK для аккаунта {aid}: {str(sdk_error)}")
-                        results[aid] = {
-                            'success': False,
-                            'campaigns': [],
-                            'error': str(sdk_error)
-                        }
-                except Exception as account_error:
-                    self.logger.error(f"Ошибка при обработке аккаунта {aid}: {str(account_error)}")
-                    results[aid] = {
-                        'success': False,
-                        'campaigns': [],
-                        'error': str(account_error)
-                    }
-            
-            # Итоговый результат
-            success_count = sum(1 for result in results.values() if result['success'])
-            campaign_count = sum(len(result['campaigns']) for result in results.values() if result['success'])
-            self.logger.info(f"Всего получено {campaign_count} кампаний из {len(results)} аккаунтов (успешно: {success_count})")
-            
-            return results
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка получения кампаний для токена {token_obj.id}: {str(e)}")
-            
-            # Если был указан конкретный аккаунт, возвращаем ошибку для него
-            if account_id:
-                return {account_id: {'success': False, 'campaigns': [], 'error': str(e)}}
-            
-            # Иначе возвращаем пустой результат
-            return {}
\ No newline at end of file
+        return results
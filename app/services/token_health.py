@@ -0,0 +1,165 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from app.extensions import db, response_cache
+from app.models.token import FacebookToken, FacebookTokenAccount
+from app.services.token_checker import TokenChecker
+from app.services.token_router import token_router
+
+logger = logging.getLogger(__name__)
+
+# Сколько токенов проверяется за один запуск задания
+HEALTH_BATCH_SIZE = 50
+# Одновременно проверяемых токенов (у каждого еще до 4 запросов, см. TokenChecker)
+HEALTH_MAX_WORKERS = 8
+
+# Валидный токен с недоступными аккаунтами проверяется чаще обычного
+WARNING_INTERVAL_DIVISOR = 3
+# Недействительный токен: первая повторная проверка и предел экспоненциальной паузы
+INVALID_RETRY_MINUTES = 30
+INVALID_RETRY_MAX = timedelta(hours=24)
+
+
+def check_interval(token, base_interval=None):
+    """
+    Пауза между проверками токена с учетом истории ошибок
+
+    Новый токен проверяется сразу, валидный - раз в base_interval,
+    валидный с недоступными аккаунтами - в WARNING_INTERVAL_DIVISOR раз чаще.
+    Недействительный токен перепроверяется с удвоением паузы после
+    каждой неудачной проверки подряд (пользователь мог продлить доступ).
+
+    Args:
+        token: Объект модели FacebookToken
+        base_interval (timedelta, optional): Интервал для валидного токена
+
+    Returns:
+        timedelta: Пауза после last_checked
+    """
+    if base_interval is None:
+        base_interval = timedelta(minutes=current_app.config.get('TOKEN_HEALTH_INTERVAL_MINUTES', 60))
+
+    if token.status == 'invalid':
+        failures = max(token.failed_checks or 1, 1)
+        # Степень ограничена, чтобы не вычислять огромные паузы для давно сломанных токенов
+        delay = timedelta(minutes=INVALID_RETRY_MINUTES) * (2 ** min(failures - 1, 10))
+        return min(delay, INVALID_RETRY_MAX)
+    if token.status == 'valid':
+        if token.error_message:
+            return base_interval / WARNING_INTERVAL_DIVISOR
+        return base_interval
+    return timedelta(0)
+
+
+def get_due_tokens(now=None, limit=HEALTH_BATCH_SIZE):
+    """
+    Активные токены, которым пора на проверку
+
+    Первыми идут непроверенные и валидные токены (их использует
+    планировщик), затем недействительные; внутри группы - дольше
+    всего ожидающие проверки.
+
+    Returns:
+        list: Объекты FacebookToken (не более limit)
+    """
+    now = now or datetime.utcnow()
+    base_interval = timedelta(minutes=current_app.config.get('TOKEN_HEALTH_INTERVAL_MINUTES', 60))
+
+    due = []
+    for token in FacebookToken.query.filter(FacebookToken.is_active == True).all():
+        if token.last_checked is None:
+            due.append((0, datetime.min, token))
+            continue
+        next_check = token.last_checked + check_interval(token, base_interval)
+        if next_check <= now:
+            due.append((1 if token.status == 'invalid' else 0, next_check, token))
+
+    due.sort(key=lambda item: (item[0], item[1]))
+    return [token for _, _, token in due[:limit]]
+
+
+def _load_account_ids(tokens):
+    """ID аккаунтов всех токенов одним запросом"""
+    account_ids = {token.id: [] for token in tokens}
+    rows = (db.session.query(FacebookTokenAccount.token_id, FacebookTokenAccount.account_id)
+            .filter(FacebookTokenAccount.token_id.in_(list(account_ids)))
+            .order_by(FacebookTokenAccount.id)
+            .all())
+    for token_id, account_id in rows:
+        account_ids[token_id].append(account_id.strip())
+    return account_ids
+
+
+def run_token_health_checks(now=None, limit=HEALTH_BATCH_SIZE):
+    """
+    Фоновая перепроверка токенов пачкой
+
+    Запросы к Graph API для разных токенов выполняются параллельно
+    (проверка аккаунтов одного токена - запросами ?ids=, см.
+    TokenChecker.check_accounts), результаты записываются в БД одной
+    транзакцией в текущем потоке. Токены, потерявшие доступ, получают
+    статус invalid и перестают выбираться find_suitable_token.
+
+    Args:
+        now (datetime, optional): Текущее время (для выбора токенов)
+        limit (int): Максимум токенов за запуск
+
+    Returns:
+        dict: Количество проверенных, ставших недействительными и восстановленных токенов
+    """
+    tokens = get_due_tokens(now, limit)
+    summary = {'checked': 0, 'invalidated': 0, 'restored': 0}
+    if not tokens:
+        return summary
+
+    checker = TokenChecker()
+    account_ids = _load_account_ids(tokens)
+
+    def check(token):
+        ids = account_ids[token.id]
+        if not ids:
+            return None
+        try:
+            return checker.check_accounts(token, ids)
+        except Exception as e:
+            logger.error(f"Ошибка фоновой проверки токена {token.id}: {str(e)}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(HEALTH_MAX_WORKERS, len(tokens))) as executor:
+        results = list(executor.map(check, tokens))
+
+    checked_users = set()
+    for token, accounts_data in zip(tokens, results):
+        previous_status = token.status
+        if accounts_data is None:
+            status, error_message = 'invalid', "Не указаны ID аккаунтов"
+        elif isinstance(accounts_data, Exception):
+            status, error_message = 'invalid', f"Ошибка проверки токена: {str(accounts_data)}"
+        else:
+            status, error_message, _ = checker.apply_account_results(token, accounts_data)
+
+        token.update_status(status, error_message)
+        summary['checked'] += 1
+        checked_users.add(token.user_id)
+
+        if status != previous_status:
+            if status == 'invalid':
+                summary['invalidated'] += 1
+                logger.warning(f"Токен {token.id} ({token.name}) стал недействительным: {error_message}")
+            elif previous_status == 'invalid':
+                summary['restored'] += 1
+                logger.info(f"Токен {token.id} ({token.name}) снова действителен")
+
+    db.session.commit()
+    # Статусы и доступные аккаунты могли измениться - маршруты перечитываются
+    token_router.invalidate()
+
+    for user_id in checked_users:
+        response_cache.invalidate('tokens', user_id)
+
+    logger.info(
+        f"Проверено токенов: {summary['checked']}, недействительных: {summary['invalidated']}, "
+        f"восстановлено: {summary['restored']}"
+    )
+    return summary
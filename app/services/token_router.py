@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from app.extensions import db
+from app.models.token import FacebookToken, FacebookTokenAccount
+from app.services.token_checker import RATE_LIMIT_ERROR_CODES, TOKEN_ERROR_CODES
+
+logger = logging.getLogger(__name__)
+
+# Как часто таблица маршрутов перечитывается из facebook_token_accounts (секунды)
+ROUTES_TTL = 60
+# Пауза для токена после ограничения скорости, если Graph API не сообщил время восстановления
+THROTTLE_COOLDOWN = 300
+# Загрузка лимита (%), начиная с которой токен выбирается только при отсутствии других
+USAGE_SOFT_LIMIT = 75
+
+
+class TokenState:
+    """Состояние токена в процессе: текущие запросы, загрузка лимитов, пауза"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.usage_pct = 0
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+
+
+class TokenRouter:
+    """
+    Таблица маршрутов account_id -> токены с доступом к аккаунту
+
+    Таблица строится одним запросом по facebook_token_accounts
+    (валидные активные токены, активные связи) и перечитывается раз
+    в ROUTES_TTL секунд. Из токенов аккаунта выбирается наименее
+    загруженный: сначала токены без паузы и ниже USAGE_SOFT_LIMIT,
+    затем по числу текущих запросов, загрузке лимита по заголовкам
+    Graph API и давности последнего использования. Токен, получивший
+    ограничение скорости, уходит на паузу, отклоненный токен -
+    из таблицы до следующего перечитывания.
+
+    Состояние хранится в памяти процесса (планировщик - один процесс).
+    """
+
+    def __init__(self, ttl=ROUTES_TTL):
+        self.ttl = ttl
+        self._routes = {}
+        self._user_tokens = {}
+        self._loaded_at = None
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Перечитывает таблицу маршрутов из БД"""
+        rows = (db.session.query(FacebookTokenAccount.account_id, FacebookToken.id, FacebookToken.user_id)
+                .join(FacebookToken, FacebookToken.id == FacebookTokenAccount.token_id)
+                .filter(FacebookToken.status == 'valid')
+                .filter(FacebookToken.is_active == True)
+                .filter(db.or_(FacebookTokenAccount.is_active == True, FacebookTokenAccount.is_active.is_(None)))
+                .all())
+
+        routes = {}
+        user_tokens = {}
+        for account_id, token_id, user_id in rows:
+            routes.setdefault(account_id, []).append((token_id, user_id))
+            if token_id not in user_tokens.setdefault(user_id, []):
+                user_tokens[user_id].append(token_id)
+
+        with self._lock:
+            self._routes = routes
+            self._user_tokens = user_tokens
+            self._loaded_at = time.monotonic()
+            # Состояние удаленных из таблицы токенов больше не нужно
+            known = {token_id for candidates in routes.values() for token_id, _ in candidates}
+            for token_id in list(self._states):
+                if token_id not in known and self._states[token_id].in_flight == 0:
+                    del self._states[token_id]
+
+        logger.debug(f"Таблица маршрутов токенов: {len(routes)} аккаунтов, {len(rows)} связей")
+
+    def invalidate(self):
+        """Таблица будет перечитана при следующем выборе токена"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+    def _state(self, token_id):
+        state = self._states.get(token_id)
+        if state is None:
+            state = self._states[token_id] = TokenState()
+        return state
+
+    def candidates(self, user_id, account_id, exclude=()):
+        """
+        Токены пользователя с доступом к аккаунту в порядке предпочтения
+
+        Args:
+            user_id (int): ID пользователя
+            account_id (str): ID рекламного аккаунта (None - любые токены пользователя)
+            exclude (iterable): ID токенов, которые не нужно предлагать
+
+        Returns:
+            list: ID токенов
+        """
+        self._ensure_fresh()
+        now = time.monotonic()
+        exclude = set(exclude)
+
+        with self._lock:
+            if account_id is None:
+                token_ids = self._user_tokens.get(user_id, [])
+            else:
+                token_ids = [token_id for token_id, owner_id in self._routes.get(account_id, ())
+                             if owner_id == user_id]
+
+            ranked = []
+            for token_id in token_ids:
+                if token_id in exclude:
+                    continue
+                state = self._state(token_id)
+                ranked.append((
+                    state.cooldown_until > now,
+                    state.usage_pct >= USAGE_SOFT_LIMIT,
+                    state.in_flight,
+                    state.usage_pct,
+                    state.last_used,
+                    token_id
+                ))
+        ranked.sort()
+        return [item[-1] for item in ranked]
+
+    def select(self, user_id, account_id, exclude=()):
+        """
+        Наименее загруженный токен пользователя для аккаунта
+
+        Returns:
+            int: ID токена или None, если токенов с доступом нет
+        """
+        ranked = self.candidates(user_id, account_id, exclude)
+        return ranked[0] if ranked else None
+
+    @contextmanager
+    def lease(self, token_id):
+        """Учет запроса, выполняемого токеном (для выбора наименее загруженного)"""
+        with self._lock:
+            state = self._state(token_id)
+            state.in_flight += 1
+            state.last_used = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+
+    def report(self, token_id, error_codes=(), usage_pct=None, regain_minutes=0):
+        """
+        Результат работы токена: загрузка лимитов и ошибки Graph API
+
+        Args:
+            token_id (int): ID токена
+            error_codes (iterable): Коды ошибок Graph API
+            usage_pct (float, optional): Загрузка лимита по заголовкам ответа
+            regain_minutes (int): Минут до восстановления доступа (по заголовкам)
+
+        Returns:
+            str: 'auth' - токен отклонен, 'throttled' - ограничение скорости, None - без ошибок
+        """
+        error_codes = set(error_codes)
+        now = time.monotonic()
+
+        with self._lock:
+            state = self._state(token_id)
+            if usage_pct is not None:
+                state.usage_pct = usage_pct
+
+            if error_codes & TOKEN_ERROR_CODES:
+                # Токен убирается из всех маршрутов до перечитывания таблицы
+                for account_id, candidates in self._routes.items():
+                    self._routes[account_id] = [item for item in candidates if item[0] != token_id]
+                for user_id, token_ids in self._user_tokens.items():
+                    self._user_tokens[user_id] = [item for item in token_ids if item != token_id]
+                logger.warning(f"Токен {token_id} отклонен Graph API (коды {sorted(error_codes)}), исключен из маршрутов")
+                return 'auth'
+
+            if error_codes & RATE_LIMIT_ERROR_CODES or regain_minutes:
+                cooldown = regain_minutes * 60 if regain_minutes else THROTTLE_COOLDOWN
+                state.cooldown_until = now + cooldown
+                logger.warning(f"Токен {token_id} достиг лимита запросов, пауза {cooldown} с")
+                return 'throttled'
+
+        return None
+
+
+token_router = TokenRouter()
@@ -0,0 +1,211 @@
+"""
+Нагрузочная проверка объединения кампаний при обновлении списка.
+
+Строит временную базу с токенами пользователя и связями с аккаунтами
+(часть аккаунтов доступна нескольким токенам), подменяет запрос к Graph API
+готовыми ответами и измеряет:
+
+- build_tasks - задачи по аккаунтам и имена аккаунтов одним запросом;
+- merge - выполнение CampaignRefresh с объединением кампаний по ID;
+- catalog - запись результата в каталог (apply_refresh) и commit.
+
+Для сравнения на части данных выполняется прежнее объединение (проверка
+повтора через any() по списку и поиск имени аккаунта перебором связей),
+время которого растет квадратично.
+
+Примеры:
+    python benchmarks/campaign_merge.py
+    python benchmarks/campaign_merge.py --campaigns 50000 --tokens 20 --legacy-campaigns 10000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask  # noqa: E402
+
+from config import Config  # noqa: E402
+from app.extensions import db, response_cache  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.token import FacebookToken, FacebookTokenAccount  # noqa: E402
+from app.models.campaign import CatalogCampaign  # noqa: E402
+from app.services import campaign_refresh  # noqa: E402
+from app.services.campaign_catalog import apply_refresh  # noqa: E402
+
+
+def build_app(database_url):
+    """Минимальное приложение с моделями и сервисами каталога (без маршрутов)"""
+    app = Flask('campaign_merge')
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['RESPONSE_CACHE_BACKEND'] = 'null'
+    db.init_app(app)
+    response_cache.init_app(app)
+    return app
+
+
+def make_dataset(campaigns, tokens, accounts, shared, seed):
+    """
+    Аккаунты с кампаниями и доступ токенов к аккаунтам
+
+    Returns:
+        tuple: (account_id -> список кампаний Graph API, token_index -> список account_id)
+    """
+    rng = random.Random(seed)
+    account_ids = [f'act_{1000000 + index}' for index in range(accounts)]
+    started = datetime(2026, 1, 1)
+
+    by_account = {account_id: [] for account_id in account_ids}
+    for index in range(campaigns):
+        account_id = account_ids[index % accounts]
+        by_account[account_id].append({
+            'id': str(23850000000000000 + index),
+            'name': f'Campaign {index}',
+            'status': rng.choice(('ACTIVE', 'ACTIVE', 'PAUSED')),
+            'objective': 'OUTCOME_SALES',
+            'updated_time': started + timedelta(seconds=index)
+        })
+
+    # Каждый аккаунт доступен одному токену, часть - еще нескольким
+    token_accounts = {index: [] for index in range(tokens)}
+    for position, account_id in enumerate(account_ids):
+        owners = {position % tokens}
+        if rng.random() < shared:
+            owners.update(rng.sample(range(tokens), min(tokens, rng.randint(1, 3))))
+        for owner in owners:
+            token_accounts[owner].append(account_id)
+
+    return by_account, token_accounts
+
+
+def legacy_merge(by_account, token_accounts):
+    """Прежнее объединение: запрос каждого аккаунта каждым токеном и поиск повтора по списку"""
+    links = {
+        token: [{'account_id': account_id, 'account_name': f'Account {account_id}'} for account_id in account_ids]
+        for token, account_ids in token_accounts.items()
+    }
+    campaign_list = []
+    for token, account_ids in token_accounts.items():
+        for account_id in account_ids:
+            account_name = next(
+                (link['account_name'] for link in links[token] if link['account_id'] == account_id), 'Unknown'
+            )
+            for campaign in by_account[account_id]:
+                if campaign['status'] != 'ACTIVE':
+                    continue
+                if not any(c['id'] == campaign['id'] for c in campaign_list):
+                    campaign_list.append({
+                        'id': campaign['id'],
+                        'name': campaign['name'],
+                        'account_id': account_id,
+                        'account_name': account_name,
+                        'token_id': token
+                    })
+    return campaign_list
+
+
+def measure(func):
+    """Процессорное и общее время вызова"""
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    result = func()
+    return result, time.process_time() - cpu_started, time.perf_counter() - wall_started
+
+
+def run(args):
+    by_account, token_accounts = make_dataset(args.campaigns, args.tokens, args.accounts, args.shared, args.seed)
+    links = sum(len(account_ids) for account_ids in token_accounts.values())
+    print(f"{args.campaigns} campaigns, {args.accounts} accounts, {args.tokens} tokens, {links} token-account links")
+
+    scratch_dir = tempfile.mkdtemp(prefix='campaign_merge_')
+    app = build_app('sqlite:///' + os.path.join(scratch_dir, 'bench.db'))
+    rows = []
+
+    try:
+        with app.app_context():
+            db.create_all()
+            user = User(username='bench', email='bench@example.com', password='bench')
+            db.session.add(user)
+            db.session.flush()
+
+            tokens = []
+            for index in range(args.tokens):
+                token = FacebookToken(user.id, f'Token {index}', f'token-{index}')
+                token.status = 'valid'
+                db.session.add(token)
+                tokens.append(token)
+            db.session.flush()
+
+            db.session.add_all([
+                FacebookTokenAccount(token_id=tokens[index].id, account_id=account_id,
+                                     account_name=f'Account {account_id}')
+                for index, account_ids in token_accounts.items()
+                for account_id in account_ids
+            ])
+            db.session.commit()
+
+            # Ответы Graph API из памяти: измеряется только работа приложения
+            campaign_refresh.fetch_account_campaigns = (
+                lambda token, account_id, deadline, since=None: by_account[account_id]
+            )
+
+            tasks, cpu, wall = measure(lambda: campaign_refresh.build_tasks(tokens))
+            rows.append(('build_tasks', len(tasks), cpu, wall))
+
+            refresh = campaign_refresh.CampaignRefresh(tasks, deadline_seconds=600)
+            _, cpu, wall = measure(refresh.run_all)
+            rows.append(('merge', len(refresh.campaigns), cpu, wall))
+
+            def save():
+                summary = apply_refresh(user.id, refresh)
+                db.session.commit()
+                return summary
+
+            summary, cpu, wall = measure(save)
+            rows.append(('catalog', CatalogCampaign.query.count(), cpu, wall))
+            print(f"summary: {summary}")
+
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if args.legacy_campaigns:
+        legacy_accounts, legacy_tokens = make_dataset(
+            args.legacy_campaigns, args.tokens, args.accounts, args.shared, args.seed
+        )
+        merged, cpu, wall = measure(lambda: legacy_merge(legacy_accounts, legacy_tokens))
+        rows.append((f'legacy@{args.legacy_campaigns}', len(merged), cpu, wall))
+
+    print(f"{'step':<18}{'items':>10}{'cpu s':>10}{'wall s':>10}")
+    for name, items, cpu, wall in rows:
+        print(f"{name:<18}{items:>10}{cpu:>10.3f}{wall:>10.3f}")
+
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark campaign merge during catalog refresh')
+    parser.add_argument('--campaigns', type=int, default=50000)
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--accounts', type=int, default=400)
+    parser.add_argument('--shared', type=float, default=0.5, help='Share of accounts available to several tokens')
+    parser.add_argument('--legacy-campaigns', type=int, default=5000,
+                        help='Campaigns for the legacy quadratic merge (0 - skip)')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    return run(parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Нагрузочный тест приема конверсий (/api/conversion/add).
+
+Поднимает приложение на отдельной (временной) базе, запускает его во
+встроенном многопоточном HTTP сервере и отправляет GET/POST постбэки с
+заданной конкурентностью. Выводит пропускную способность, перцентили
+задержки, ожидание блокировок БД и потребление памяти.
+
+С параметром --baseline результат сравнивается с сохраненным и скрипт
+завершается с кодом 1 при регрессии, поэтому его можно использовать
+как проверку в CI.
+
+Примеры:
+    python benchmarks/ingest_load.py --requests 5000 --concurrency 16
+    python benchmarks/ingest_load.py --method mixed --baseline benchmarks/baselines/ingest_sqlite.json
+    python benchmarks/ingest_load.py --database-url postgresql://bench@localhost/bench_scratch \\
+        --baseline benchmarks/baselines/ingest_postgresql.json --update-baseline
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import resource
+import string
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from config import Config, engine_options  # noqa: E402
+
+# Допустимое ухудшение относительно базовой линии (доля)
+DEFAULT_TOLERANCE = 0.15
+
+# Метрики базовой линии и направление, в котором они не должны ухудшаться
+GATED_METRICS = {
+    'throughput_rps': 'higher',
+    'latency_p50_ms': 'lower',
+    'latency_p99_ms': 'lower',
+    'rss_peak_mb': 'lower',
+}
+
+# Пул значений для постбэков: несколько префиксов и объявлений, как в реальном трафике
+REF_PREFIXES = ['abc', 'fbx', 'k12', 'zz9', 'q7w']
+FORM_IDS = [str(23850000000000000 + i) for i in range(20)]
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+]
+
+
+def percentile(values, share):
+    """Перцентиль отсортированного списка (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(share * len(values))) - 1))
+    return values[index]
+
+
+def current_rss_mb():
+    """Текущий RSS процесса (Linux), иначе - пиковый"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в килобайтах, в macOS - в байтах
+    return usage / 1024 if sys.platform != 'darwin' else usage / (1024 * 1024)
+
+
+class DBWaitMonitor:
+    """
+    Сбор времени записи в БД и ожиданий блокировок
+
+    Для SQLite ожидание блокировки входит во время выполнения записи
+    (busy_timeout), а исчерпание ожидания дает ошибку "database is locked".
+    Для PostgreSQL дополнительно опрашивается pg_locks.
+    """
+
+    WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.write_times = []
+        self.commit_times = []
+        self.lock_errors = 0
+        self.waiting_samples = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+        # Время фиксации сессии (для SQLite включает запись журнала на диск)
+        event.listen(Session, 'before_commit', self._before_commit)
+        event.listen(Session, 'after_commit', self._after_commit)
+        self._commit_started = threading.local()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['bench_started'] = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('bench_started', None)
+        if started is not None and statement.lstrip().upper().startswith(self.WRITE_PREFIXES):
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.write_times.append(elapsed)
+
+    def _before_commit(self, session):
+        self._commit_started.value = time.perf_counter()
+
+    def _after_commit(self, session):
+        started = getattr(self._commit_started, 'value', None)
+        self._commit_started.value = None
+        if started is not None:
+            with self._lock:
+                self.commit_times.append((time.perf_counter() - started) * 1000)
+
+    def _on_error(self, context):
+        if 'locked' in str(context.original_exception).lower():
+            with self._lock:
+                self.lock_errors += 1
+
+    def start(self):
+        if self.engine.dialect.name != 'postgresql':
+            return
+        self._sampler = threading.Thread(target=self._sample_pg_locks, daemon=True)
+        self._sampler.start()
+
+    def _sample_pg_locks(self):
+        while not self._stop.wait(0.1):
+            try:
+                with self.engine.connect() as connection:
+                    waiting = connection.execute(
+                        text('SELECT count(*) FROM pg_locks WHERE NOT granted')
+                    ).scalar()
+                self.waiting_samples.append(waiting or 0)
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+
+    def report(self):
+        write_times = sorted(self.write_times)
+        commit_times = sorted(self.commit_times)
+        result = {
+            'db_write_statements': len(write_times),
+            'db_write_p99_ms': round(percentile(write_times, 0.99), 2),
+            'db_write_total_ms': round(sum(write_times), 1),
+            'db_commit_p99_ms': round(percentile(commit_times, 0.99), 2),
+            'db_lock_errors': self.lock_errors,
+        }
+        if self.waiting_samples:
+            result['db_waiting_locks_max'] = max(self.waiting_samples)
+            result['db_waiting_locks_avg'] = round(sum(self.waiting_samples) / len(self.waiting_samples), 2)
+        return result
+
+
+def build_app(database_url):
+    """Создание приложения на отдельной базе с пустой схемой"""
+    from app import create_app, db
+    from app.services.conversion_search import ensure_search_index
+
+    class LoadTestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url)
+        RESPONSE_CACHE_BACKEND = 'memory'
+
+    app = create_app(LoadTestConfig)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ensure_search_index()
+
+    return app, db
+
+
+def make_postback(method):
+    """Параметры одного постбэка: метод, путь, тело и заголовки"""
+    ref_prefix = random.choice(REF_PREFIXES)
+    params = {
+        'ref': ref_prefix + ''.join(random.choices(string.ascii_lowercase + string.digits, k=8)),
+        'formid': random.choice(FORM_IDS),
+        'quid': uuid.uuid4().hex,
+    }
+    headers = {'User-Agent': random.choice(USER_AGENTS)}
+
+    if method == 'mixed':
+        method = random.choice(('get', 'post', 'json'))
+
+    if method == 'get':
+        return 'GET', f'/api/conversion/add?{urlencode(params)}', None, headers
+    if method == 'json':
+        headers['Content-Type'] = 'application/json'
+        return 'POST', '/api/conversion/add', json.dumps(params), headers
+
+    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    return 'POST', '/api/conversion/add', urlencode(params), headers
+
+
+class LoadClient:
+    """Отправка постбэков с отдельным HTTP соединением на поток"""
+
+    def __init__(self, host, port, method, timeout=30):
+        self.host = host
+        self.port = port
+        self.method = method
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def send(self, _=None):
+        """
+        Один постбэк
+
+        Returns:
+            tuple: (задержка в мс, HTTP статус или 0 при сетевой ошибке)
+        """
+        method, path, body, headers = make_postback(self.method)
+        started = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+                self._local.connection = None
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            status = 0
+        return (time.perf_counter() - started) * 1000, status
+
+
+def run_load(app, db, requests_count, concurrency, method, warmup):
+    """
+    Запуск нагрузки против приложения во встроенном сервере
+
+    Returns:
+        dict: Метрики прогона
+    """
+    # Журнал каждого запроса встроенного сервера искажает замеры
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    with app.app_context():
+        engine = db.engine
+    monitor = DBWaitMonitor(engine)
+    client = LoadClient('127.0.0.1', server.server_port, method)
+
+    try:
+        # Прогрев: соединения, кэши справочников, первые страницы БД
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client.send, range(warmup)))
+
+        monitor.start()
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(client.send, range(requests_count)))
+        elapsed = time.perf_counter() - started
+        monitor.stop()
+    finally:
+        server.shutdown()
+
+    latencies = sorted(latency for latency, status in results if status in (200, 201))
+    errors = {}
+    for _, status in results:
+        if status not in (200, 201):
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    with app.app_context():
+        stored = db.session.execute(text('SELECT COUNT(*) FROM conversions')).scalar()
+
+    metrics = {
+        'backend': engine.dialect.name,
+        'method': method,
+        'requests': requests_count,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 0.50), 2),
+        'latency_p90_ms': round(percentile(latencies, 0.90), 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99), 2),
+        'latency_max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        'errors': errors,
+        'stored_conversions': stored,
+        'rss_before_mb': round(rss_before, 1),
+        'rss_after_mb': round(current_rss_mb(), 1),
+        'rss_peak_mb': round(peak_rss_mb(), 1),
+    }
+    metrics.update(monitor.report())
+    return metrics
+
+
+def compare_with_baseline(metrics, baseline, tolerance):
+    """
+    Сравнение с базовой линией
+
+    Returns:
+        list: Описания регрессий (пустой список - регрессий нет)
+    """
+    regressions = []
+
+    if metrics['errors']:
+        regressions.append(f"errors: {metrics['errors']}")
+    if metrics['db_lock_errors'] > baseline.get('db_lock_errors', 0):
+        regressions.append(
+            f"db_lock_errors: {metrics['db_lock_errors']} > baseline {baseline.get('db_lock_errors', 0)}"
+        )
+
+    for name, direction in GATED_METRICS.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        current, expected = metrics[name], baseline[name]
+        if direction == 'higher' and current < expected * (1 - tolerance):
+            regressions.append(f"{name}: {current} < baseline {expected} (-{tolerance:.0%})")
+        if direction == 'lower' and current > expected * (1 + tolerance):
+            regressions.append(f"{name}: {current} > baseline {expected} (+{tolerance:.0%})")
+
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test for the conversion postback endpoint')
+    parser.add_argument('--database-url', help='Scratch database URL (default: temporary SQLite file). '
+                                               'All tables in it are dropped!')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of measured postbacks')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client connections')
+    parser.add_argument('--method', choices=('get', 'post', 'json', 'mixed'), default='mixed',
+                        help='Postback type: GET query, POST form, POST JSON or a random mix')
+    parser.add_argument('--warmup', type=int, default=100, help='Unmeasured warm-up postbacks')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for postback values')
+    parser.add_argument('--baseline', help='Baseline JSON file to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the result as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative regression against the baseline')
+    parser.add_argument('--output', help='Write metrics JSON to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    scratch_dir = None
+    database_url = args.database_url
+    if not database_url:
+        scratch_dir = tempfile.mkdtemp(prefix='ingest_load_')
+        database_url = 'sqlite:///' + os.path.join(scratch_dir, 'bench.db')
+
+    app, db = build_app(database_url)
+    metrics = run_load(app, db, args.requests, args.concurrency, args.method, args.warmup)
+
+    print(json.dumps(metrics, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(metrics, output, indent=2)
+
+    exit_code = 0
+    if args.baseline and args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(metrics, baseline_file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_with_baseline(metrics, baseline, args.tolerance)
+        if regressions:
+            print('REGRESSION against baseline:')
+            for regression in regressions:
+                print(f'  - {regression}')
+            exit_code = 1
+        else:
+            print('No regression against baseline.')
+
+    if scratch_dir:
+        for name in os.listdir(scratch_dir):
+            os.remove(os.path.join(scratch_dir, name))
+        os.rmdir(scratch_dir)
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
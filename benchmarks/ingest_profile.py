@@ -0,0 +1,174 @@
+"""
+Профилирование приема одной конверсии: путь через ORM (save_conversion)
+против вставки через Core (ingest_conversion).
+
+Каждый вариант выполняется на отдельной временной базе под cProfile.
+Выводится процессорное время и число SQL запросов на конверсию, а также
+самые затратные функции. Сетевая часть не участвует, поэтому разница
+отражает только работу приложения и драйвера БД.
+
+Примеры:
+    python benchmarks/ingest_profile.py --count 5000
+    python benchmarks/ingest_profile.py --count 2000 --top 25 --pstats /tmp/ingest
+"""
+
+import argparse
+import cProfile
+import io
+import os
+import pstats
+import random
+import string
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from config import Config  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models.conversion import UserAgent  # noqa: E402
+from app.services.conversion_ingest import save_conversion, ingest_conversion  # noqa: E402
+from app.services.entity_counters import register_counter_events, reconcile_counters  # noqa: E402
+
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+]
+
+
+def build_app(database_url):
+    """Минимальное приложение с моделями и сервисами приема (без маршрутов)"""
+    app = Flask('ingest_profile')
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+    register_counter_events()
+    return app
+
+
+def make_postbacks(count, seed):
+    rng = random.Random(seed)
+    return [
+        {
+            'ref': rng.choice(('abc', 'fbx', 'k12')) + ''.join(rng.choices(string.ascii_lowercase, k=8)),
+            'form_id': str(23850000000000000 + rng.randrange(20)),
+            'quid': uuid.UUID(int=rng.getrandbits(128)).hex,
+            'ip_address': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            'user_agent': rng.choice(USER_AGENTS),
+        }
+        for _ in range(count)
+    ]
+
+
+def run_variant(name, ingest, postbacks, top, pstats_prefix):
+    """
+    Прием всех постбэков одним вариантом на чистой базе
+
+    Returns:
+        dict: Процессорное время и число запросов на конверсию
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='ingest_profile_')
+    app = build_app('sqlite:///' + os.path.join(scratch_dir, 'bench.db'))
+
+    statements = [0]
+
+    # Кэш справочника User-Agent общий для процесса, а база у каждого варианта своя
+    UserAgent._ids_by_value.clear()
+    UserAgent._values_by_id.clear()
+
+    with app.app_context():
+        db.create_all()
+        reconcile_counters()
+
+        def count_statement(*args):
+            statements[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+        # Прогрев: кэш справочника User-Agent, подготовленные запросы
+        for postback in postbacks[:50]:
+            ingest(**postback)
+        statements[0] = 0
+
+        measured = postbacks[50:]
+        profiler = cProfile.Profile()
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        profiler.enable()
+        for postback in measured:
+            ingest(**postback)
+        profiler.disable()
+        cpu_elapsed = time.process_time() - cpu_started
+        wall_elapsed = time.perf_counter() - wall_started
+
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+        db.session.remove()
+        db.engine.dispose()
+
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats('cumulative').print_stats(top)
+    if pstats_prefix:
+        stats.dump_stats(f'{pstats_prefix}_{name}.pstats')
+
+    for file_name in os.listdir(scratch_dir):
+        os.remove(os.path.join(scratch_dir, file_name))
+    os.rmdir(scratch_dir)
+
+    count = len(measured)
+    return {
+        'name': name,
+        'count': count,
+        'cpu_ms_per_conversion': cpu_elapsed * 1000 / count,
+        'wall_ms_per_conversion': wall_elapsed * 1000 / count,
+        'statements_per_conversion': statements[0] / count,
+        'profile': output.getvalue(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Profile ORM vs Core conversion ingest')
+    parser.add_argument('--count', type=int, default=3000, help='Conversions per variant (incl. 50 warm-up)')
+    parser.add_argument('--top', type=int, default=15, help='Functions to show per profile')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--pstats', help='Prefix for .pstats dumps (e.g. /tmp/ingest)')
+    parser.add_argument('--quiet', action='store_true', help='Print only the summary')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    postbacks = make_postbacks(max(args.count, 51), args.seed)
+
+    # Маршрут постбэка возвращает ID, поэтому для ORM он тоже читается
+    # (после фиксации объект устарел и ID перечитывается запросом)
+    results = [
+        run_variant('orm', lambda **postback: save_conversion(**postback).id, postbacks, args.top, args.pstats),
+        run_variant('core', ingest_conversion, postbacks, args.top, args.pstats),
+    ]
+
+    if not args.quiet:
+        for result in results:
+            print(f"===== {result['name']} =====")
+            print(result['profile'])
+
+    print(f"{'variant':<8}{'cpu ms/conv':>14}{'wall ms/conv':>14}{'SQL/conv':>10}")
+    for result in results:
+        print(f"{result['name']:<8}{result['cpu_ms_per_conversion']:>14.3f}"
+              f"{result['wall_ms_per_conversion']:>14.3f}{result['statements_per_conversion']:>10.2f}")
+
+    orm, core = results
+    if orm['cpu_ms_per_conversion']:
+        reduction = 1 - core['cpu_ms_per_conversion'] / orm['cpu_ms_per_conversion']
+        print(f"CPU per conversion reduced by {reduction:.1%}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
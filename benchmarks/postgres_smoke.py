@@ -0,0 +1,358 @@
+"""
+Проверка приложения на PostgreSQL в сравнении с SQLite.
+
+Без --database-url поднимает одноразовый экземпляр PostgreSQL без
+контейнера (initdb и pg_ctl из PATH или --pg-bin) во временном каталоге
+и удаляет его по завершении. Для каждой СУБД:
+
+  1. создает схему по моделям и помечает ее последней ревизией,
+     затем откатывает и заново применяет миграции начиная с --migrate-from
+     (проверка SQL миграций на этой СУБД);
+  2. заполняет конверсии массовой вставкой (COPY для PostgreSQL,
+     executemany для SQLite) и пересчитывает производные таблицы;
+  3. вызывает тяжелые по запросам страницы и API (статистика, списки,
+     поиск, графики) и замеряет медианное время ответа.
+
+JSON ответы API сравниваются между СУБД: на одинаковых данных
+они должны совпадать. Код возврата 1 - ошибка или расхождение.
+
+Примеры:
+    python benchmarks/postgres_smoke.py --conversions 50000
+    python benchmarks/postgres_smoke.py --pg-bin /usr/lib/postgresql/16/bin
+    python benchmarks/postgres_smoke.py --database-url postgresql://bench@localhost/bench_scratch --skip-sqlite
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from config import Config, engine_options  # noqa: E402
+
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'migrations')
+
+REF_PREFIXES = ['abc', 'fbx', 'k12', 'zz9', 'q7w']
+FORM_IDS = [str(23850000000000000 + i) for i in range(30)]
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+]
+
+# Проверяемые запросы: (имя, путь, сравнивать JSON между СУБД)
+ENDPOINTS = [
+    ('stats', '/api/conversions/stats', True),
+    ('stats_prefix', '/api/conversions/stats?ref_prefix=abc', True),
+    ('api_list', '/api/conversions/list?per_page=100&with_total=1', True),
+    ('api_list_filtered', '/api/conversions/list?ref_prefix=fbx&form_id=' + FORM_IDS[3], True),
+    ('api_list_search', '/api/conversions/list?ref=abcq', True),
+    ('timeseries_day', '/api/conversions/timeseries?bucket=day', True),
+    ('timeseries_hour', '/api/conversions/timeseries?bucket=hour&ref_prefix=k12', True),
+    ('list_page', '/conversions/list', False),
+    ('prefix_page', '/conversions/prefix/abc', False),
+]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class ThrowawayPostgres:
+    """Временный кластер PostgreSQL в отдельном каталоге (initdb + pg_ctl)"""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin
+        self.directory = tempfile.mkdtemp(prefix='pg_smoke_')
+        self.data_dir = os.path.join(self.directory, 'data')
+        self.port = free_port()
+
+    def _tool(self, name):
+        path = os.path.join(self.pg_bin, name) if self.pg_bin else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise RuntimeError(f'{name} not found (install PostgreSQL or pass --pg-bin)')
+        return path
+
+    def start(self):
+        subprocess.run([self._tool('initdb'), '-D', self.data_dir, '-U', 'smoke', '-A', 'trust',
+                        '-E', 'UTF8', '--no-locale'], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._tool('pg_ctl'), '-D', self.data_dir, '-l', os.path.join(self.directory, 'pg.log'),
+                        '-o', f'-p {self.port} -k {self.directory} -c listen_addresses=127.0.0.1',
+                        '-w', 'start'], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._tool('createdb'), '-h', '127.0.0.1', '-p', str(self.port), '-U', 'smoke', 'smoke'],
+                       check=True)
+        return f'postgresql://smoke@127.0.0.1:{self.port}/smoke'
+
+    def stop(self):
+        if os.path.exists(self.data_dir):
+            subprocess.run([self._tool('pg_ctl'), '-D', self.data_dir, '-m', 'fast', '-w', 'stop'],
+                           stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def build_app(database_url, scratch_dir):
+    from app import create_app
+
+    class SmokeConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(database_url)
+        # Кэш отключен, чтобы каждый запрос доходил до БД
+        RESPONSE_CACHE_BACKEND = 'null'
+        CONVERSION_ARCHIVE_DIR = os.path.join(scratch_dir, 'archive')
+
+    return create_app(SmokeConfig)
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def prepare_schema(migrate_from):
+    """
+    Схема по моделям, отметка ревизии и повторное применение миграций
+
+    Returns:
+        dict: Время этапов (мс)
+    """
+    from flask_migrate import downgrade, stamp, upgrade
+    from app.extensions import db
+    from app.services.conversion_search import ensure_search_index
+
+    db.drop_all()
+    _, create_ms = timed(db.create_all)
+    stamp(directory=MIGRATIONS_DIR)
+    _, downgrade_ms = timed(downgrade, directory=MIGRATIONS_DIR, revision=migrate_from)
+    _, upgrade_ms = timed(upgrade, directory=MIGRATIONS_DIR)
+    search_index = ensure_search_index()
+
+    return {
+        'create_all_ms': create_ms,
+        'migrations_downgrade_ms': downgrade_ms,
+        'migrations_upgrade_ms': upgrade_ms,
+        'search_index': search_index,
+    }
+
+
+def make_rows(count, seed, today):
+    """Одинаковые для всех СУБД строки конверсий за последние 60 дней"""
+    from app.models.conversion import UserAgent
+    from app.services.conversion_ingest import prepare_conversion_row
+
+    # Кэш справочника User-Agent общий для процесса, а база у каждой СУБД своя
+    UserAgent._ids_by_value.clear()
+    UserAgent._values_by_id.clear()
+
+    rng = random.Random(seed)
+    start = datetime.combine(today - timedelta(days=59), datetime.min.time())
+    timestamps = sorted(start + timedelta(seconds=rng.randrange(60 * 86400)) for _ in range(count))
+
+    return [
+        prepare_conversion_row(
+            ref=rng.choice(REF_PREFIXES) + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=8)),
+            form_id=rng.choice(FORM_IDS),
+            quid=uuid.UUID(int=rng.getrandbits(128)).hex,
+            ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}',
+            user_agent=rng.choice(USER_AGENTS),
+            timestamp=timestamp
+        )
+        for timestamp in timestamps
+    ]
+
+
+def seed(rows):
+    """
+    Массовая вставка конверсий и пересчет производных таблиц
+
+    Returns:
+        dict: Время этапов (мс)
+    """
+    from app.extensions import db
+    from app.models.conversion import Conversion
+    from app.services.bulk_insert import bulk_insert
+    from app.services.conversion_facets import rebuild_facets
+    from app.services.conversion_timeseries import rebuild_hourly_stats
+    from app.services.entity_counters import reconcile_counters
+
+    def insert():
+        bulk_insert(Conversion, rows)
+        db.session.commit()
+
+    _, insert_ms = timed(insert)
+    _, facets_ms = timed(rebuild_facets)
+    _, hourly_ms = timed(rebuild_hourly_stats)
+    reconcile_counters()
+
+    return {
+        'bulk_insert_ms': insert_ms,
+        'bulk_insert_rows_per_s': round(len(rows) / (insert_ms / 1000)) if insert_ms else None,
+        'rebuild_facets_ms': facets_ms,
+        'rebuild_hourly_stats_ms': hourly_ms,
+    }
+
+
+def create_user():
+    from app.extensions import db
+    from app.models.user import User
+
+    user = User(username='smoke', email='smoke@example.com', password='smoke')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def run_endpoints(app, user_id, repeat):
+    """
+    Вызов страниц и API от имени пользователя
+
+    Returns:
+        tuple: (метрики по запросам, JSON ответы для сравнения)
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    metrics = {}
+    bodies = {}
+    for name, path, compare in ENDPOINTS:
+        durations = []
+        statuses = set()
+        response = None
+        for _ in range(repeat):
+            response, elapsed_ms = timed(client.get, path)
+            durations.append(elapsed_ms)
+            statuses.add(response.status_code)
+
+        metrics[name] = {
+            'status': sorted(statuses),
+            'median_ms': round(statistics.median(durations), 1),
+            'max_ms': max(durations),
+        }
+        if compare and response is not None and response.is_json:
+            bodies[name] = response.get_json()
+
+    return metrics, bodies
+
+
+def check_backend(database_url, args, today):
+    """
+    Полная проверка одной СУБД
+
+    Returns:
+        tuple: (отчет, JSON ответы)
+    """
+    from app.extensions import db
+
+    scratch_dir = tempfile.mkdtemp(prefix='smoke_app_')
+    try:
+        app = build_app(database_url, scratch_dir)
+        with app.app_context():
+            report = {'backend': db.engine.dialect.name, 'driver': db.engine.dialect.driver}
+            report.update(prepare_schema(args.migrate_from))
+            report.update(seed(make_rows(args.conversions, args.seed, today)))
+            user_id = create_user()
+
+        endpoints, bodies = run_endpoints(app, user_id, args.repeat)
+        report['endpoints'] = endpoints
+
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        return report, bodies
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def compare_bodies(reference, candidate):
+    """Расхождения JSON ответов между СУБД"""
+    differences = []
+    for name, body in reference.items():
+        if name not in candidate:
+            differences.append(f'{name}: missing response')
+        elif json.dumps(body, sort_keys=True) != json.dumps(candidate[name], sort_keys=True):
+            differences.append(f'{name}: response differs')
+    return differences
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Smoke test of query-heavy endpoints on PostgreSQL vs SQLite')
+    parser.add_argument('--database-url', help='Scratch PostgreSQL URL (all tables are dropped). '
+                                               'Default: start a throwaway cluster with initdb/pg_ctl')
+    parser.add_argument('--pg-bin', help='Directory with initdb, pg_ctl and createdb')
+    parser.add_argument('--conversions', type=int, default=20000, help='Seeded conversions')
+    parser.add_argument('--repeat', type=int, default=5, help='Requests per endpoint')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--migrate-from', default='f5a8b6c9d005',
+                        help='Revision to downgrade to before re-applying migrations')
+    parser.add_argument('--skip-sqlite', action='store_true', help='Do not run the SQLite reference')
+    parser.add_argument('--output', help='Write the report JSON to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    today = datetime.utcnow().date()
+
+    reports = []
+    responses = {}
+    cluster = None
+    sqlite_dir = None
+
+    try:
+        database_url = args.database_url
+        if not database_url:
+            cluster = ThrowawayPostgres(args.pg_bin)
+            database_url = cluster.start()
+
+        backends = [('postgresql', database_url)]
+        if not args.skip_sqlite:
+            sqlite_dir = tempfile.mkdtemp(prefix='smoke_sqlite_')
+            backends.insert(0, ('sqlite', 'sqlite:///' + os.path.join(sqlite_dir, 'smoke.db')))
+
+        for label, url in backends:
+            report, bodies = check_backend(url, args, today)
+            reports.append(report)
+            responses[label] = bodies
+    finally:
+        if cluster is not None:
+            cluster.stop()
+        if sqlite_dir:
+            shutil.rmtree(sqlite_dir, ignore_errors=True)
+
+    differences = []
+    if 'sqlite' in responses and 'postgresql' in responses:
+        differences = compare_bodies(responses['sqlite'], responses['postgresql'])
+
+    result = {'conversions': args.conversions, 'reports': reports, 'differences': differences}
+    print(json.dumps(result, indent=2, default=str))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2, default=str)
+
+    failed = [
+        f"{report['backend']} {name}: HTTP {metrics['status']}"
+        for report in reports
+        for name, metrics in report['endpoints'].items()
+        if metrics['status'] != [200]
+    ]
+    for problem in failed + differences:
+        print(f'FAIL: {problem}')
+    return 1 if failed or differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
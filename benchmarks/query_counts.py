@@ -0,0 +1,156 @@
+"""
+Проверка числа SQL запросов страниц со списками.
+
+Для каждого размера данных создается временная база с пользователем,
+его токенами (с аккаунтами), сетапами (с порогами) и назначениями кампаний,
+после чего страницы запрашиваются тестовым клиентом Flask. Число запросов
+страницы не должно зависеть от числа строк: связанные записи списков
+загружаются заранее (services/eager_loading), а не по запросу на строку.
+При расхождении скрипт выводит запросы страницы и завершается с кодом 1;
+страница, ответившая не 200, - тоже ошибка (код 1 без сравнения).
+
+Примеры:
+    python benchmarks/query_counts.py
+    python benchmarks/query_counts.py --sizes 1 10 100 --verbose
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from config import Config  # noqa: E402
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.setup import Setup, ThresholdEntry, CampaignSetup  # noqa: E402
+from app.models.token import FacebookToken, FacebookTokenAccount  # noqa: E402
+from app.services.query_stats import count_queries  # noqa: E402
+
+PAGES = ('/', '/setups', '/campaigns', '/campaigns/assign', '/auth/tokens')
+
+
+def build_app(database_url):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        RESPONSE_CACHE_BACKEND = 'null'
+        # Запись выборочного замера SQL попала бы в счетчик запросов страницы
+        SQL_PROFILER_ENABLED = False
+
+    return create_app(BenchConfig)
+
+
+def seed(size):
+    """Пользователь с size токенами, сетапами и назначениями кампаний"""
+    user = User(username='bench', email='bench@example.com', password='bench')
+    db.session.add(user)
+    db.session.flush()
+
+    for index in range(size):
+        token = FacebookToken(user.id, f'Token {index}', f'token-{index}')
+        token.status = 'valid'
+        db.session.add(token)
+        db.session.flush()
+        db.session.add_all([
+            FacebookTokenAccount(token_id=token.id, account_id=f'act_{index}{account}',
+                                 account_name=f'Account {index}-{account}', campaign_count=account)
+            for account in range(3)
+        ])
+
+        setup = Setup(f'Setup {index}', user.id)
+        db.session.add(setup)
+        db.session.flush()
+        db.session.add_all([
+            ThresholdEntry(setup_id=setup.id, spend=10.0 * (step + 1), conversions=step)
+            for step in range(3)
+        ])
+        db.session.add(CampaignSetup(user.id, setup.id, f'2385{index:013d}', f'Campaign {index}'))
+
+    db.session.commit()
+    return user.id
+
+
+def measure(size):
+    """
+    Число запросов каждой страницы при size строк в списках
+
+    Returns:
+        dict: путь -> (HTTP статус, список запросов)
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='query_counts_')
+    app = build_app('sqlite:///' + os.path.join(scratch_dir, 'bench.db'))
+    results = {}
+
+    try:
+        with app.app_context():
+            db.create_all()
+            user_id = seed(size)
+            db.session.remove()
+
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+
+            for path in PAGES:
+                # Прогрев: подготовка запросов и шаблонов не входит в измерение
+                client.get(path)
+                with count_queries() as counter:
+                    response = client.get(path)
+                results[path] = (response.status_code, counter.statements)
+
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Check that list pages issue a fixed number of SQL statements')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 25], help='Rows per list to compare')
+    parser.add_argument('--verbose', action='store_true', help='Print statements of every page')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runs = {size: measure(size) for size in args.sizes}
+
+    # Страница с ошибкой обрывается до шаблона, где и выполняются запросы связей:
+    # ее число запросов ничего не показывает, поэтому сравнение не выводится
+    errors = [
+        (path, size, runs[size][path][0])
+        for size in args.sizes for path in PAGES
+        if runs[size][path][0] != 200
+    ]
+    if errors:
+        for path, size, status in errors:
+            print(f"ERROR: {path} returned HTTP {status} with rows={size}", file=sys.stderr)
+        return 1
+
+    print(f"{'page':<20}" + ''.join(f"{f'rows={size}':>10}" for size in args.sizes))
+    failed = False
+    for path in PAGES:
+        counts = [len(runs[size][path][1]) for size in args.sizes]
+        stable = len(set(counts)) == 1
+        print(f"{path:<20}" + ''.join(f"{count:>10}" for count in counts) + ('' if stable else '   <-- differs'))
+
+        if not stable or args.verbose:
+            failed = failed or not stable
+            for size in args.sizes:
+                statements = runs[size][path][1]
+                print(f"  rows={size}:")
+                for statement in statements:
+                    print('    ' + ' '.join(statement.split())[:160])
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Нагрузочный тест приложения под gunicorn: главная страница (dashboard)
+и прием постбэков (/api/conversion/add).
+
+По умолчанию запускает gunicorn на временной SQLite базе с профилем
+gunicorn.conf.py (или с прежними параметрами entrypoint.sh при
+--profile legacy), входит под администратором, созданным init_db.py,
+и измеряет запросы в секунду и перцентили задержки для каждого сценария.
+С параметром --url нагружает уже запущенный сервер.
+
+Примеры:
+    python benchmarks/serve_load.py --requests 3000 --concurrency 32
+    python benchmarks/serve_load.py --profile legacy --output /tmp/legacy.json
+    python benchmarks/serve_load.py --workers 4 --threads 16
+    python benchmarks/serve_load.py --url http://127.0.0.1:8080 --username admin --password admin
+"""
+
+import argparse
+import http.client
+import http.cookiejar
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ingest_load import make_postback, percentile  # noqa: E402
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SCENARIOS = ('dashboard', 'ingest')
+
+# Параметры запуска gunicorn до появления gunicorn.conf.py (для сравнения)
+LEGACY_ARGS = ['--workers', '1', '--threads', '8', '--log-level', 'debug']
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_for_server(base_url, process, timeout=60):
+    """Ожидание, пока сервер начнет отвечать"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {process.returncode}')
+        try:
+            urllib.request.urlopen(base_url + '/auth/login', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.3)
+    raise RuntimeError(f'Server at {base_url} did not start in {timeout}s')
+
+
+def start_server(profile, workers, threads, scratch_dir):
+    """
+    Запуск gunicorn на временной базе
+
+    Returns:
+        tuple: (процесс, базовый URL)
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        DATABASE_URL='sqlite:///' + os.path.join(scratch_dir, 'bench.db'),
+        RESPONSE_CACHE_BACKEND='sqlite',
+        RESPONSE_CACHE_PATH=os.path.join(scratch_dir, 'cache.db'),
+        CONVERSION_ARCHIVE_DIR=os.path.join(scratch_dir, 'archive'),
+        PYTHONUNBUFFERED='1',
+    )
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    if threads:
+        env['GUNICORN_THREADS'] = str(threads)
+
+    # Схема и администратор по умолчанию (admin/admin)
+    subprocess.run([sys.executable, 'init_db.py'], cwd=ROOT_DIR, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    if profile == 'legacy':
+        command = ['gunicorn', '--bind', f'127.0.0.1:{port}', *LEGACY_ARGS, 'run:app']
+    else:
+        command = ['gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'run:app']
+
+    log = open(os.path.join(scratch_dir, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    wait_for_server(base_url, process)
+    return process, base_url
+
+
+def login(base_url, username, password):
+    """
+    Вход через форму (с CSRF токеном)
+
+    Returns:
+        str: Значение заголовка Cookie для запросов от имени пользователя
+    """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+
+    page = opener.open(base_url + '/auth/login').read().decode('utf-8')
+    match = re.search(r'name="csrf_token"[^>]*value="([^"]+)"', page)
+    if not match:
+        raise RuntimeError('CSRF token not found on the login page')
+
+    body = urllib.parse.urlencode({
+        'csrf_token': match.group(1),
+        'username': username,
+        'password': password,
+    }).encode()
+    response = opener.open(base_url + '/auth/login', data=body)
+    if urllib.parse.urlparse(response.geturl()).path.startswith('/auth/'):
+        raise RuntimeError('Login failed (wrong credentials or 2FA enabled)')
+
+    return '; '.join(f'{cookie.name}={cookie.value}' for cookie in jar)
+
+
+class ScenarioClient:
+    """Запросы одного сценария с keep-alive соединением на поток"""
+
+    def __init__(self, base_url, scenario, cookie, timeout=30):
+        parsed = urllib.parse.urlparse(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.scenario = scenario
+        self.cookie = cookie
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self):
+        if self.scenario == 'dashboard':
+            return 'GET', '/', None, {'Cookie': self.cookie}
+        return make_postback('mixed')
+
+    def send(self, _=None):
+        """
+        Один запрос
+
+        Returns:
+            tuple: (задержка в мс, HTTP статус или 0 при сетевой ошибке)
+        """
+        method, path, body, headers = self._request()
+        started = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+                self._local.connection = None
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            status = 0
+        return (time.perf_counter() - started) * 1000, status
+
+
+def run_scenario(base_url, scenario, cookie, requests_count, concurrency, warmup):
+    """
+    Нагрузка одним сценарием
+
+    Returns:
+        dict: Метрики сценария
+    """
+    client = ScenarioClient(base_url, scenario, cookie)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client.send, range(warmup)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client.send, range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    # Редирект на страницу входа для dashboard - тоже ошибка
+    latencies = sorted(latency for latency, status in results if status in (200, 201))
+    errors = {}
+    for _, status in results:
+        if status not in (200, 201):
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    return {
+        'requests': requests_count,
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 0.50), 2),
+        'latency_p90_ms': round(percentile(latencies, 0.90), 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99), 2),
+        'errors': errors,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load test dashboard and ingest under gunicorn')
+    parser.add_argument('--url', help='Already running server (default: start gunicorn on a scratch DB)')
+    parser.add_argument('--profile', choices=('production', 'legacy'), default='production',
+                        help='production: gunicorn.conf.py; legacy: previous entrypoint.sh flags')
+    parser.add_argument('--workers', type=int, help='WEB_CONCURRENCY for the production profile')
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS for the production profile')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--requests', type=int, default=2000, help='Measured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client connections')
+    parser.add_argument('--warmup', type=int, default=100, help='Unmeasured warm-up requests per scenario')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--output', help='Write metrics JSON to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+
+    process = None
+    scratch_dir = None
+    base_url = args.url
+
+    try:
+        if not base_url:
+            scratch_dir = tempfile.mkdtemp(prefix='serve_load_')
+            process, base_url = start_server(args.profile, args.workers, args.threads, scratch_dir)
+
+        cookie = login(base_url, args.username, args.password) if 'dashboard' in scenarios else ''
+
+        metrics = {
+            'profile': 'external' if args.url else args.profile,
+            'workers': args.workers,
+            'threads': args.threads,
+            'cpu_count': os.cpu_count(),
+            'scenarios': {},
+        }
+        for scenario in scenarios:
+            metrics['scenarios'][scenario] = run_scenario(
+                base_url, scenario, cookie, args.requests, args.concurrency, args.warmup
+            )
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    print(json.dumps(metrics, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(metrics, output, indent=2)
+
+    print(f"{'scenario':<12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for scenario, result in metrics['scenarios'].items():
+        print(f"{scenario:<12}{result['throughput_rps']:>10.1f}{result['latency_p50_ms']:>10.2f}"
+              f"{result['latency_p99_ms']:>10.2f}{sum(result['errors'].values()):>8}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,10 +4,87 @@ from dotenv import load_dotenv
 basedir = os.path.abspath(os.path.dirname(__file__))
 load_dotenv(os.path.join(basedir, '.env'))
 
+
+def database_url():
+    """Адрес БД из окружения (по умолчанию - SQLite файл рядом с приложением)"""
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
+    # Fly.io выдает адрес со схемой postgres://, которую SQLAlchemy 2.0 не принимает
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """
+    Параметры пула соединений для адреса БД
+
+    Для PostgreSQL пул есть у каждого процесса (воркера gunicorn и планировщика),
+    поэтому WEB_CONCURRENCY * (DB_POOL_SIZE + DB_MAX_OVERFLOW) + планировщик
+    не должно превышать max_connections сервера. Размер пула по умолчанию
+    покрывает потоки одного gthread воркера.
+    """
+    if not url.startswith('postgresql'):
+        return {}
+
+    connect_args = {
+        'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT') or 10),
+        'application_name': os.environ.get('DB_APPLICATION_NAME') or 'fb-bayers-helper'
+    }
+    statement_timeout = os.environ.get('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout:
+        connect_args['options'] = f'-c statement_timeout={int(statement_timeout)}'
+
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 8),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 4),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 10),
+        # Соединения закрываются раньше, чем их разорвет прокси или сервер по простою
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),
+        # Проверка соединения перед выдачей из пула (после рестарта или failover БД)
+        'pool_pre_ping': True,
+        'connect_args': connect_args
+    }
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
-        'sqlite:///' + os.path.join(basedir, 'app.db')
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAX_THRESHOLDS = 15  # Максимальное количество условий для сетапа
-    LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
\ No newline at end of file
+    LOG_TO_STDOUT = os.environ.get('LOG_TO_STDOUT')
+    
+    # Хранение конверсий: сколько месяцев держать построчно, остальное - в агрегаты и архив
+    CONVERSION_RETENTION_MONTHS = int(os.environ.get('CONVERSION_RETENTION_MONTHS') or 6)
+    CONVERSION_ARCHIVE_DIR = os.environ.get('CONVERSION_ARCHIVE_DIR') or os.path.join(basedir, 'archive')
+    
+    # Фоновые задания (обновление кампаний, проверка токенов) выполняют потоки планировщика;
+    # при BACKGROUND_JOBS=0 задания выполняются сразу в запросе (без запущенного планировщика)
+    BACKGROUND_JOBS = (os.environ.get('BACKGROUND_JOBS') or '1') not in ('0', 'false', 'no')
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS') or 4)
+    CAMPAIGN_REFRESH_JOB_DEADLINE = int(os.environ.get('CAMPAIGN_REFRESH_JOB_DEADLINE') or 300)
+    
+    # Кэш данных страниц: memory (в процессе), sqlite (общий файл для всех воркеров) или null.
+    # С фоновыми заданиями по умолчанию общий файл: задания и проверка токенов выполняются
+    # в процессе планировщика, и сброс кэша в памяти не дошел бы до веб-воркеров
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND') or ('sqlite' if BACKGROUND_JOBS else 'memory')
+    RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH') or os.path.join(basedir, 'cache.db')
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 1024)
+    
+    # Сколько потоков новых конверсий (SSE) держит один процесс: каждый занимает поток gunicorn
+    # на все соединение, остальные потоки остаются для постбэков; сверх лимита - ответ 503
+    CONVERSION_STREAMS_PER_WORKER = int(os.environ.get('CONVERSION_STREAMS_PER_WORKER') or 2)
+    
+    # Фоновая проверка токенов: как часто перепроверять валидный токен (минуты)
+    TOKEN_HEALTH_INTERVAL_MINUTES = int(os.environ.get('TOKEN_HEALTH_INTERVAL_MINUTES') or 60)
+    
+    # Срок обновления списка кампаний (секунды): меньше timeout gunicorn, чтобы вернуть частичный результат
+    CAMPAIGN_REFRESH_DEADLINE = int(os.environ.get('CAMPAIGN_REFRESH_DEADLINE') or 45)
+    
+    # Замеры SQL запросов каждого запроса и задания: счетчики отдаются в заголовке Server-Timing,
+    # в БД сохраняется доля SAMPLE_RATE замеров и все замеры медленнее SLOW_MS (мс)
+    SQL_PROFILER_ENABLED = (os.environ.get('SQL_PROFILER_ENABLED') or '1') not in ('0', 'false', 'no')
+    SQL_PROFILER_SAMPLE_RATE = float(os.environ.get('SQL_PROFILER_SAMPLE_RATE') or 0.05)
+    SQL_PROFILER_SLOW_MS = float(os.environ.get('SQL_PROFILER_SLOW_MS') or 500)
+    SQL_PROFILER_SERVER_TIMING = (os.environ.get('SQL_PROFILER_SERVER_TIMING') or '1') not in ('0', 'false', 'no')
+    SQL_PROFILER_RETENTION_DAYS = int(os.environ.get('SQL_PROFILER_RETENTION_DAYS') or 7)
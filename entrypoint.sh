@@ -3,10 +3,13 @@
 set -e
 
 echo "Starting database initialization..."
-touch /data/app.db
+# Файл нужен только для SQLite (PostgreSQL задается через DATABASE_URL)
+case "$DATABASE_URL" in
+  sqlite*) touch /data/app.db ;;
+esac
 ls -la /data
 
-# Запускаем скрипт для инициализации базы данных
+# Создаем новую базу или обновляем существующую миграциями (flask db upgrade)
 python /app/init_db.py
 
 if [ $? -ne 0 ]; then
@@ -17,12 +20,14 @@ fi
 echo "Database initialization completed successfully."
 echo "Starting scheduler in background..."
 
-# Запускаем планировщик в фоновом режиме
+# Запускаем планировщик в фоновом режиме (задания выполняет только процесс,
+# получивший аренду в БД, остальные экземпляры остаются в резерве)
 python /app/scheduler.py &
 SCHEDULER_PID=$!
 echo "Scheduler started with PID: $SCHEDULER_PID"
 
-echo "Starting gunicorn server with debug logging..."
+echo "Starting gunicorn server..."
 
-# Запускаем приложение с подробным логированием
-exec gunicorn --bind 0.0.0.0:$PORT --workers 1 --log-level debug run:app
+# Запускаем приложение с профилем gunicorn.conf.py (gthread воркеры по числу ядер,
+# потоки нужны, чтобы долгие SSE соединения не блокировали воркер)
+exec gunicorn --config /app/gunicorn.conf.py run:app
@@ -0,0 +1,50 @@
+"""
+Профиль gunicorn для продакшена.
+
+Запуск: gunicorn --config gunicorn.conf.py run:app
+
+Параметры переопределяются переменными окружения:
+    WEB_CONCURRENCY       - число процессов (по умолчанию по числу ядер, не более 8)
+    GUNICORN_THREADS      - потоков в процессе (долгие SSE соединения занимают поток)
+    GUNICORN_KEEPALIVE    - сколько секунд держать простаивающее соединение
+    GUNICORN_LOG_LEVEL    - уровень журнала (info)
+    GUNICORN_ACCESS_LOG   - 1, чтобы писать журнал запросов в stdout
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Потоковые воркеры: запросы в основном ждут БД и Facebook API, а не процессор
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY') or min(multiprocessing.cpu_count(), 8))
+threads = int(os.environ.get('GUNICORN_THREADS') or 8)
+
+# Приложение загружается в мастер-процессе до fork: воркеры стартуют быстрее
+# и разделяют страницы памяти с импортированным кодом
+preload_app = True
+
+# Прокси перед приложением переиспользует соединения: keep-alive дольше
+# типичной паузы между постбэками избавляет от нового соединения на каждый запрос.
+# Простаивающее соединение в gthread ждет в селекторе и не занимает поток
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 20)
+timeout = 60
+graceful_timeout = 30
+
+# Перезапуск воркеров после N запросов ограничивает рост памяти
+max_requests = 5000
+max_requests_jitter = 500
+
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL') or 'info'
+errorlog = '-'
+accesslog = '-' if os.environ.get('GUNICORN_ACCESS_LOG') == '1' else None
+
+
+def post_fork(server, worker):
+    """Соединения, открытые мастером при загрузке приложения, не должны использоваться воркерами"""
+    from app.extensions import db
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        db.engine.dispose(close=False)
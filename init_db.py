@@ -4,30 +4,78 @@
 Может использоваться как самостоятельно, так и в контейнере.
 """
 
+import os
+from alembic.runtime.migration import MigrationContext
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
 from app import create_app, db
 from app.models.user import User
 from app.models.setup import Setup, ThresholdEntry, CampaignSetup
 from app.models.token import FacebookToken, FacebookTokenAccount
-from app.models.conversion import Conversion
+from app.models.conversion import Conversion, ConversionFacet, ConversionHourlyStat
+from app.services.conversion_search import ensure_search_index
+from app.services.conversion_facets import rebuild_facets
+from app.services.conversion_timeseries import rebuild_hourly_stats
+from app.services.entity_counters import reconcile_counters
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Схема баз, созданных до миграций через db.create_all() (без таблицы alembic_version)
+BASELINE_REVISION = '3a5f73a4bc12'
+
+
+def current_revision():
+    """Ревизия, которой помечена база (None - база не помечена)"""
+    with db.engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
 
 def init_db():
     """Инициализирует базу данных, создавая все таблицы."""
     print("Initializing database...")
     app = create_app()
     with app.app_context():
-        db.create_all()
-        print("Database tables created successfully.")
+        if not inspect(db.engine).has_table('users'):
+            # Новая база (SQLite или PostgreSQL) создается по моделям и помечается
+            # последней ревизией, чтобы дальнейшие изменения применялись миграциями
+            db.create_all()
+            stamp(directory=MIGRATIONS_DIR)
+            print(f"New database created and stamped with the latest revision ({db.engine.dialect.name}).")
+        else:
+            # Существующая база обновляется миграциями при каждом запуске: create_all
+            # не добавляет новые столбцы в существующие таблицы. База без пометки
+            # создана прежним init_db (create_all) и соответствует базовой ревизии
+            if current_revision() is None:
+                stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+                print(f"Existing database stamped with the baseline revision {BASELINE_REVISION}.")
+            
+            upgrade(directory=MIGRATIONS_DIR)
+            print(f"Database upgraded to revision {current_revision()} ({db.engine.dialect.name}).")
+        
+        # Поисковый индекс по ref и quid (FTS5, только для SQLite)
+        if ensure_search_index():
+            print("Conversion search index is ready.")
+        
+        # Заполняем справочник фильтров, если он еще пуст
+        if ConversionFacet.query.first() is None and Conversion.query.first() is not None:
+            print(f"Conversion facets rebuilt: {rebuild_facets()} values.")
+        
+        # Заполняем почасовые агрегаты для графиков, если они еще пусты
+        if ConversionHourlyStat.query.first() is None and Conversion.query.first() is not None:
+            print(f"Conversion hourly stats rebuilt: {rebuild_hourly_stats()} rows.")
         
         # Проверяем, есть ли уже пользователи в базе
         if User.query.count() == 0:
             # Создаем администратора по умолчанию
-            admin = User(username='admin', email='admin@example.com')
-            admin.set_password('admin')
+            admin = User(username='admin', email='admin@example.com', password='admin')
             db.session.add(admin)
             db.session.commit()
             print("Default admin user created with credentials: admin/admin")
         else:
             print("Users already exist. Skipping default user creation.")
+        
+        # Точные значения счетчиков записей для админ-панели
+        print(f"Entity counters reconciled: {reconcile_counters()}")
 
 if __name__ == '__main__':
     init_db() 
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""add campaign sync state
+
+Revision ID: a3c4d5e6f712
+Revises: f2b3c4d5e611
+Create Date: 2026-10-20 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c4d5e6f712'
+down_revision = 'f2b3c4d5e611'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('campaign_catalog', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_time', sa.DateTime(), nullable=True))
+
+    op.create_table('campaign_sync_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.String(length=50), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.Column('synced_at', sa.DateTime(), nullable=True),
+    sa.Column('full_synced_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'account_id', name='uq_campaign_sync_state_user_account')
+    )
+
+
+def downgrade():
+    op.drop_table('campaign_sync_state')
+
+    with op.batch_alter_table('campaign_catalog', schema=None) as batch_op:
+        batch_op.drop_column('updated_time')
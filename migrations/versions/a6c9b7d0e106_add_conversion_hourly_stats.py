@@ -0,0 +1,58 @@
+"""add conversion hourly stats
+
+Revision ID: a6c9b7d0e106
+Revises: f5a8b6c9d005
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c9b7d0e106'
+down_revision = 'f5a8b6c9d005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversion_hourly_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.DateTime(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('ref_prefix', sa.String(length=3), nullable=False),
+    sa.Column('form_id', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hour', 'ref_prefix', 'form_id', name='uq_conversion_hourly_stats_key')
+    )
+    with op.batch_alter_table('conversion_hourly_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_conversion_hourly_stats_ref_prefix_hour', ['ref_prefix', 'hour'], unique=False)
+
+    # Первоначальное заполнение по существующим конверсиям
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # Формат совпадает с тем, как SQLAlchemy хранит DateTime в SQLite
+        hour_expr = "strftime('%Y-%m-%d %H:00:00.000000', timestamp)"
+        date_expr = "date(timestamp)"
+    elif dialect == 'postgresql':
+        hour_expr = "date_trunc('hour', timestamp)"
+        date_expr = "CAST(timestamp AS DATE)"
+    else:
+        # Для остальных СУБД агрегаты заполняются init_db.py (rebuild_hourly_stats)
+        return
+
+    op.execute(
+        f"INSERT INTO conversion_hourly_stats (hour, date, ref_prefix, form_id, count) "
+        f"SELECT {hour_expr}, {date_expr}, COALESCE(ref_prefix, ''), COALESCE(form_id, ''), COUNT(id) "
+        f"FROM conversions WHERE timestamp IS NOT NULL "
+        f"GROUP BY {hour_expr}, {date_expr}, COALESCE(ref_prefix, ''), COALESCE(form_id, '')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('conversion_hourly_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversion_hourly_stats_ref_prefix_hour')
+
+    op.drop_table('conversion_hourly_stats')
@@ -24,11 +24,14 @@ def upgrade():
         batch_op.add_column(sa.Column('is_2fa_enabled', sa.Boolean(), nullable=True))
     
     # Устанавливаем значения по умолчанию для существующих записей
-    op.execute("UPDATE users SET is_admin = 0 WHERE is_admin IS NULL")
-    op.execute("UPDATE users SET is_2fa_enabled = 0 WHERE is_2fa_enabled IS NULL")
+    # (через выражения SQLAlchemy: в PostgreSQL boolean нельзя сравнивать с 0/1)
+    users = sa.table('users',
+        sa.column('id', sa.Integer), sa.column('is_admin', sa.Boolean), sa.column('is_2fa_enabled', sa.Boolean))
+    op.execute(users.update().where(users.c.is_admin.is_(None)).values(is_admin=False))
+    op.execute(users.update().where(users.c.is_2fa_enabled.is_(None)).values(is_2fa_enabled=False))
     
     # Установить первого пользователя как администратора
-    op.execute("UPDATE users SET is_admin = 1 WHERE id = 1")
+    op.execute(users.update().where(users.c.id == 1).values(is_admin=True))
     # ### end Alembic commands ###
 
 
@@ -0,0 +1,26 @@
+"""add conversions form_id date index
+
+Revision ID: b1c4d2e5f601
+Revises: 3a5f73a4bc12
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c4d2e5f601'
+down_revision = '3a5f73a4bc12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.create_index('ix_conversions_form_id_date', ['form_id', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversions_form_id_date')
@@ -0,0 +1,41 @@
+"""add sql profile samples
+
+Revision ID: b4d5e6f7a813
+Revises: a3c4d5e6f712
+Create Date: 2026-10-20 01:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d5e6f7a813'
+down_revision = 'a3c4d5e6f712'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sql_profile_samples',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('statements', sa.Integer(), nullable=False),
+    sa.Column('db_ms', sa.Float(), nullable=False),
+    sa.Column('duration_ms', sa.Float(), nullable=True),
+    sa.Column('status', sa.Integer(), nullable=True),
+    sa.Column('slowest', sa.Text(), nullable=True),
+    sa.Column('process', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('sql_profile_samples', schema=None) as batch_op:
+        batch_op.create_index('ix_sql_profile_samples_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sql_profile_samples', schema=None) as batch_op:
+        batch_op.drop_index('ix_sql_profile_samples_created_at')
+
+    op.drop_table('sql_profile_samples')
@@ -0,0 +1,39 @@
+"""add entity counters
+
+Revision ID: b7d0c8e1f207
+Revises: a6c9b7d0e106
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d0c8e1f207'
+down_revision = 'a6c9b7d0e106'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('entity_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+    # Начальные значения по текущему содержимому таблиц
+    for name, table in (('users', 'users'), ('conversions', 'conversions'),
+                        ('setups', 'setups'), ('tokens', 'facebook_tokens')):
+        op.execute(
+            f"INSERT INTO entity_counters (name, value, reconciled_at) "
+            f"SELECT '{name}', COUNT(*), CURRENT_TIMESTAMP FROM {table}"
+        )
+
+
+def downgrade():
+    op.drop_table('entity_counters')
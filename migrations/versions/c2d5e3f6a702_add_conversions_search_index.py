@@ -0,0 +1,48 @@
+"""add conversions search index
+
+Revision ID: c2d5e3f6a702
+Revises: b1c4d2e5f601
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d5e3f6a702'
+down_revision = 'b1c4d2e5f601'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Триграммный индекс FTS5 по ref и quid, синхронизируется триггерами.
+    # Для других СУБД поиск работает в префиксном режиме по обычным индексам.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS conversions_search USING fts5(
+        ref, quid, content='conversions', content_rowid='id', tokenize='trigram'
+    )""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS conversions_search_ai AFTER INSERT ON conversions BEGIN
+        INSERT INTO conversions_search(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS conversions_search_ad AFTER DELETE ON conversions BEGIN
+        INSERT INTO conversions_search(conversions_search, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS conversions_search_au AFTER UPDATE OF ref, quid ON conversions BEGIN
+        INSERT INTO conversions_search(conversions_search, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+        INSERT INTO conversions_search(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""")
+    op.execute("INSERT INTO conversions_search(conversions_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS conversions_search_au")
+    op.execute("DROP TRIGGER IF EXISTS conversions_search_ad")
+    op.execute("DROP TRIGGER IF EXISTS conversions_search_ai")
+    op.execute("DROP TABLE IF EXISTS conversions_search")
@@ -0,0 +1,33 @@
+"""add entity counter high water id
+
+Revision ID: c5e6f7a8b914
+Revises: b4d5e6f7a813
+Create Date: 2026-10-20 02:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e6f7a8b914'
+down_revision = 'b4d5e6f7a813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entity_counters', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('high_water_id', sa.BigInteger(), nullable=True))
+
+    # Счетчик конверсий до этой ревизии обновлялся при каждой вставке и точен:
+    # дальнейший рост оценивается от текущего наибольшего ID
+    op.execute(
+        "UPDATE entity_counters SET high_water_id = (SELECT COALESCE(MAX(id), 0) FROM conversions) "
+        "WHERE name = 'conversions'"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('entity_counters', schema=None) as batch_op:
+        batch_op.drop_column('high_water_id')
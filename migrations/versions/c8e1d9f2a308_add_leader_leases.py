@@ -0,0 +1,33 @@
+"""add leader leases
+
+Revision ID: c8e1d9f2a308
+Revises: b7d0c8e1f207
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e1d9f2a308'
+down_revision = 'b7d0c8e1f207'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('leader_leases',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=255), nullable=False),
+    sa.Column('acquired_at', sa.DateTime(), nullable=True),
+    sa.Column('renewed_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('leader_leases')
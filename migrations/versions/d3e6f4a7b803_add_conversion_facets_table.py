@@ -0,0 +1,40 @@
+"""add conversion facets table
+
+Revision ID: d3e6f4a7b803
+Revises: c2d5e3f6a702
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3e6f4a7b803'
+down_revision = 'c2d5e3f6a702'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversion_facets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('facet', 'value', name='uq_conversion_facets_facet_value')
+    )
+
+    # Первоначальное заполнение справочника по существующим конверсиям
+    for facet in ('ref_prefix', 'form_id'):
+        op.execute(
+            f"INSERT INTO conversion_facets (facet, value, count, last_seen) "
+            f"SELECT '{facet}', {facet}, COUNT(id), MAX(timestamp) FROM conversions "
+            f"WHERE {facet} IS NOT NULL AND {facet} != '' GROUP BY {facet}"
+        )
+
+
+def downgrade():
+    op.drop_table('conversion_facets')
@@ -0,0 +1,29 @@
+"""add token failed checks
+
+Revision ID: d9f0a1b2c409
+Revises: c8e1d9f2a308
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f0a1b2c409'
+down_revision = 'c8e1d9f2a308'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('facebook_tokens', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('failed_checks', sa.Integer(), nullable=True))
+
+    # Существующие токены: счетчик неудачных проверок начинается с нуля, как у новых
+    op.execute("UPDATE facebook_tokens SET failed_checks = 0 WHERE failed_checks IS NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('facebook_tokens', schema=None) as batch_op:
+        batch_op.drop_column('failed_checks')
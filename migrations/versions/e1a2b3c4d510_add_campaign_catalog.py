@@ -0,0 +1,46 @@
+"""add campaign catalog
+
+Revision ID: e1a2b3c4d510
+Revises: d9f0a1b2c409
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a2b3c4d510'
+down_revision = 'd9f0a1b2c409'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('campaign_catalog',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('campaign_id', sa.String(length=50), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=True),
+    sa.Column('status', sa.String(length=30), nullable=True),
+    sa.Column('objective', sa.String(length=50), nullable=True),
+    sa.Column('account_id', sa.String(length=50), nullable=True),
+    sa.Column('account_name', sa.String(length=100), nullable=True),
+    sa.Column('token_id', sa.Integer(), nullable=True),
+    sa.Column('fetched_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['token_id'], ['facebook_tokens.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'campaign_id', name='uq_campaign_catalog_user_campaign')
+    )
+    with op.batch_alter_table('campaign_catalog', schema=None) as batch_op:
+        batch_op.create_index('ix_campaign_catalog_user_status_name', ['user_id', 'status', 'name'], unique=False)
+        batch_op.create_index('ix_campaign_catalog_user_account', ['user_id', 'account_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('campaign_catalog', schema=None) as batch_op:
+        batch_op.drop_index('ix_campaign_catalog_user_account')
+        batch_op.drop_index('ix_campaign_catalog_user_status_name')
+
+    op.drop_table('campaign_catalog')
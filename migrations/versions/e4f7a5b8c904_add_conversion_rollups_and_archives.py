@@ -0,0 +1,48 @@
+"""add conversion rollups and archives
+
+Revision ID: e4f7a5b8c904
+Revises: d3e6f4a7b803
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f7a5b8c904'
+down_revision = 'd3e6f4a7b803'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversion_daily_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('ref_prefix', sa.String(length=3), nullable=True),
+    sa.Column('form_id', sa.String(length=50), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('date', 'ref_prefix', 'form_id', name='uq_conversion_daily_stats_key')
+    )
+    with op.batch_alter_table('conversion_daily_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_conversion_daily_stats_ref_prefix_date', ['ref_prefix', 'date'], unique=False)
+
+    op.create_table('conversion_archives',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('rows_count', sa.Integer(), nullable=True),
+    sa.Column('file_path', sa.String(length=255), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('month')
+    )
+
+
+def downgrade():
+    op.drop_table('conversion_archives')
+    with op.batch_alter_table('conversion_daily_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversion_daily_stats_ref_prefix_date')
+
+    op.drop_table('conversion_daily_stats')
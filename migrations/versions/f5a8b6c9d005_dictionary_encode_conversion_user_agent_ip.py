@@ -0,0 +1,160 @@
+"""dictionary encode conversion user agent and pack ip
+
+Revision ID: f5a8b6c9d005
+Revises: e4f7a5b8c904
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+import hashlib
+import ipaddress
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a8b6c9d005'
+down_revision = 'e4f7a5b8c904'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+# Триггеры поискового индекса пересоздаются после пересборки таблицы в SQLite
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS conversions_search_ai AFTER INSERT ON conversions BEGIN
+        INSERT INTO conversions_search(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversions_search_ad AFTER DELETE ON conversions BEGIN
+        INSERT INTO conversions_search(conversions_search, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversions_search_au AFTER UPDATE OF ref, quid ON conversions BEGIN
+        INSERT INTO conversions_search(conversions_search, rowid, ref, quid) VALUES ('delete', old.id, old.ref, old.quid);
+        INSERT INTO conversions_search(rowid, ref, quid) VALUES (new.id, new.ref, new.quid);
+    END""",
+]
+
+
+def _pack_ip(value):
+    try:
+        return ipaddress.ip_address(value.strip()).packed if value else None
+    except ValueError:
+        return None
+
+
+def _restore_search_triggers(bind):
+    if bind.dialect.name != 'sqlite':
+        return
+    has_index = bind.execute(sa.text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversions_search'"
+    )).first()
+    if has_index:
+        for statement in SEARCH_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    op.create_table('user_agents',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value_hash', sa.String(length=40), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('value_hash')
+    )
+
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ip_packed', sa.LargeBinary(length=16), nullable=True))
+        batch_op.add_column(sa.Column('user_agent_id', sa.Integer(), nullable=True))
+
+    user_agents = sa.table('user_agents',
+        sa.column('id', sa.Integer), sa.column('value_hash', sa.String), sa.column('value', sa.Text))
+    conversions = sa.table('conversions',
+        sa.column('id', sa.Integer), sa.column('ip_address', sa.String), sa.column('user_agent', sa.Text),
+        sa.column('ip_packed', sa.LargeBinary), sa.column('user_agent_id', sa.Integer))
+
+    # Заполняем справочник User-Agent уникальными строками
+    values = [
+        value for (value,) in bind.execute(
+            sa.select(conversions.c.user_agent).where(conversions.c.user_agent != None).distinct()
+        ) if value
+    ]
+    if values:
+        bind.execute(user_agents.insert(), [
+            {'value_hash': hashlib.sha1(value.encode('utf-8')).hexdigest(), 'value': value}
+            for value in values
+        ])
+    ua_ids = {value: ua_id for ua_id, value in bind.execute(
+        sa.select(user_agents.c.id, user_agents.c.value))}
+
+    # Переносим IP и ссылки на User-Agent пачками по id
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(conversions.c.id, conversions.c.ip_address, conversions.c.user_agent)
+            .where(conversions.c.id > last_id)
+            .order_by(conversions.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        bind.execute(
+            conversions.update().where(conversions.c.id == sa.bindparam('row_id')).values(
+                ip_packed=sa.bindparam('packed'), user_agent_id=sa.bindparam('ua_id')),
+            [{'row_id': row_id, 'packed': _pack_ip(ip), 'ua_id': ua_ids.get(ua)}
+             for row_id, ip, ua in rows]
+        )
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_conversions_user_agent_id', 'user_agents', ['user_agent_id'], ['id'])
+        batch_op.drop_column('user_agent')
+        batch_op.drop_column('ip_address')
+
+    _restore_search_triggers(bind)
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('user_agent', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('ip_address', sa.String(length=50), nullable=True))
+
+    op.execute(
+        "UPDATE conversions SET user_agent = "
+        "(SELECT value FROM user_agents WHERE user_agents.id = conversions.user_agent_id)"
+    )
+
+    conversions = sa.table('conversions',
+        sa.column('id', sa.Integer), sa.column('ip_address', sa.String), sa.column('ip_packed', sa.LargeBinary))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(conversions.c.id, conversions.c.ip_packed)
+            .where(conversions.c.id > last_id, conversions.c.ip_packed != None)
+            .order_by(conversions.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        bind.execute(
+            conversions.update().where(conversions.c.id == sa.bindparam('row_id')).values(
+                ip_address=sa.bindparam('ip')),
+            [{'row_id': row_id, 'ip': str(ipaddress.ip_address(bytes(packed)))} for row_id, packed in rows]
+        )
+        last_id = rows[-1][0]
+
+    # В базах, созданных по моделям до появления имени у ключа, он безымянный:
+    # в SQLite его убирает пересборка таблицы при удалении столбца
+    foreign_keys = {fk['name'] for fk in sa.inspect(bind).get_foreign_keys('conversions')}
+    with op.batch_alter_table('conversions', schema=None) as batch_op:
+        if 'fk_conversions_user_agent_id' in foreign_keys:
+            batch_op.drop_constraint('fk_conversions_user_agent_id', type_='foreignkey')
+        batch_op.drop_column('user_agent_id')
+        batch_op.drop_column('ip_packed')
+
+    op.drop_table('user_agents')
+    _restore_search_triggers(bind)
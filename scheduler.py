@@ -9,11 +9,24 @@ from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from flask import Flask
 
 from app import create_app, db
+from app.extensions import response_cache
 from app.models.user import User
 from app.models.setup import Setup, CampaignSetup
-from app.models.token import FacebookToken, FacebookTokenAccount
+from app.models.token import FacebookToken
 from app.services.fb_api_client import FacebookAdClient
 from app.services.ad_monitor import AdMonitor
+from app.services.conversion_counter import ConversionCounter
+from app.services.conversion_facets import rebuild_facets
+from app.services.conversion_timeseries import rebuild_hourly_stats
+from app.services.conversion_retention import apply_retention
+from app.services.eager_loading import campaign_setups_with_setup
+from app.services.entity_counters import reconcile_counters
+from app.services.job_queue import JobWorkerPool, purge_finished_jobs
+from app.services.leader_lock import LeaderLock
+from app.services.response_cache import MemoryCacheBackend
+from app.services.sql_profiler import purge_samples, sql_profiler
+from app.services.token_health import run_token_health_checks
+from app.services.token_router import token_router
 
 app = create_app()
 app.app_context().push()
@@ -32,44 +45,80 @@ logger = logging.getLogger(__name__)
 
 # Настройка планировщика
 jobstores = {
-    'default': SQLAlchemyJobStore(url=app.config['SQLALCHEMY_DATABASE_URI'])
+    # Общий движок приложения: тот же пул и параметры соединений (pre-ping для PostgreSQL)
+    'default': SQLAlchemyJobStore(engine=db.engine)
 }
 
 scheduler = BackgroundScheduler(jobstores=jobstores)
 
-def find_suitable_token(user, campaign_id, account_id=None):
+# Аренда роли планировщика: задания выполняет только один процесс,
+# даже если планировщик запущен на нескольких машинах
+LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEASE_SECONDS') or 60)
+LEASE_RENEW_SECONDS = max(1, LEASE_SECONDS // 4)
+
+leader_lock = LeaderLock('scheduler', lease_seconds=LEASE_SECONDS)
+
+# Исполнители фоновых заданий из интерфейса: работают в каждом процессе
+# планировщика (задание захватывается атомарно, см. job_queue.claim_next)
+job_workers = JobWorkerPool(app, threads=app.config.get('JOB_WORKER_THREADS', 4))
+
+# Сколько токенов пробовать для одной проверки кампании
+MAX_TOKEN_ATTEMPTS = 3
+
+def find_suitable_token(user, campaign_id, account_id=None, exclude=()):
     """
     Находит подходящий токен для работы с кампанией
     
+    Токен выбирается по таблице маршрутов token_router: из валидных
+    токенов пользователя с доступом к аккаунту - наименее загруженный
+    и не получивший ограничение скорости.
+    
     Args:
         user (User): Объект пользователя
         campaign_id (str): ID кампании
         account_id (str, optional): ID рекламного аккаунта
+        exclude (iterable): ID токенов, уже отклоненных при этой проверке
     
     Returns:
         FacebookToken: Объект токена или None, если подходящий токен не найден
     """
     # Если известен ID аккаунта, ищем токены с доступом к нему
-    if account_id:
-        # Находим все токены пользователя, имеющие доступ к этому аккаунту и имеющие статус 'valid'
-        token_accounts = FacebookTokenAccount.query.join(FacebookToken).filter(
-            FacebookTokenAccount.account_id == account_id,
-            FacebookToken.user_id == user.id,
-            FacebookToken.status == 'valid'
-        ).all()
-        
-        # Если нашли подходящие токены, возвращаем первый
-        if token_accounts:
-            return token_accounts[0].token
+    token_id = token_router.select(user.id, account_id, exclude) if account_id else None
     
     # Если аккаунт неизвестен или токены для него не найдены,
-    # вернем любой действующий токен пользователя
-    valid_token = FacebookToken.query.filter_by(
-        user_id=user.id,
-        status='valid'
-    ).first()
+    # берем наименее загруженный токен пользователя
+    if token_id is None:
+        token_id = token_router.select(user.id, None, exclude)
+    
+    if token_id is not None:
+        return db.session.get(FacebookToken, token_id)
+    
+    # Валидный токен без связанных аккаунтов (в таблицу маршрутов не попадает)
+    query = FacebookToken.query.filter_by(user_id=user.id, status='valid')
+    if exclude:
+        query = query.filter(FacebookToken.id.notin_(list(exclude)))
+    return query.first()
+
+def run_campaign_check(fb_client, setup, campaign_setup):
+    """
+    Проверка объявлений кампании одним клиентом FB API
+    
+    Returns:
+        list: Результаты проверки объявлений
+    """
+    # Инициализация монитора с локальными конверсиями
+    monitor = AdMonitor(fb_client, conversion_counter=ConversionCounter())
+    
+    # Установка пороговых значений из сетапа
+    monitor.set_thresholds(setup.get_thresholds_as_list())
     
-    return valid_token
+    # Проверка кампании
+    logger.info(f"Checking campaign {campaign_setup.campaign_id} with setup {setup.name}")
+    return monitor.process_campaign(
+        campaign_id=campaign_setup.campaign_id,
+        date_preset='today',
+        auto_disable=True
+    )
 
 def check_campaign(user_id, campaign_setup_id):
     """
@@ -79,17 +128,18 @@ def check_campaign(user_id, campaign_setup_id):
         user_id (int): ID пользователя
         campaign_setup_id (int): ID настройки кампании
     """
-    with app.app_context():
+    with app.app_context(), sql_profiler.trace('job', 'check_campaign'):
         try:
-            # Получение настроек кампании
-            campaign_setup = CampaignSetup.query.get(campaign_setup_id)
+            # Получение настроек кампании вместе с сетапом и его порогами
+            campaign_setup = campaign_setups_with_setup(
+                CampaignSetup.query.filter_by(id=campaign_setup_id), thresholds=True
+            ).first()
             
             if not campaign_setup or not campaign_setup.is_active:
                 logger.warning(f"CampaignSetup {campaign_setup_id} is inactive or deleted")
                 return
             
-            # Получение сетапа
-            setup = Setup.query.get(campaign_setup.setup_id)
+            setup = campaign_setup.setup
             if not setup or not setup.is_active:
                 logger.warning(f"Setup {campaign_setup.setup_id} is inactive or deleted")
                 return
@@ -110,42 +160,56 @@ def check_campaign(user_id, campaign_setup_id):
             if len(campaign_parts) > 1 and campaign_parts[0] == 'act':
                 account_id = f"act_{campaign_parts[1]}"
             
-            # Находим подходящий токен
-            token = find_suitable_token(user, campaign_id, account_id)
-            
-            # Если не нашли подходящий токен, но есть стандартные настройки
-            if not token and user.fb_access_token:
-                # Инициализация клиента FB API с стандартными настройками
-                fb_client = FacebookAdClient(
-                    access_token=user.fb_access_token,
-                    app_id=user.fb_app_id,
-                    app_secret=user.fb_app_secret,
-                    ad_account_id=user.fb_account_id
+            # Проверка кампании с переключением на другой токен при ограничении скорости
+            # или отклонении токена
+            tried_tokens = []
+            while True:
+                token = find_suitable_token(user, campaign_id, account_id, exclude=tried_tokens)
+                
+                # Если не нашли подходящий токен, но есть стандартные настройки
+                if not token and not tried_tokens and user.fb_access_token:
+                    # Инициализация клиента FB API с стандартными настройками
+                    fb_client = FacebookAdClient(
+                        access_token=user.fb_access_token,
+                        app_id=user.fb_app_id,
+                        app_secret=user.fb_app_secret,
+                        ad_account_id=user.fb_account_id
+                    )
+                    logger.info(f"Using default FB credentials for campaign {campaign_id}")
+                    results = run_campaign_check(fb_client, setup, campaign_setup)
+                    break
+                elif not token and tried_tokens:
+                    # Других токенов нет - остаются результаты последней попытки
+                    logger.warning(f"No other token available for campaign {campaign_id}")
+                    break
+                elif not token:
+                    logger.error(f"No valid token or credentials found for campaign {campaign_id}")
+                    return
+                
+                with token_router.lease(token.id):
+                    # Инициализация клиента FB API с токеном
+                    fb_client = FacebookAdClient(token_obj=token)
+                    if account_id:
+                        fb_client.set_account(account_id)
+                    logger.info(f"Using token '{token.name}' for campaign {campaign_id}")
+                    results = run_campaign_check(fb_client, setup, campaign_setup)
+                
+                outcome = token_router.report(
+                    token.id,
+                    error_codes=fb_client.error_codes,
+                    usage_pct=fb_client.usage_pct,
+                    regain_minutes=fb_client.regain_access_minutes
                 )
-                logger.info(f"Using default FB credentials for campaign {campaign_id}")
-            elif token:
-                # Инициализация клиента FB API с токеном
-                fb_client = FacebookAdClient(token_obj=token)
-                if account_id:
-                    fb_client.set_account(account_id)
-                logger.info(f"Using token '{token.name}' for campaign {campaign_id}")
-            else:
-                logger.error(f"No valid token or credentials found for campaign {campaign_id}")
-                return
-            
-            # Инициализация монитора
-            monitor = AdMonitor(fb_client)
-            
-            # Установка пороговых значений из сетапа
-            monitor.set_thresholds(setup.get_thresholds_as_list())
-            
-            # Проверка кампании
-            logger.info(f"Checking campaign {campaign_setup.campaign_id} with setup {setup.name}")
-            results = monitor.process_campaign(
-                campaign_id=campaign_setup.campaign_id,
-                date_preset='today',
-                auto_disable=True
-            )
+                if outcome == 'auth':
+                    # Токен больше не выбирается, пока проверка не подтвердит его снова
+                    token.update_status('invalid', "Токен отклонен Facebook API при проверке кампании")
+                    db.session.commit()
+                
+                if outcome is None or len(tried_tokens) + 1 >= MAX_TOKEN_ATTEMPTS:
+                    break
+                
+                tried_tokens.append(token.id)
+                logger.warning(f"Token '{token.name}' {outcome} on campaign {campaign_id}, retrying with another token")
             
             # Обновление времени последней проверки
             campaign_setup.last_checked = datetime.utcnow()
@@ -164,13 +228,13 @@ def check_campaign(user_id, campaign_setup_id):
 
 def setup_jobs():
     """Настройка заданий для планировщика"""
-    with app.app_context():
+    with app.app_context(), sql_profiler.trace('job', 'setup_jobs'):
         # Очистка всех существующих заданий
         scheduler.remove_all_jobs()
         
         # Получение всех активных назначений кампаний
-        campaign_setups = (CampaignSetup.query
-                          .join(Setup)
+        # Сетап каждого назначения берется из того же JOIN
+        campaign_setups = (campaign_setups_with_setup(CampaignSetup.query.join(Setup), joined=True)
                           .filter(CampaignSetup.is_active == True)
                           .filter(Setup.is_active == True)
                           .all())
@@ -191,11 +255,51 @@ def setup_jobs():
                        f"interval: {interval} minutes")
 
 
-def main():
-    """Запуск планировщика"""
-    logger.info("Starting scheduler for Facebook Ads Monitor")
-    
-    # Запуск планировщика
+def reconcile_conversion_facets():
+    """Сверка справочника фильтров и почасовых агрегатов с таблицей конверсий"""
+    with app.app_context(), sql_profiler.trace('job', 'reconcile_conversion_facets'):
+        rebuild_facets()
+        rebuild_hourly_stats()
+
+
+def reconcile_entity_counters():
+    """Сверка счетчиков записей админ-панели с таблицами"""
+    with app.app_context(), sql_profiler.trace('job', 'reconcile_entity_counters'):
+        reconcile_counters()
+
+
+def archive_old_conversions():
+    """Перенос конверсий старше срока хранения в архив и агрегаты"""
+    with app.app_context(), sql_profiler.trace('job', 'archive_old_conversions'):
+        archived = apply_retention()
+        if archived:
+            logger.info(f"Archived conversion months: {', '.join(m.strftime('%Y-%m') for m in archived)}")
+
+
+def check_token_health():
+    """Перепроверка токенов, у которых подошел срок (до выбора их для проверки кампаний)"""
+    with app.app_context(), sql_profiler.trace('job', 'check_token_health'):
+        run_token_health_checks()
+
+
+def purge_background_jobs():
+    """Удаление давно завершенных фоновых заданий"""
+    with app.app_context():
+        removed = purge_finished_jobs()
+        if removed:
+            logger.info(f"Removed finished background jobs: {removed}")
+
+
+def purge_sql_profiles():
+    """Удаление замеров SQL старше срока хранения"""
+    with app.app_context():
+        removed = purge_samples(app.config.get('SQL_PROFILER_RETENTION_DAYS', 7))
+        if removed:
+            logger.info(f"Removed SQL profile samples: {removed}")
+
+
+def start_jobs():
+    """Запуск планировщика и системных заданий (после получения роли)"""
     scheduler.start()
     
     # Настройка заданий
@@ -209,12 +313,99 @@ def main():
         replace_existing=True
     )
     
+    # Фоновая проверка токенов: срок каждого токена определяется
+    # временем последней проверки и историей ошибок (см. token_health)
+    scheduler.add_job(
+        check_token_health,
+        trigger=IntervalTrigger(minutes=5),
+        id='check_token_health',
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+    
+    # Ежедневная сверка справочника фильтров и почасовых агрегатов (учитывает удаленные конверсии)
+    scheduler.add_job(
+        reconcile_conversion_facets,
+        trigger=IntervalTrigger(hours=24),
+        id='rebuild_conversion_facets',
+        replace_existing=True
+    )
+    
+    # Ежедневная сверка счетчиков записей админ-панели
+    scheduler.add_job(
+        reconcile_entity_counters,
+        trigger=IntervalTrigger(hours=24),
+        id='reconcile_entity_counters',
+        replace_existing=True
+    )
+    
+    # Ежедневная очистка завершенных фоновых заданий
+    scheduler.add_job(
+        purge_background_jobs,
+        trigger=IntervalTrigger(hours=24),
+        id='purge_background_jobs',
+        replace_existing=True
+    )
+    
+    # Ежедневная очистка замеров SQL
+    scheduler.add_job(
+        purge_sql_profiles,
+        trigger=IntervalTrigger(hours=24),
+        id='purge_sql_profiles',
+        replace_existing=True
+    )
+    
+    # Ежедневная архивация старых конверсий
+    scheduler.add_job(
+        archive_old_conversions,
+        trigger=IntervalTrigger(hours=24),
+        id='archive_old_conversions',
+        replace_existing=True
+    )
+
+
+def main():
+    """Запуск планировщика"""
+    logger.info(f"Starting scheduler for Facebook Ads Monitor ({leader_lock.holder})")
+    
+    started = False
+    paused = False
+    
+    # Задания и проверка токенов сбрасывают кэш страниц из этого процесса
+    if isinstance(response_cache.backend, MemoryCacheBackend):
+        logger.error(
+            "RESPONSE_CACHE_BACKEND=memory: cache invalidations from scheduler jobs do not reach "
+            "web workers, pages stay stale until the cache TTL expires. Use RESPONSE_CACHE_BACKEND=sqlite"
+        )
+    
+    # Фоновые задания выполняются и резервными процессами
+    if app.config.get('BACKGROUND_JOBS', True):
+        job_workers.start()
+    
     try:
-        # Бесконечный цикл для работы планировщика
+        # Процесс без роли остается в резерве и периодически пытается ее получить
         while True:
-            time.sleep(1)
+            if leader_lock.acquire():
+                if not started:
+                    logger.info("Scheduler lease acquired, starting jobs")
+                    start_jobs()
+                    started = True
+                elif paused:
+                    logger.info("Scheduler lease reacquired, resuming jobs")
+                    scheduler.resume()
+                    paused = False
+            elif started and not paused:
+                # Роль перешла к другому процессу - новые запуски заданий прекращаются
+                logger.warning("Scheduler lease lost, pausing jobs")
+                scheduler.pause()
+                paused = True
+            
+            time.sleep(LEASE_RENEW_SECONDS)
     except (KeyboardInterrupt, SystemExit):
-        scheduler.shutdown()
+        if started:
+            scheduler.shutdown()
+        job_workers.stop()
+        leader_lock.release()
         logger.info("Scheduler stopped")
 
 